@@ -0,0 +1,82 @@
+"""add full text search index
+
+Revision ID: 3b9e1c7a5d21
+Revises: f8de40499c4c
+Create Date: 2026-10-17 09:12:41.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e1c7a5d21'
+down_revision = 'f8de40499c4c'
+branch_labels = None
+depends_on = None
+
+# The DDL of fast_api_challenge.database.search_index as of this revision, frozen so that later changes to the module
+# don't change what this revision does
+SEARCHABLE_COLUMNS = ["title", "description", "cast", "director", "listed_in"]
+
+# Postgres: generated tsvector column + GIN index, and pg_trgm GIN indexes for substring filters
+POSTGRES_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE netflix ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(\"title\", '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(\"description\", '')), 'D') || "
+    "setweight(to_tsvector('english', coalesce(\"cast\", '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(\"director\", '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(\"listed_in\", '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_netflix_search_vector ON netflix USING GIN (search_vector)",
+] + [f'CREATE INDEX IF NOT EXISTS ix_netflix_{column_name}_trgm ON netflix USING GIN ("{column_name}" gin_trgm_ops)'
+     for column_name in SEARCHABLE_COLUMNS]
+
+POSTGRES_DOWNGRADE = [f"DROP INDEX IF EXISTS ix_netflix_{column_name}_trgm" for column_name in SEARCHABLE_COLUMNS] + [
+    "DROP INDEX IF EXISTS ix_netflix_search_vector",
+    "ALTER TABLE netflix DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: FTS5 external content table kept in sync with triggers
+SQLITE_COLUMNS = '"title", "description", "cast", "director", "listed_in"'
+SQLITE_OLD_VALUES = 'old."title", old."description", old."cast", old."director", old."listed_in"'
+SQLITE_NEW_VALUES = 'new."title", new."description", new."cast", new."director", new."listed_in"'
+SQLITE_UPGRADE = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS netflix_fts USING fts5({SQLITE_COLUMNS}, content='netflix', "
+    f"content_rowid='show_id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS netflix_fts_after_insert AFTER INSERT ON netflix BEGIN "
+    f"INSERT INTO netflix_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.show_id, {SQLITE_NEW_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS netflix_fts_after_delete AFTER DELETE ON netflix BEGIN "
+    f"INSERT INTO netflix_fts(netflix_fts, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.show_id, {SQLITE_OLD_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS netflix_fts_after_update AFTER UPDATE ON netflix BEGIN "
+    f"INSERT INTO netflix_fts(netflix_fts, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.show_id, {SQLITE_OLD_VALUES}); "
+    f"INSERT INTO netflix_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.show_id, {SQLITE_NEW_VALUES}); END",
+    "INSERT INTO netflix_fts(netflix_fts) VALUES ('rebuild')",  # Index any pre-existing rows
+]
+
+SQLITE_DOWNGRADE = [f"DROP TRIGGER IF EXISTS netflix_fts_after_{event}" for event in ("insert", "delete", "update")] \
+    + ["DROP TABLE IF EXISTS netflix_fts"]
+
+
+def _statements(postgres_statements, sqlite_statements):
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        return postgres_statements
+    if dialect_name == 'sqlite':
+        return sqlite_statements
+    raise NotImplementedError(f"Full-text search is not supported for the '{dialect_name}' database dialect.")
+
+
+def upgrade():
+    statements = _statements(POSTGRES_UPGRADE, SQLITE_UPGRADE)
+    if statements is SQLITE_UPGRADE and sa.inspect(op.get_bind()).has_table('netflix_fts'):
+        return  # The triggers keep an existing index up to date, so there is no need to rebuild it
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in _statements(POSTGRES_DOWNGRADE, SQLITE_DOWNGRADE):
+        op.execute(statement)
@@ -0,0 +1,29 @@
+"""add keyset pagination indexes
+
+Revision ID: 6d2f4a8c0e13
+Revises: 3b9e1c7a5d21
+Create Date: 2026-10-17 10:02:17.884120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f4a8c0e13'
+down_revision = '3b9e1c7a5d21'
+branch_labels = None
+depends_on = None
+
+ORDERABLE_COLUMNS = ["type", "title", "director", "cast", "country", "date_added", "release_year", "rating", "duration",
+                     "listed_in", "description"]
+
+
+def upgrade():
+    for column_name in ORDERABLE_COLUMNS:
+        op.create_index(f'ix_netflix_{column_name}_show_id', 'netflix', [column_name, 'show_id'], unique=False)
+
+
+def downgrade():
+    for column_name in ORDERABLE_COLUMNS:
+        op.drop_index(f'ix_netflix_{column_name}_show_id', table_name='netflix')
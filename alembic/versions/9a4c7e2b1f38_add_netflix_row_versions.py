@@ -0,0 +1,30 @@
+"""add netflix row versions
+
+Revision ID: 9a4c7e2b1f38
+Revises: 6d2f4a8c0e13
+Create Date: 2026-10-17 14:21:45.310562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c7e2b1f38'
+down_revision = '6d2f4a8c0e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('netflix', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    # SQLite cannot add a column with a non-constant default, so existing rows are backfilled separately
+    op.add_column('netflix', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE netflix SET updated_at = CURRENT_TIMESTAMP")
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('netflix', 'updated_at', nullable=False, server_default=sa.func.current_timestamp())
+
+
+def downgrade():
+    op.drop_column('netflix', 'updated_at')
+    op.drop_column('netflix', 'version')
@@ -0,0 +1,100 @@
+"""add normalized show entities
+
+Revision ID: c4e8a1f6b2d9
+Revises: 9a4c7e2b1f38
+Create Date: 2026-10-17 16:05:12.774203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f6b2d9'
+down_revision = '9a4c7e2b1f38'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+ENTITY_TABLES = [('person', 'person_id'), ('country', 'country_id'), ('genre', 'genre_id')]
+# (join table, entity table, entity id, netflix column split into the entities)
+LINK_TABLES = [('netflix_show_director', 'person', 'person_id', 'director'),
+               ('netflix_show_cast', 'person', 'person_id', 'cast'),
+               ('netflix_show_country', 'country', 'country_id', 'country'),
+               ('netflix_show_genre', 'genre', 'genre_id', 'listed_in')]
+
+
+def _split_names(value):
+    """
+    The distinct, stripped, non-empty comma separated names of a column, in their original order. Frozen copy of
+    fast_api_challenge.database.show_entities.split_names as of this revision.
+    """
+    if not value:
+        return []
+    names = (name.strip() for name in value.split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def _backfill():
+    """
+    Split the strings of every existing show into the new tables, BATCH_SIZE shows at a time
+    """
+    connection = op.get_bind()
+    netflix = sa.table('netflix', sa.column('show_id'), *[sa.column(column) for _, _, _, column in LINK_TABLES])
+    entities = {name: sa.table(name, sa.column(entity_id), sa.column('name')) for name, entity_id in ENTITY_TABLES}
+    links = {name: sa.table(name, sa.column('show_id'), sa.column(entity_id)) for name, _, entity_id, _ in LINK_TABLES}
+    entity_ids = {name: {} for name, _ in ENTITY_TABLES}  # Ids of the names inserted so far, by entity table
+
+    last_show_id = 0
+    while True:
+        rows = connection.execute(sa.select(netflix).where(netflix.c.show_id > last_show_id)
+                                  .order_by(netflix.c.show_id).limit(BATCH_SIZE)).mappings().all()
+        if not rows:
+            break
+        last_show_id = rows[-1]['show_id']
+        for link_name, entity_name, entity_id, column in LINK_TABLES:
+            ids = entity_ids[entity_name]
+            names_by_show = {row['show_id']: _split_names(row[column]) for row in rows}
+            new_names = list(dict.fromkeys(name for names in names_by_show.values() for name in names
+                                           if name not in ids))
+            if new_names:
+                connection.execute(entities[entity_name].insert(), [{'name': name} for name in new_names])
+                for start in range(0, len(new_names), 500):
+                    ids.update(connection.execute(
+                        sa.select(entities[entity_name].c.name, entities[entity_name].c[entity_id])
+                        .where(entities[entity_name].c.name.in_(new_names[start:start + 500]))).all())
+            link_rows = [{'show_id': show_id, entity_id: ids[name]}
+                         for show_id, names in names_by_show.items() for name in names]
+            if link_rows:
+                connection.execute(links[link_name].insert(), link_rows)
+
+
+def upgrade():
+    for name, entity_id in ENTITY_TABLES:
+        op.create_table(
+            name,
+            sa.Column(entity_id, sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.PrimaryKeyConstraint(entity_id),
+            sa.UniqueConstraint('name'),
+        )
+    for link_name, entity_name, entity_id, _ in LINK_TABLES:
+        op.create_table(
+            link_name,
+            sa.Column('show_id', sa.Integer(), nullable=False),
+            sa.Column(entity_id, sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['show_id'], ['netflix.show_id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint([entity_id], [f'{entity_name}.{entity_id}']),
+            sa.PrimaryKeyConstraint('show_id', entity_id),
+        )
+        op.create_index(f'ix_{link_name}_{entity_id}_show_id', link_name, [entity_id, 'show_id'], unique=False)
+    _backfill()
+
+
+def downgrade():
+    for link_name, _, entity_id, _ in LINK_TABLES:
+        op.drop_index(f'ix_{link_name}_{entity_id}_show_id', table_name=link_name)
+        op.drop_table(link_name)
+    for name, _ in ENTITY_TABLES:
+        op.drop_table(name)
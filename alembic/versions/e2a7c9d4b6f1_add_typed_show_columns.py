@@ -0,0 +1,96 @@
+"""add typed show columns
+
+Revision ID: e2a7c9d4b6f1
+Revises: c4e8a1f6b2d9
+Create Date: 2026-10-17 18:42:09.518334
+
+"""
+import re
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c9d4b6f1'
+down_revision = 'c4e8a1f6b2d9'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+TYPED_COLUMNS = [('date_added_on', sa.Date()), ('duration_minutes', sa.Integer()), ('seasons', sa.Integer())]
+
+# Copy of the parsing of fast_api_challenge.database.typed_columns when this revision was written
+MAX_INTEGER = 2147483647  # Parsed numbers which don't fit the Integer columns are left NULL
+DATE_ADDED_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d", "%d-%b-%y")
+DURATION_MINUTES_PATTERN = re.compile(r"(\d+)\s*min", re.ASCII | re.IGNORECASE)
+SEASONS_PATTERN = re.compile(r"(\d+)\s*seasons?", re.ASCII | re.IGNORECASE)
+
+
+def _parse_date_added(value):
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for date_format in DATE_ADDED_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_count(pattern, value):
+    if not isinstance(value, str):
+        return None
+    match = pattern.fullmatch(value.strip())
+    if match is None:
+        return None
+    count = int(match.group(1))
+    return count if count <= MAX_INTEGER else None
+
+
+def _typed_values(row):
+    """
+    :return: (dict) The value of each typed column, parsed from the date_added and duration of a show
+    """
+    return {'date_added_on': _parse_date_added(row['date_added']),
+            'duration_minutes': _parse_count(DURATION_MINUTES_PATTERN, row['duration']),
+            'seasons': _parse_count(SEASONS_PATTERN, row['duration'])}
+
+
+def _backfill():
+    """
+    Parse the date_added and duration strings of every existing show into the new columns, BATCH_SIZE shows at a time
+    """
+    connection = op.get_bind()
+    netflix = sa.table('netflix', sa.column('show_id'), sa.column('date_added'), sa.column('duration'),
+                       *[sa.column(name, column_type) for name, column_type in TYPED_COLUMNS])
+    update = netflix.update().where(netflix.c.show_id == sa.bindparam('target_show_id')) \
+        .values({name: sa.bindparam(name) for name, _ in TYPED_COLUMNS})
+
+    last_show_id = 0
+    while True:
+        rows = connection.execute(sa.select(netflix.c.show_id, netflix.c.date_added, netflix.c.duration)
+                                  .where(netflix.c.show_id > last_show_id)
+                                  .order_by(netflix.c.show_id).limit(BATCH_SIZE)).mappings().all()
+        if not rows:
+            break
+        last_show_id = rows[-1]['show_id']
+        connection.execute(update, [{'target_show_id': row['show_id'], **_typed_values(row)} for row in rows])
+
+
+def upgrade():
+    for name, column_type in TYPED_COLUMNS:
+        op.add_column('netflix', sa.Column(name, column_type, nullable=True))
+    _backfill()
+    # Created after the backfill, so that it doesn't have to maintain them
+    for name, _ in TYPED_COLUMNS:
+        op.create_index(f'ix_netflix_{name}_show_id', 'netflix', [name, 'show_id'], unique=False)
+
+
+def downgrade():
+    for name, _ in TYPED_COLUMNS:
+        op.drop_index(f'ix_netflix_{name}_show_id', table_name='netflix')
+        op.drop_column('netflix', name)
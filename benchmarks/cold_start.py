@@ -0,0 +1,97 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+Benchmark of the Api's cold start: each run imports `fast_api_challenge.index` in a new Python process and serves a
+first Search request, then a first request for the OpenAPI schema, against an SQLite database file which is already
+migrated (as after a deployment). Runs are made for each schema startup mode (DB_SCHEMA_STARTUP), and with the OpenAPI
+schema precomputed by write_openapi_schema.py.
+
+Reports the median import and first request times, and the median of each startup phase, then fails if the import
+plus the first Search request take longer than COLD_START_BUDGET_MS in any configuration.
+
+Run from the project root with: python benchmarks/cold_start.py
+"""
+
+REPEAT = 5
+BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "1500"))
+
+# Run in each new process: the startup phases are recorded by `startup.timer` during the import
+CHILD = """
+import json, time
+start = time.perf_counter()
+from fast_api_challenge.index import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from fast_api_challenge import startup
+from fast_api_challenge.auth import create_access_token
+client = TestClient(app)
+headers = {"Authorization": "Bearer " + create_access_token({"sub": "benchmark"}).token}
+request_start = time.perf_counter()
+assert client.get("/shows", headers=headers).status_code == 200
+first_request = time.perf_counter()
+assert client.get("/openapi.json").status_code == 200
+openapi_request = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_request_ms": (first_request - request_start) * 1000,
+                  "openapi_request_ms": (openapi_request - first_request) * 1000,
+                  "phases": startup.timer.describe()["phases"]}))
+"""
+
+CONFIGURATIONS = {
+    "create": {"DB_SCHEMA_STARTUP": "create"},
+    "migrated": {"DB_SCHEMA_STARTUP": "migrated"},
+    "skip": {"DB_SCHEMA_STARTUP": "skip"},
+    "skip, precomputed openapi": {"DB_SCHEMA_STARTUP": "skip", "OPENAPI_SCHEMA_FILE": "{directory}/openapi.json"},
+}
+
+
+def run(args, environment):
+    completed = subprocess.run([sys.executable, *args], cwd=ROOT, env=environment, capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"Failed to run {args[:2]}:\n{completed.stderr}")
+    return completed.stdout.strip().splitlines()[-1] if completed.stdout.strip() else None
+
+
+def prepare_database(directory: str, environment: dict):
+    """
+    Create a migrated database, and the precomputed OpenAPI schema
+    """
+    run(["-c", "from fast_api_challenge.database import base, schema; schema.create_schema(base.engine)"], environment)
+    run(["-m", "alembic", "-c", os.path.join(ROOT, "alembic.ini"), "stamp", "head"], environment)
+    run([os.path.join(ROOT, "write_openapi_schema.py"), os.path.join(directory, "openapi.json")], environment)
+
+
+def main():
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        environment = dict(os.environ, sqlalchemy_database_url=f"sqlite:///{os.path.join(directory, 'netflix.db')}",
+                           auth_issuer_secret_key=os.getenv("auth_issuer_secret_key", "benchmark"),
+                           PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+        prepare_database(directory, environment)
+
+        print(f"{'configuration':<28} {'import ms':>10} {'1st req ms':>11} {'openapi ms':>11}  phases (ms)")
+        for name, configuration in CONFIGURATIONS.items():
+            configuration_environment = dict(environment, **{key: value.format(directory=directory)
+                                                             for key, value in configuration.items()})
+            runs = [json.loads(run(["-c", CHILD], configuration_environment)) for _ in range(REPEAT)]
+            median = {key: statistics.median(result[key] for result in runs)
+                      for key in ("import_ms", "first_request_ms", "openapi_request_ms")}
+            phases = ", ".join(
+                f"{phase['name']} {statistics.median(result['phases'][index]['ms'] for result in runs):.0f}"
+                for index, phase in enumerate(runs[0]["phases"]))
+            print(f"{name:<28} {median['import_ms']:>10.0f} {median['first_request_ms']:>11.0f} "
+                  f"{median['openapi_request_ms']:>11.0f}  {phases}")
+            if median["import_ms"] + median["first_request_ms"] > BUDGET_MS:
+                print(f"  Over the budget of {BUDGET_MS:.0f}ms for the import plus the first request")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
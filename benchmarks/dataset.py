@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hypothesis import HealthCheck, Phase, given, seed, settings, strategies as st
+
+from fast_api_challenge.models import database_models as models
+
+"""
+Reproducible synthetic dataset of Netflix shows, of any size, for benchmarks and load tests.
+
+Show templates are drawn from the `st.builds(NetflixShowModel)` strategy the unit tests use, with realistic strategies
+for its fields (eg. countries and genres from a fixed vocabulary, so that filters and facets select realistic fractions
+of the shows). Each show then takes each of its fields from a randomly chosen template, so that any number of distinct
+shows can be generated quickly. The same rows and seed always generate the same shows.
+
+Run from the project root to write the dataset as NDJSON, which the ingestion CLI can load into any database, eg.
+`python benchmarks/dataset.py 1000000 shows.ndjson && python -m fast_api_challenge.ingestion shows.ndjson`
+"""
+
+NUMBER_OF_TEMPLATES = 500
+SHOW_FIELDS = ("type", "title", "director", "cast", "country", "date_added", "release_year", "rating", "duration",
+               "listed_in", "description")
+
+WORDS = ("love", "war", "night", "city", "secret", "family", "dark", "house", "life", "world", "dream", "king",
+         "girl", "boy", "story", "road", "blood", "heart", "summer", "winter", "island", "game", "hunt", "shadow",
+         "fire", "ocean", "music", "money", "power", "truth", "ghost", "school", "wild", "lost", "last", "first",
+         "killer", "comedy", "wedding", "journey", "mystery", "legend", "planet", "escape", "detective", "chef",
+         "dance", "brothers", "sisters", "friends", "revenge", "miracle", "kingdom", "empire", "street", "river")
+FIRST_NAMES = ("Ana", "Ben", "Carlos", "Dana", "Elif", "Femi", "Grace", "Hiro", "Ines", "Jon", "Kofi", "Lena", "Mei",
+               "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tara", "Umar", "Vera", "Wei", "Ximena", "Yusuf",
+               "Zara")
+LAST_NAMES = ("Adams", "Banerjee", "Chen", "Diaz", "Eze", "Fischer", "Garcia", "Haddad", "Ito", "Jensen", "Kim",
+              "Lopez", "Mensah", "Nakamura", "Okafor", "Patel", "Rossi", "Silva", "Tanaka", "Ueda", "Virtanen",
+              "Wang", "Yilmaz", "Zhou")
+COUNTRIES = ("United States", "India", "United Kingdom", "Japan", "South Korea", "Canada", "Spain", "France",
+             "Mexico", "Egypt", "Turkey", "Nigeria", "Brazil", "Germany", "Australia", "Argentina", "Indonesia",
+             "Philippines", "Italy", "China")
+GENRES = ("Dramas", "Comedies", "Documentaries", "Action & Adventure", "International TV Shows", "Kids' TV",
+          "Thrillers", "Romantic Movies", "Horror Movies", "Stand-Up Comedy", "Crime TV Shows", "Reality TV",
+          "Anime Series", "Music & Musicals", "Sci-Fi & Fantasy", "Independent Movies")
+RATINGS = ("TV-MA", "TV-14", "TV-PG", "R", "PG-13", "TV-Y7", "TV-Y", "PG", "TV-G", "NR", "G")
+
+
+def _words(min_size: int, max_size: int):
+    return st.lists(st.sampled_from(WORDS), min_size=min_size, max_size=max_size).map(" ".join)
+
+
+def _names(strategy, min_size: int, max_size: int):
+    return st.lists(strategy, min_size=min_size, max_size=max_size, unique=True).map(", ".join)
+
+
+PERSON_NAMES = st.builds("{} {}".format, st.sampled_from(FIRST_NAMES), st.sampled_from(LAST_NAMES))
+
+SHOW_STRATEGY = st.builds(
+    models.NetflixShowModel,
+    show_id=st.none(),
+    type=st.sampled_from(("Movie", "TV Show")),
+    title=_words(1, 4).map(str.title),
+    director=st.one_of(st.none(), _names(PERSON_NAMES, 1, 2)),
+    cast=st.one_of(st.none(), _names(PERSON_NAMES, 1, 8)),
+    country=st.one_of(st.none(), _names(st.sampled_from(COUNTRIES), 1, 3)),
+    date_added=st.dates(min_value=date(2008, 1, 1), max_value=date(2021, 12, 31)).map(
+        lambda added: f"{added:%B} {added.day}, {added.year}"),
+    release_year=st.integers(min_value=0, max_value=80).map(lambda age: 2021 - age),  # Mostly recent, like Netflix's
+    rating=st.one_of(st.none(), st.sampled_from(RATINGS)),
+    duration=st.one_of(st.integers(min_value=60, max_value=200).map("{} min".format),
+                       st.integers(min_value=1, max_value=10).map("{} Seasons".format)),
+    listed_in=_names(st.sampled_from(GENRES), 1, 3),
+    description=_words(8, 25).map(str.capitalize),
+)
+
+
+def draw_templates(number_of_templates: int = NUMBER_OF_TEMPLATES, random_seed: int = 0):
+    """
+    :return: (list) Show templates drawn from SHOW_STRATEGY, the same for the same seed
+    """
+    templates = []
+
+    @seed(random_seed)
+    @settings(max_examples=number_of_templates, database=None, deadline=None, phases=[Phase.generate],
+              suppress_health_check=list(HealthCheck))
+    @given(show=SHOW_STRATEGY)
+    def draw(show):
+        templates.append(show)
+
+    draw()
+    return templates
+
+
+def generate_shows(rows: int, random_seed: int = 0, first_show_id: int = 1):
+    """
+    Generate the shows of the dataset lazily, so that datasets larger than the memory can be streamed
+    :param rows: Number of shows
+    :param random_seed: Seed of the dataset
+    :param first_show_id: show_id of the first show, the others being consecutive
+    :return: (generator) NetflixShowModel models
+    """
+    templates = [template.dict() for template in draw_templates(random_seed=random_seed)]
+    rng = random.Random(random_seed)
+    for show_id in range(first_show_id, first_show_id + rows):
+        values = {field: templates[rng.randrange(len(templates))][field] for field in SHOW_FIELDS}
+        yield models.NetflixShowModel.construct(show_id=show_id, **values)  # Already validated by the strategy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a reproducible synthetic dataset of shows as NDJSON.")
+    parser.add_argument("rows", type=int, help="Number of shows")
+    parser.add_argument("path", help="NDJSON file to write")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    with open(args.path, "w") as dataset_file:
+        for show in generate_shows(args.rows, args.seed):
+            dataset_file.write(json.dumps(show.dict()) + "\n")
+
+
+if __name__ == "__main__":
+    main()
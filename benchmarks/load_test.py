@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset
+
+"""
+Load test of every endpoint of the Api, in-process, against a reproducible synthetic dataset (see dataset.py).
+
+The dataset is generated and loaded into the database given by `sqlalchemy_database_url` (by default an SQLite file in
+the temporary directory, which is reused by later runs with the same rows and seed). The Api app is then driven through
+its ASGI interface, without a server or network, by `concurrency` concurrent clients on one event loop, one endpoint
+scenario at a time. Writes use shows outside of the dataset, which are deleted afterwards.
+
+Reports the throughput and latency percentiles of each scenario as JSON, and compares them with the stored baseline:
+the run fails if any request fails, or if a scenario's p95 latency rises (or its throughput drops) by more than the
+tolerance (and by more than `--min-regression-ms`). Each scenario is run `--repeat` times and the best run is kept, to
+reduce noise. Baselines depend on the machine, so write one (--write-baseline) on the machine the comparisons run on.
+
+Run from the project root with: python benchmarks/load_test.py [--rows 100000] [--concurrency 8] [--requests 200]
+"""
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load_test.json")
+COMPARED_CONFIG = ("rows", "seed", "concurrency", "requests", "repeat", "async_database", "dialect")
+WRITES_PER_BULK_REQUEST = 10
+
+# Builds the request_number-th request of a scenario: (method, path, query parameters, body, content type)
+Scenario = namedtuple("Scenario", ["name", "build", "expected_statuses"])
+Scenario.__new__.__defaults__ = ((200, 201),)
+
+
+def configure_environment(args):
+    """
+    Set the Api's configuration before it is imported. Variables which are already set are kept.
+    """
+    default_database = os.path.join(tempfile.gettempdir(), f"netflix_load_test_{args.rows}_{args.seed}.db")
+    os.environ.setdefault("sqlalchemy_database_url", f"sqlite:///{default_database}")
+    os.environ.setdefault("auth_issuer_secret_key", "load-test")
+    os.environ.setdefault("auth_issuer_valid_username", "load-test")
+    # Every read goes to the database, rather than mostly measuring the cache as requests are repeated
+    os.environ.setdefault("RESPONSE_CACHE_TTL_SECONDS", "0")
+
+
+def load_dataset(rows: int, random_seed: int, batch_size: int = 5000):
+    """
+    Load the dataset, unless the database already holds exactly it (as loaded by a previous run)
+    :return: (float) Seconds taken to load it, None if it was reused
+    """
+    from fast_api_challenge import database_interface
+    from fast_api_challenge.database import base
+
+    db = base.DbSession()
+    try:
+        if database_interface.get_number_netflix_shows(db) == rows:
+            return None
+        start = time.perf_counter()
+        batch = []
+        for show in dataset.generate_shows(rows, random_seed):
+            batch.append(show)
+            if len(batch) == batch_size:
+                database_interface.load_netflix_shows(db, batch)
+                batch = []
+                print(f"Loaded {show.show_id} shows", file=sys.stderr)
+        if batch:
+            database_interface.load_netflix_shows(db, batch)
+        return time.perf_counter() - start
+    finally:
+        db.close()
+
+
+def delete_written_shows(rows: int):
+    """
+    Delete the shows written by the scenarios, whose show_id is after the dataset's
+    """
+    from sqlalchemy import select
+    from fast_api_challenge import database_interface
+    from fast_api_challenge.database import base, orm
+
+    db = base.DbSession()
+    try:
+        show_ids = db.execute(select(orm.NetflixShow.show_id).where(orm.NetflixShow.show_id > rows)).scalars().all()
+        database_interface.bulk_delete_netflix_shows(db, show_ids=show_ids, chunk_size=1000)
+    finally:
+        db.close()
+
+
+async def asgi_request(app, method: str, path: str, query: dict = None, body: bytes = b"", content_type: str = None,
+                       authorization: str = None):
+    """
+    Send a request straight to an ASGI app
+    :return: (int, bytes) The response's status code and body
+    """
+    headers = [(b"host", b"load-test"), (b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    if authorization:
+        headers.append((b"authorization", authorization.encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": urlencode(query or {}).encode(),
+             "root_path": "", "headers": headers, "client": ("127.0.0.1", 50000), "server": ("load-test", 80)}
+    request_sent, response_complete = False, asyncio.Event()
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_complete.wait()  # The client only disconnects once the whole response is received
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def _json(value):
+    return json.dumps(value).encode(), "application/json"
+
+
+def _ndjson_upload(shows):
+    """
+    :param shows: Shows, as dicts
+    :return: (bytes, str) Multipart form body uploading the shows as an NDJSON file, and its content type
+    """
+    boundary = "load-test-boundary"
+    lines = "".join(json.dumps(show) + "\n" for show in shows)
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"shows.ndjson\"\r\n"
+            f"Content-Type: application/x-ndjson\r\n\r\n{lines}\r\n--{boundary}--\r\n")
+    return body.encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def scenarios(rows: int, random_seed: int, number_of_requests: int, username: str):
+    """
+    :param number_of_requests: Number of requests each scenario may build, which sizes the ranges of show_ids written
+    :return: (list) The Scenarios, in the order they are run: reads, then the writes, which create shows after the
+             dataset's, then update and delete them
+    """
+    rng = random.Random(random_seed)
+    new_show_id = rows + 1  # show_ids of single writes, then of bulk writes, then of uploads
+    bulk_show_id = new_show_id + number_of_requests
+    upload_show_id = bulk_show_id + number_of_requests * WRITES_PER_BULK_REQUEST
+    written_show = next(dataset.generate_shows(1, random_seed + 1)).dict(exclude={"show_id"})
+
+    def new_shows(first_show_id: int):
+        return [dict(written_show, show_id=show_id) for show_id in range(first_show_id,
+                                                                         first_show_id + WRITES_PER_BULK_REQUEST)]
+
+    def search(**query):
+        return lambda number: ("GET", "/shows", {key: value(number) if callable(value) else value
+                                                 for key, value in query.items()}, b"", None)
+
+    def graphql(query: str, **variables):
+        return lambda number: ("POST", "/graphql", None, *_json({
+            "query": query, "variables": {key: value(number) if callable(value) else value
+                                          for key, value in variables.items()}}))
+
+    country, genre, word = (lambda number: rng.choice(dataset.COUNTRIES), lambda number: rng.choice(dataset.GENRES),
+                            lambda number: rng.choice(dataset.WORDS))
+
+    def date_added(number: int, days: int = 0):  # Days after a date of the dataset, the same for both ends of a window
+        return (date(2008, 1, 1) + timedelta(days=random.Random(random_seed + number).randint(0, 5000) + days)) \
+            .isoformat()
+
+    return [
+        Scenario("token", lambda number: ("POST", "/token", None,
+                                          urlencode({"username": username, "password": "x"}).encode(),
+                                          "application/x-www-form-urlencoded")),
+        Scenario("get_show", lambda number: ("GET", f"/show/{rng.randint(1, rows)}", None, b"", None)),
+        Scenario("search_page", search(limit=20)),
+        Scenario("search_deep_page", search(limit=20, skip=lambda number: rng.randint(0, max(rows - 20, 0)))),
+        Scenario("search_country_ordered", search(country_name=country, orderBy="release_year", sort="desc",
+                                                  limit=20)),
+        Scenario("search_type_year", search(type="Movie", release_year=lambda number: rng.randint(1990, 2021),
+                                            limit=20)),
+        Scenario("search_ranges", search(date_added_from=date_added,
+                                         date_added_to=lambda number: date_added(number, days=90),
+                                         duration_max=100, orderBy="date_added", sort="desc", limit=20)),
+        Scenario("search_substring", search(title=word, limit=20)),
+        Scenario("search_full_text", search(q=word, limit=20)),
+        Scenario("search_facets", search(genre=genre, facets="type,rating,release_year,country,listed_in", limit=20)),
+        Scenario("graphql_search", graphql(
+            "query($filter: ShowSearchFilter) { search(filter: $filter, orderBy: release_year, sort: desc, limit: 20) "
+            "{ shows { show_id title release_year } next_cursor } }",
+            filter=lambda number: {"country_name": country(number), "type": "Movie"})),
+        Scenario("graphql_shows", graphql("query($ids: [Int!]!) { shows(show_ids: $ids) { show_id title rating } }",
+                                          ids=lambda number: [rng.randint(1, rows) for _ in range(20)])),
+        Scenario("export", lambda number: ("GET", "/shows/export", {
+            "format": "ndjson", "country_name": country(number), "genre": genre(number),
+            "release_year": rng.randint(1990, 2021)}, b"", None)),
+        Scenario("summary", lambda number: ("GET", "/summary", None, b"", None)),
+        Scenario("create_show", lambda number: ("POST", "/show/", None,
+                                                *_json(dict(written_show, show_id=new_show_id + number)))),
+        Scenario("update_show", lambda number: ("PUT", f"/show/{new_show_id + number}", None,
+                                                *_json(dict(written_show, title=f"Updated {number}")))),
+        Scenario("delete_show", lambda number: ("DELETE", f"/show/{new_show_id + number}", None, b"", None)),
+        Scenario("bulk_create", lambda number: ("POST", "/shows/bulk", None, *_json(
+            new_shows(bulk_show_id + number * WRITES_PER_BULK_REQUEST)))),
+        Scenario("bulk_update", lambda number: ("PUT", "/shows/bulk", None, *_json(
+            new_shows(bulk_show_id + number * WRITES_PER_BULK_REQUEST)))),
+        Scenario("bulk_delete", lambda number: ("DELETE", "/shows/bulk", None, *_json(
+            list(range(bulk_show_id + number * WRITES_PER_BULK_REQUEST,
+                       bulk_show_id + (number + 1) * WRITES_PER_BULK_REQUEST))))),
+        Scenario("upload", lambda number: ("POST", "/shows/upload", {"format": "ndjson"}, *_ndjson_upload(
+            new_shows(upload_show_id + number * WRITES_PER_BULK_REQUEST)))),
+        Scenario("database_pool", lambda number: ("GET", "/database/pool", None, b"", None)),
+        Scenario("database_replicas", lambda number: ("GET", "/database/replicas", None, b"", None), (200, 404)),
+        Scenario("database_columnar", lambda number: ("GET", "/database/columnar", None, b"", None), (200, 404)),
+        Scenario("database_slow_queries", lambda number: ("GET", "/database/slow-queries", None, b"", None)),
+        Scenario("cache", lambda number: ("GET", "/cache", None, b"", None)),
+        Scenario("auth_status", lambda number: ("GET", "/auth/status", None, b"", None)),
+        Scenario("startup", lambda number: ("GET", "/startup", None, b"", None)),
+        Scenario("metrics", lambda number: ("GET", "/metrics", None, b"", None)),
+    ]
+
+
+async def run_scenario(app, scenario: Scenario, number_of_requests: int, concurrency: int, warmup: int,
+                       authorization: str, first_request_number: int = 0):
+    """
+    Send the scenario's requests with `concurrency` concurrent clients, after `warmup` requests which aren't measured
+    :param first_request_number: Number of the first request to build, so that repeated runs write different shows
+    :return: (dict) Throughput and latency percentiles of the measured requests
+    """
+    for number in range(first_request_number, first_request_number + warmup):
+        await asgi_request(app, *scenario.build(number), authorization=authorization)
+    requests = iter(range(first_request_number + warmup, first_request_number + warmup + number_of_requests))
+    latencies, errors = [], []
+
+    async def client():
+        for number in requests:  # Shared by the clients, so each request is sent once
+            method, path, query, body, content_type = scenario.build(number)
+            start = time.perf_counter()
+            status, content = await asgi_request(app, method, path, query, body, content_type, authorization)
+            latencies.append(time.perf_counter() - start)
+            if status not in scenario.expected_statuses:
+                errors.append(f"{method} {path} returned {status}: {content[:200]!r}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": len(latencies) / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+async def run_scenarios(app, results: dict, args, authorization: str):
+    """
+    Run the selected scenarios one after the other, on one event loop (which the async engine's connections belong to),
+    keeping the best of `repeat` runs of each, as the other runs were slowed down by noise rather than by the Api
+    :param results: Filled with the results of each scenario, by name
+    """
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    requests_per_run = args.warmup + args.requests
+    for scenario in scenarios(args.rows, args.seed, args.repeat * requests_per_run,
+                              os.environ["auth_issuer_valid_username"]):
+        if selected is None or scenario.name in selected:
+            runs = [await run_scenario(app, scenario, args.requests, args.concurrency, args.warmup, authorization,
+                                       first_request_number=run * requests_per_run) for run in range(args.repeat)]
+            failed_runs = [result for result in runs if result["errors"]]  # Reported, so that the run fails
+            results[scenario.name] = failed_runs[0] if failed_runs else min(runs, key=lambda result: result["p95_ms"])
+            print(f"{scenario.name}: {json.dumps(results[scenario.name])}", file=sys.stderr)
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float, min_regression_ms: float):
+    """
+    :return: (list) Descriptions of the regressions, empty if there are none
+    """
+    concurrency = report["config"]["concurrency"]
+    regressions = []
+    for name, result in report["scenarios"].items():
+        if result["errors"]:
+            regressions.append(f"{name}: {result['errors']} failed requests, eg. {result['first_error']}")
+        baseline_result = baseline["scenarios"].get(name)
+        if baseline_result is None:
+            continue
+        p95_ms, baseline_p95_ms = result["p95_ms"], baseline_result["p95_ms"]
+        if p95_ms > baseline_p95_ms * (1 + tolerance) and p95_ms - baseline_p95_ms > min_regression_ms:
+            regressions.append(f"{name}: p95 latency {p95_ms:.1f}ms, baseline {baseline_p95_ms:.1f}ms")
+        # Time per request of the concurrent clients, which rises as the throughput drops
+        request_ms = 1000 * concurrency / result["throughput_rps"]
+        baseline_request_ms = 1000 * concurrency / baseline_result["throughput_rps"]
+        if result["throughput_rps"] < baseline_result["throughput_rps"] * (1 - tolerance) and \
+                request_ms - baseline_request_ms > min_regression_ms:
+            regressions.append(f"{name}: throughput {result['throughput_rps']:.0f}/s, "
+                               f"baseline {baseline_result['throughput_rps']:.0f}/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test every endpoint of the Api, in-process.")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of shows in the dataset")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the dataset and of the requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Number of measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Number of unmeasured requests per scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each scenario, the best is kept")
+    parser.add_argument("--scenarios", help="Comma separated names of the scenarios to run, defaults to all")
+    parser.add_argument("--output", help="File to write the JSON report to, besides the standard output")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="JSON report to compare the results with")
+    parser.add_argument("--write-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Relative rise in p95 latency (or drop in throughput) which fails the run")
+    parser.add_argument("--min-regression-ms", type=float, default=5,
+                        help="Smaller rises in p95 latency (or in time per request) never fail the run")
+    args = parser.parse_args(argv)
+
+    configure_environment(args)
+    from fast_api_challenge.auth import create_access_token
+    from fast_api_challenge.database import base
+    with contextlib.redirect_stdout(sys.stderr):  # Keep the standard output for the report
+        from fast_api_challenge.index import app
+
+    load_seconds = load_dataset(args.rows, args.seed)
+    authorization = "Bearer " + create_access_token({"sub": os.environ["auth_issuer_valid_username"]}).token
+    report = {
+        "config": {"rows": args.rows, "seed": args.seed, "concurrency": args.concurrency, "requests": args.requests,
+                   "repeat": args.repeat, "async_database": base.async_engine is not None, "dialect": base.engine.dialect.name},
+        "dataset": {"reused": load_seconds is None, "load_seconds": load_seconds},
+        "scenarios": {},
+    }
+    try:
+        asyncio.run(run_scenarios(app, report["scenarios"], args, authorization))
+    finally:
+        delete_written_shows(args.rows)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, write one with --write-baseline", file=sys.stderr)
+        sys.exit(1 if any(result["errors"] for result in report["scenarios"].values()) else 0)
+    with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    differences = [key for key in COMPARED_CONFIG if baseline["config"].get(key) != report["config"].get(key)]
+    if differences:
+        print(f"REGRESSION CHECK FAILED: the baseline was run with a different {', '.join(differences)} "
+              f"({ {key: baseline['config'].get(key) for key in differences} })", file=sys.stderr)
+        sys.exit(2)
+    regressions = compare_with_baseline(report, baseline, args.tolerance, args.min_regression_ms)
+    if regressions:
+        print(f"REGRESSION CHECK FAILED ({len(regressions)} regressions, tolerance {args.tolerance:.0%}):",
+              file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        sys.exit(1)
+    print(f"No regressions against the baseline (tolerance {args.tolerance:.0%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
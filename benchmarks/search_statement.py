@@ -0,0 +1,74 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("sqlalchemy_database_url", "sqlite://")  # Read when the database modules are imported
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from fast_api_challenge import database_interface, pagination
+from fast_api_challenge.database import orm, search_index
+from fast_api_challenge.models import api_enums, database_models as models
+
+"""
+Microbenchmark of the per-request Python overhead of `database_interface.search_netflix_show`: building the search
+statement, looking it up in SQLAlchemy's compiled statement cache, and executing it against a small in-memory SQLite
+table, so that the time measured is dominated by Python rather than by the database.
+
+Run from the project root with: python benchmarks/search_statement.py
+"""
+
+NUMBER_OF_SHOWS = 1000
+REPEAT = 5
+NUMBER = 2000
+
+
+def create_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    orm.Base.metadata.create_all(bind=engine)
+    search_index.create_search_index(engine)
+    db = sessionmaker(bind=engine)()
+    database_interface.bulk_create_netflix_shows(db, chunk_size=NUMBER_OF_SHOWS, shows=[
+        models.NetflixShowModel(show_id=show_id, title=f"Show {show_id}", type=("Movie", "TV Show")[show_id % 2],
+                                cast=f"Actor {show_id % 50}, Actor {show_id % 7}", country="India",
+                                release_year=1990 + show_id % 30, description=f"A story about number {show_id}")
+        for show_id in range(1, NUMBER_OF_SHOWS + 1)])
+    return db
+
+
+def scenarios(db):
+    order_by_title = api_enums.SearchOrderByEnum("title")
+    first_page = database_interface.search_netflix_show(db, filter_args=models.NetflixShowSearchModel(type="Movie"),
+                                                        limit=10, orderBy=order_by_title)
+    cursor = pagination.decode_cursor(pagination.encode_cursor(first_page[-1], orderBy=order_by_title))
+    return {
+        "no filters, limit 10": dict(filter_args=models.NetflixShowSearchModel(), limit=10),
+        "2 filters, orderBy title, limit 10": dict(filter_args=models.NetflixShowSearchModel(type="Movie",
+                                                                                             title="Show 1"),
+                                                   orderBy=order_by_title, limit=10),
+        "filter, cursor page, limit 10": dict(filter_args=models.NetflixShowSearchModel(type="Movie"),
+                                              orderBy=order_by_title, cursor=cursor, limit=10),
+        "exact-match filter, skip 5, limit 10": dict(
+            filter_args=models.NetflixShowSearchModel(cast_member="Actor 3"), skip=5, limit=10),
+        "full-text q, limit 10": dict(filter_args=models.NetflixShowSearchModel(), q="story number", limit=10),
+    }
+
+
+def main():
+    db = create_database()
+    print(f"{'scenario':<40} {'us/request':>12}")
+    for name, search_kwargs in scenarios(db).items():
+        def search():
+            database_interface.search_netflix_show(db, **search_kwargs)
+
+        search()  # Warm up SQLAlchemy's compiled statement cache
+        best = min(timeit.repeat(search, repeat=REPEAT, number=NUMBER)) / NUMBER
+        print(f"{name:<40} {best * 1e6:>12.1f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
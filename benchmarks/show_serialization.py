@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import timeit
+import tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("sqlalchemy_database_url", "sqlite://")  # Read when the database modules are imported
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from fast_api_challenge import database_interface, serialization
+from fast_api_challenge.database import orm
+from fast_api_challenge.models import database_models as models
+
+"""
+Benchmark of serializing a page of search results, comparing the two ways the Search endpoint has built its response:
+- ORM: load NetflixShow ORM objects, convert them with `NetflixShowVersionModel.from_orm`, let FastAPI validate them
+  against the List[NetflixShowModel] response_model and encode them, then render them with json
+- Rows: fetch plain rows with `search_netflix_show_rows` and render them with orjson, as the endpoint now does
+
+Reports the best time of each, and the peak memory allocated (measured with tracemalloc in a separate run, as it slows
+down allocations). Both paths read from the database every time, as the search cache is invalidated before each run.
+
+Run from the project root with: python benchmarks/show_serialization.py
+"""
+
+NUMBER_OF_SHOWS = 10000
+REPEAT = 5
+
+RESPONSE_FIELD = create_response_field(name="Response_get_shows", type_=List[models.NetflixShowModel])
+
+
+def create_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    orm.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    database_interface.bulk_create_netflix_shows(db, chunk_size=1000, shows=[
+        models.NetflixShowModel(show_id=show_id, title=f"Show {show_id}", type=("Movie", "TV Show")[show_id % 2],
+                                director=f"Director {show_id % 100}", cast=f"Actor {show_id % 50}, Actor {show_id % 7}",
+                                country="India", rating="TV-MA", duration="90 min", listed_in="Dramas",
+                                release_year=1990 + show_id % 30, date_added="January 1, 2020",
+                                description=f"A story about number {show_id}")
+        for show_id in range(1, NUMBER_OF_SHOWS + 1)])
+    return db
+
+
+def orm_response(db):
+    shows = database_interface.search_netflix_show(db, filter_args=models.NetflixShowSearchModel())
+    shows = [models.NetflixShowVersionModel.from_orm(show) for show in shows]
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=shows))
+    db.expunge_all()  # Don't keep the loaded objects in the identity map between runs
+    return JSONResponse(content).body
+
+
+def rows_response(db):
+    rows = database_interface.search_netflix_show_rows(db, filter_args=models.NetflixShowSearchModel())
+    return ORJSONResponse(serialization.shows_content(rows)).body
+
+
+def main():
+    db = create_database()
+    print(f"{'path':<8} {'ms/response':>12} {'peak MiB':>10} {'bytes':>10}")
+    for name, build_response in (("ORM", orm_response), ("Rows", rows_response)):
+        def run():
+            database_interface.invalidate_netflix_caches()
+            return build_response(db)
+
+        body = run()  # Warm up SQLAlchemy's compiled statement cache
+        best = min(timeit.repeat(run, repeat=REPEAT, number=1))
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<8} {best * 1e3:>12.1f} {peak / 2 ** 20:>10.1f} {len(body):>10}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import asyncio
+import collections
+import hashlib
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from fast_api_challenge import metrics
+from fast_api_challenge.auth import InvalidTokenError, verify_access_token
+from fast_api_challenge.database.show_entities import EXACT_MATCH_FILTERS
+from fast_api_challenge.database.typed_columns import RANGE_FILTERS
+from fast_api_challenge.models.database_models import NetflixShowSearchModel
+
+"""
+Admission control: sheds the requests a worker can't serve soon, rather than queueing them until gunicorn's timeout.
+
+Every request is charged to a token bucket of its bearer token's subject (or of its client's address, when it has no
+valid token, eg. for /token), and is answered 429 once the bucket is empty. The buckets can be kept in memory shared by the workers of an Api node, so that
+the limits apply to the node rather than to each worker.
+
+Requests to the routes which use the database are also capped per worker (see `ROUTE_COSTS`). Requests beyond the cap
+wait briefly for a slot, and are answered 503 if none frees up. Expensive requests may only take part of the slots, and
+cheap ones are admitted first, so that reading a show stays fast while searches and summaries are shed.
+"""
+
+CHEAP = "cheap"
+EXPENSIVE = "expensive"
+
+# Cost of the requests to the routes which use the database, by method and path template. Other routes aren't capped.
+ROUTE_COSTS = {
+    ("GET", "/show/{show_id}"): CHEAP,
+    ("POST", "/show/"): CHEAP,
+    ("PUT", "/show/{show_id}"): CHEAP,
+    ("DELETE", "/show/{show_id}"): CHEAP,
+    ("GET", "/shows"): CHEAP,  # Unless its parameters make it expensive, see `request_cost`
+    ("GET", "/shows/export"): EXPENSIVE,
+    ("POST", "/shows/bulk"): EXPENSIVE,
+    ("PUT", "/shows/bulk"): EXPENSIVE,
+    ("DELETE", "/shows/bulk"): EXPENSIVE,
+    ("POST", "/shows/upload"): EXPENSIVE,
+    ("GET", "/summary"): EXPENSIVE,
+    ("POST", "/graphql"): EXPENSIVE,
+}
+
+# Search filters matched with LIKE, which scan the table. Searches with this many of them, a full-text query or facets
+# are expensive.
+LIKE_FILTERS = set(NetflixShowSearchModel.__fields__) - set(EXACT_MATCH_FILTERS) - set(RANGE_FILTERS)
+EXPENSIVE_LIKE_FILTERS = 2
+
+EXPENSIVE_REQUEST_TOKENS = 5  # Taken from the token bucket by expensive requests, and 1 by the others
+EXPENSIVE_CONCURRENCY_SHARE = 0.5  # Share of the capped requests in flight which may be expensive
+QUEUED_PER_SLOT = 4  # Max requests waiting per slot, further ones are rejected without waiting
+HOLD_SMOOTHING = 0.1  # Weight of each request in the moving average of the seconds a slot is held
+RATE_LIMIT_MAX_KEYS = 10000  # Max number of buckets kept per worker by the in-memory store, evicting the least recent
+
+ADMITTED = "admitted"  # Outcomes of requests: admitted without waiting
+QUEUED = "queued"  # Admitted after waiting for a slot
+RATE_LIMITED = "rate_limited"  # Answered 429
+OVERLOADED = "overloaded"  # Answered 503, as no slot freed up in time
+
+# Key of the (token, claims) of the request's verified bearer token in its ASGI scope, so it isn't verified again
+VERIFIED_TOKEN_SCOPE_KEY = "admission.verified_token"
+
+
+def request_cost(method: str, route_path: str, query_string: bytes = b"") -> Optional[str]:
+    """
+    :param method: HTTP method of the request
+    :param route_path: Path template of the request's route, eg. `/show/{show_id}`
+    :param query_string: Raw query string of the request
+    :return: (str) CHEAP or EXPENSIVE, or None if the route doesn't use the database
+    """
+    cost = ROUTE_COSTS.get((method, route_path))
+    if cost != CHEAP or route_path != "/shows":
+        return cost
+    parameters = {key: value for key, value in parse_qsl(query_string.decode("latin-1")) if value}
+    if "q" in parameters or "facets" in parameters \
+            or len(LIKE_FILTERS.intersection(parameters)) >= EXPENSIVE_LIKE_FILTERS:
+        return EXPENSIVE
+    return CHEAP
+
+
+def verified_claims(scope) -> Optional[dict]:
+    """
+    :param scope: ASGI scope of an HTTP request
+    :return: (dict) Claims of the request's bearer token, or None if it has none, or it is invalid or expired
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                claims = verify_access_token(token)
+            except InvalidTokenError:
+                return None
+            scope[VERIFIED_TOKEN_SCOPE_KEY] = token, claims
+            return claims
+    return None
+
+
+def client_key(scope, claims: Optional[dict]) -> str:
+    """
+    :param scope: ASGI scope of an HTTP request
+    :param claims: Claims of the request's verified bearer token, see `verified_claims`
+    :return: (str) Key of the request's token bucket: a digest of its token's subject, or else its client's address,
+             so that sending a new (unverified) token with each request doesn't get a new bucket
+    """
+    if claims is not None:
+        subject = json.dumps(claims.get("sub"), sort_keys=True, default=str)
+        return "subject:" + hashlib.blake2b(subject.encode("utf-8"), digest_size=16).hexdigest()
+    client = scope.get("client")
+    return f"client:{client[0] if client else ''}"
+
+
+def _take_tokens(tokens: float, updated_at: float, rate: float, burst: float, amount: float, now: float):
+    """
+    Refill a token bucket for the time elapsed since it was updated, and take tokens from it if it has enough
+    :param tokens: Tokens in the bucket when it was updated
+    :param updated_at: Monotonic time of the update, 0 if the bucket is new (and full)
+    :param rate: Tokens added per second
+    :param burst: Capacity of the bucket
+    :param amount: Tokens to take
+    :param now: Monotonic time of the request
+    :return: (tuple) The bucket's tokens and update time, and 0 if the tokens were taken, otherwise the seconds until
+             the bucket has enough
+    """
+    tokens = burst if updated_at == 0 else min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= amount:
+        return tokens - amount, now, 0.0
+    return tokens, now, (amount - tokens) / rate
+
+
+class RateLimitStore:
+    """
+    Interface of the stores of token buckets. A store shared by processes (eg. one backed by Redis, with the refill
+    done atomically by a script) makes the limits apply to all of them.
+    """
+
+    def take(self, key: str, rate: float, burst: float, amount: float, now: float) -> float:
+        """
+        Atomically refill the bucket of a key, and take tokens from it if it has enough
+        :return: (float) 0 if the tokens were taken, otherwise the seconds until the bucket has enough
+        """
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Token buckets of a single process, keeping those of the `max_entries` most recently seen keys
+    """
+
+    def __init__(self, max_entries: int = RATE_LIMIT_MAX_KEYS):
+        self.max_entries = max_entries
+        self._buckets = collections.OrderedDict()  # (tokens, updated_at) by key, least recently used first
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, amount: float, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (0.0, 0.0))
+            tokens, updated_at, wait_seconds = _take_tokens(tokens, updated_at, rate, burst, amount, now)
+            self._buckets[key] = tokens, updated_at
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return wait_seconds
+
+    def describe(self) -> str:
+        return "memory"
+
+
+class SharedMemoryRateLimitStore(RateLimitStore):
+    """
+    Token buckets in a memory mapped file, shared with the processes forked after it was created (eg. gunicorn's
+    workers, when the app is preloaded). Keys are hashed into a fixed number of slots, each locked with a POSIX record
+    lock while it is updated. Keys which share a slot share a bucket, which is only ever stricter.
+    """
+
+    SLOT = struct.Struct("dd")  # Tokens, and monotonic time of their update
+
+    def __init__(self, slots: int):
+        import fcntl
+        import mmap
+        self._fcntl = fcntl
+        self.slots = slots
+        self._file = tempfile.TemporaryFile(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self._file.truncate(slots * self.SLOT.size)
+        self._memory = mmap.mmap(self._file.fileno(), slots * self.SLOT.size)
+        self._lock = threading.Lock()  # Record locks don't exclude the threads of the process holding them
+
+    def take(self, key: str, rate: float, burst: float, amount: float, now: float) -> float:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        offset = int.from_bytes(digest, "big") % self.slots * self.SLOT.size
+        with self._lock:
+            self._fcntl.lockf(self._file.fileno(), self._fcntl.LOCK_EX, self.SLOT.size, offset)
+            try:
+                tokens, updated_at = self.SLOT.unpack_from(self._memory, offset)
+                tokens, updated_at, wait_seconds = _take_tokens(tokens, updated_at, rate, burst, amount, now)
+                self.SLOT.pack_into(self._memory, offset, tokens, updated_at)
+            finally:
+                self._fcntl.lockf(self._file.fileno(), self._fcntl.LOCK_UN, self.SLOT.size, offset)
+        return wait_seconds
+
+    def describe(self) -> str:
+        return "shared_memory"
+
+
+class RateLimiter:
+    """
+    Token bucket limits of the requests of each key
+    """
+
+    def __init__(self, per_second: float, burst: float, store: RateLimitStore, clock=time.monotonic):
+        self.per_second = per_second
+        self.burst = burst
+        self.store = store
+        self._clock = clock  # Monotonic, and shared by the processes sharing the store
+
+    def take(self, key: str, cost: Optional[str]) -> float:
+        """
+        :param key: Key of the request's bucket, see `client_key`
+        :param cost: Cost of the request, see `request_cost`
+        :return: (float) 0 if the request is within the limit, otherwise the seconds until it would be
+        """
+        amount = min(EXPENSIVE_REQUEST_TOKENS if cost == EXPENSIVE else 1, self.burst)
+        return self.store.take(key, self.per_second, self.burst, amount, self._clock())
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the requests in flight, letting only some of them be expensive. Requests beyond the cap wait in a queue per
+    cost for up to `queue_timeout_seconds`, cheap ones being admitted first. Rejected requests are told to retry once
+    the requests ahead of them should have been served, going by how long slots are held, and no sooner than
+    `min_retry_after_seconds`. Only used from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, max_concurrency: int, queue_timeout_seconds: float, max_queued: int = None,
+                 min_retry_after_seconds: float = 0):
+        self.max_concurrency = max_concurrency
+        self.max_expensive = max(1, int(max_concurrency * EXPENSIVE_CONCURRENCY_SHARE))
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.max_queued = max_concurrency * QUEUED_PER_SLOT if max_queued is None else max_queued
+        self.min_retry_after_seconds = min_retry_after_seconds
+        self.mean_hold_seconds = None  # Moving average of the seconds a slot is held, None until one is released
+        self.in_flight = {CHEAP: 0, EXPENSIVE: 0}
+        self._waiters = {CHEAP: collections.deque(), EXPENSIVE: collections.deque()}
+
+    def _has_slot(self, cost: str) -> bool:
+        if sum(self.in_flight.values()) >= self.max_concurrency:
+            return False
+        return cost == CHEAP or self.in_flight[EXPENSIVE] < self.max_expensive
+
+    def queued(self) -> int:
+        return len(self._waiters[CHEAP]) + len(self._waiters[EXPENSIVE])
+
+    def retry_after_seconds(self) -> float:
+        """
+        :return: (float) Seconds after which a rejected request should be retried: the time the slots take to turn over
+                 the requests in flight and queued, and at least `min_retry_after_seconds` and the queue timeout
+        """
+        backlog = sum(self.in_flight.values()) + self.queued()
+        turnover_seconds = (self.mean_hold_seconds or 0) * backlog / self.max_concurrency
+        return max(self.min_retry_after_seconds, self.queue_timeout_seconds, turnover_seconds)
+
+    async def acquire(self, cost: str) -> Optional[str]:
+        """
+        :param cost: CHEAP or EXPENSIVE
+        :return: (str) ADMITTED or QUEUED once the request holds a slot, which it must `release`, or None if it was
+                 rejected
+        """
+        # Waiting cheap requests come first, and waiting requests of the same cost before this one
+        if self._has_slot(cost) and not self._waiters[CHEAP] and not self._waiters[cost]:
+            self.in_flight[cost] += 1
+            return ADMITTED
+        if self.queued() >= self.max_queued or self.queue_timeout_seconds <= 0:
+            return None
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters[cost].append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return QUEUED  # Was handed a slot as it timed out
+            return None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(cost)  # Was handed a slot as it was cancelled
+            raise
+        finally:
+            if waiter in self._waiters[cost]:
+                self._waiters[cost].remove(waiter)
+        return QUEUED
+
+    def release(self, cost: str, held_seconds: float = None):
+        """
+        :param cost: CHEAP or EXPENSIVE, as acquired
+        :param held_seconds: How long the slot was held, to estimate when rejected requests should retry
+        """
+        if held_seconds is not None:
+            self.mean_hold_seconds = held_seconds if self.mean_hold_seconds is None else \
+                self.mean_hold_seconds + HOLD_SMOOTHING * (held_seconds - self.mean_hold_seconds)
+        self.in_flight[cost] -= 1
+        for waiting_cost in (CHEAP, EXPENSIVE):
+            waiters = self._waiters[waiting_cost]
+            while waiters and self._has_slot(waiting_cost):
+                waiter = waiters.popleft()
+                if not waiter.done():  # Otherwise it timed out
+                    self.in_flight[waiting_cost] += 1  # Handed over to the waiter
+                    waiter.set_result(None)
+            if waiters:
+                return  # Expensive requests wait for the cheap ones
+
+
+class AdmissionController:
+    """
+    Decides which requests are served, rate limiting them and capping those which use the database. Either may be None
+    to disable it.
+    """
+
+    def __init__(self, rate_limiter: Optional[RateLimiter], concurrency_limiter: Optional[ConcurrencyLimiter]):
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.outcomes = {outcome: {CHEAP: 0, EXPENSIVE: 0} for outcome in (ADMITTED, QUEUED, RATE_LIMITED, OVERLOADED)}
+
+    def enabled(self) -> bool:
+        return self.rate_limiter is not None or self.concurrency_limiter is not None
+
+    def record(self, outcome: str, cost: Optional[str]):
+        cost = cost or CHEAP  # Routes which don't use the database are only rate limited, as cheap requests
+        self.outcomes[outcome][cost] += 1
+        metrics.admission_decisions.inc(cost, outcome)
+
+    def describe(self):
+        """
+        :return: (dict) The limits, requests in flight and outcome counts, matching the fields of
+                 `api_models.AdmissionStatusModel`
+        """
+        rate_limiter, concurrency_limiter = self.rate_limiter, self.concurrency_limiter
+        return {
+            "rate_limit_per_second": rate_limiter.per_second if rate_limiter else None,
+            "rate_limit_burst": rate_limiter.burst if rate_limiter else None,
+            "rate_limit_store": rate_limiter.store.describe() if rate_limiter else None,
+            "max_concurrency": concurrency_limiter.max_concurrency if concurrency_limiter else None,
+            "max_expensive_concurrency": concurrency_limiter.max_expensive if concurrency_limiter else None,
+            "queue_timeout_seconds": concurrency_limiter.queue_timeout_seconds if concurrency_limiter else None,
+            "min_retry_after_seconds": concurrency_limiter.min_retry_after_seconds if concurrency_limiter else None,
+            "mean_slot_seconds": concurrency_limiter.mean_hold_seconds if concurrency_limiter else None,
+            "in_flight": dict(concurrency_limiter.in_flight) if concurrency_limiter else {CHEAP: 0, EXPENSIVE: 0},
+            "queued": concurrency_limiter.queued() if concurrency_limiter else 0,
+            "outcomes": {outcome: dict(counts) for outcome, counts in self.outcomes.items()},
+        }
+
+
+def _retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware admitting requests through an `AdmissionController`, answering 429 to those over their rate limit
+    and 503 to those which couldn't get a slot, both with a Retry-After header
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    @staticmethod
+    def _match_route(scope):
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def _reject(self, scope, receive, send, route, status_code: int, detail: str, retry_after_seconds: float):
+        scope["endpoint"] = route.endpoint  # For the route label of the request metrics, as it won't be routed
+        response = JSONResponse({"detail": detail}, status_code=status_code,
+                                headers={"Retry-After": _retry_after(retry_after_seconds)})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        route = self._match_route(scope) if scope["type"] == "http" and self.controller.enabled() else None
+        if route is None or not hasattr(route, "endpoint"):
+            await self.app(scope, receive, send)  # Including 404s and 405s, which the router answers cheaply
+            return
+        cost = request_cost(scope["method"], route.path, scope.get("query_string", b""))
+
+        claims = verified_claims(scope)
+        rate_limiter = self.controller.rate_limiter
+        if rate_limiter is not None:
+            wait_seconds = rate_limiter.take(client_key(scope, claims), cost)
+            if wait_seconds > 0:
+                self.controller.record(RATE_LIMITED, cost)
+                await self._reject(scope, receive, send, route, 429, "Rate limit exceeded.", wait_seconds)
+                return
+
+        concurrency_limiter = self.controller.concurrency_limiter
+        # Requests without a valid token don't take a slot, as they're answered 401 before using the database
+        if cost is None or concurrency_limiter is None or claims is None:
+            self.controller.record(ADMITTED, cost)
+            await self.app(scope, receive, send)
+            return
+        outcome = await concurrency_limiter.acquire(cost)
+        if outcome is None:
+            self.controller.record(OVERLOADED, cost)
+            await self._reject(scope, receive, send, route, 503, "The Api is overloaded, retry later.",
+                               concurrency_limiter.retry_after_seconds())
+            return
+        self.controller.record(outcome, cost)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limiter.release(cost, time.perf_counter() - start)
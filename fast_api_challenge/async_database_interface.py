@@ -0,0 +1,193 @@
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fast_api_challenge import database_interface
+from fast_api_challenge.models import database_models as models
+from fast_api_challenge.models import api_models
+from fast_api_challenge.database import orm, replicas
+
+"""
+Asyncio variants of the database interface methods, for use with an SQLAlchemy AsyncSession.
+
+Each method runs its synchronous counterpart in `database_interface` on the AsyncSession's underlying Session (via
+`run_sync`), so the database IO is awaited on the event loop while the query logic is only written once.
+"""
+
+
+async def create_netflix_show(db_session: AsyncSession, show: orm.NetflixShow):
+    """
+    Async variant of `database_interface.create_netflix_show`
+    """
+    return await db_session.run_sync(database_interface.create_netflix_show, show=show)
+
+
+async def get_netflix_show(db_session: AsyncSession, show_id: int):
+    """
+    Async variant of `database_interface.get_netflix_show`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show, show_id=show_id)
+
+
+async def get_netflix_show_row(db_session: AsyncSession, show_id: int, use_cache: bool = True):
+    """
+    Async variant of `database_interface.get_netflix_show_row`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show_row, show_id=show_id, use_cache=use_cache)
+
+
+async def get_netflix_show_rows(db_session: AsyncSession, show_ids: List[int], columns: List[str] = None):
+    """
+    Async variant of `database_interface.get_netflix_show_rows`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show_rows, show_ids=show_ids, columns=columns)
+
+
+async def get_netflix_show_model(db_session: AsyncSession, show_id: int, use_cache: bool = True):
+    """
+    Async variant of `database_interface.get_netflix_show_model`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show_model, show_id=show_id, use_cache=use_cache)
+
+
+async def update_netflix_show(db_session: AsyncSession, show: orm.NetflixShow, show_id: int,
+                              expected_version: int = None):
+    """
+    Async variant of `database_interface.update_netflix_show`
+    """
+    return await db_session.run_sync(database_interface.update_netflix_show, show=show, show_id=show_id,
+                                     expected_version=expected_version)
+
+
+async def delete_netflix_show(db_session: AsyncSession, show_id: int, expected_version: int = None):
+    """
+    Async variant of `database_interface.delete_netflix_show`
+    """
+    return await db_session.run_sync(database_interface.delete_netflix_show, show_id=show_id,
+                                     expected_version=expected_version)
+
+
+async def bulk_create_netflix_shows(db_session: AsyncSession, shows: List[models.NetflixShowModel], chunk_size: int):
+    """
+    Async variant of `database_interface.bulk_create_netflix_shows`
+    """
+    return await db_session.run_sync(database_interface.bulk_create_netflix_shows, shows=shows, chunk_size=chunk_size)
+
+
+async def bulk_update_netflix_shows(db_session: AsyncSession, shows: List[models.NetflixShowBulkUpdateModel],
+                                    chunk_size: int):
+    """
+    Async variant of `database_interface.bulk_update_netflix_shows`
+    """
+    return await db_session.run_sync(database_interface.bulk_update_netflix_shows, shows=shows, chunk_size=chunk_size)
+
+
+async def bulk_delete_netflix_shows(db_session: AsyncSession, show_ids: List[int], chunk_size: int):
+    """
+    Async variant of `database_interface.bulk_delete_netflix_shows`
+    """
+    return await db_session.run_sync(database_interface.bulk_delete_netflix_shows, show_ids=show_ids,
+                                     chunk_size=chunk_size)
+
+
+async def search_netflix_show(db_session: AsyncSession,
+                              filter_args: models.NetflixShowSearchModel,
+                              skip: int = None,
+                              limit: int = None,
+                              orderBy: str = None,
+                              sort: str = None,
+                              q: str = None,
+                              cursor: api_models.SearchCursorModel = None):
+    """
+    Async variant of `database_interface.search_netflix_show`
+    """
+    return await db_session.run_sync(database_interface.search_netflix_show, filter_args=filter_args, skip=skip,
+                                     limit=limit, orderBy=orderBy, sort=sort, q=q, cursor=cursor)
+
+
+async def get_number_netflix_shows(db_session: AsyncSession):
+    """
+    Async variant of `database_interface.get_number_netflix_shows`
+    """
+    return await db_session.run_sync(database_interface.get_number_netflix_shows)
+
+
+async def get_number_of_unique_for_given_netflix_show_table_column(db_session: AsyncSession, column_name: str = None):
+    """
+    Async variant of `database_interface.get_number_of_unique_for_given_netflix_show_table_column`
+    """
+    return await db_session.run_sync(database_interface.get_number_of_unique_for_given_netflix_show_table_column,
+                                     column_name=column_name)
+
+
+async def search_netflix_show_rows(db_session: AsyncSession,
+                                   filter_args: models.NetflixShowSearchModel,
+                                   skip: int = None,
+                                   limit: int = None,
+                                   orderBy: str = None,
+                                   sort: str = None,
+                                   q: str = None,
+                                   cursor: api_models.SearchCursorModel = None,
+                                   columns: List[str] = None):
+    """
+    Async variant of `database_interface.search_netflix_show_rows`
+    """
+    return await db_session.run_sync(database_interface.search_netflix_show_rows, filter_args=filter_args,
+                                     skip=skip, limit=limit, orderBy=orderBy, sort=sort, q=q, cursor=cursor,
+                                     columns=columns)
+
+
+async def search_netflix_show_models(db_session: AsyncSession,
+                                     filter_args: models.NetflixShowSearchModel,
+                                     skip: int = None,
+                                     limit: int = None,
+                                     orderBy: str = None,
+                                     sort: str = None,
+                                     q: str = None,
+                                     cursor: api_models.SearchCursorModel = None):
+    """
+    Async variant of `database_interface.search_netflix_show_models`
+    """
+    return await db_session.run_sync(database_interface.search_netflix_show_models, filter_args=filter_args,
+                                     skip=skip, limit=limit, orderBy=orderBy, sort=sort, q=q, cursor=cursor)
+
+
+async def get_netflix_show_facets(db_session: AsyncSession,
+                                  filter_args: models.NetflixShowSearchModel,
+                                  facets: List[str],
+                                  facet_limit: int = 10,
+                                  q: str = None):
+    """
+    Async variant of `database_interface.get_netflix_show_facets`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show_facets, filter_args=filter_args,
+                                     facets=facets, facet_limit=facet_limit, q=q)
+
+
+async def stream_netflix_shows(db_session: AsyncSession,
+                               filter_args: models.NetflixShowSearchModel,
+                               orderBy: str = None,
+                               sort: str = None,
+                               q: str = None,
+                               batch_size: int = 1000):
+    """
+    Async variant of `database_interface.stream_netflix_shows`, an async generator. The rows are streamed with
+    `AsyncSession.stream`, as a server-side cursor cannot be iterated within `run_sync`.
+    """
+    with replicas.replica_reads(db_session.sync_session):
+        statement = database_interface.netflix_show_export_statement(db_session.sync_session.get_bind().dialect.name,
+                                                                     filter_args=filter_args, orderBy=orderBy,
+                                                                     sort=sort, q=q)
+        result = await db_session.stream(statement)
+    try:
+        async for partition in result.mappings().partitions(batch_size):
+            yield partition
+    finally:
+        await result.close()
+
+
+async def get_netflix_show_summary_counts(db_session: AsyncSession, use_cache: bool = True):
+    """
+    Async variant of `database_interface.get_netflix_show_summary_counts`
+    """
+    return await db_session.run_sync(database_interface.get_netflix_show_summary_counts, use_cache=use_cache)
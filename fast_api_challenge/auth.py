@@ -1,17 +1,73 @@
+import base64
+import hashlib
+import hmac
 import os
+import time
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import jwt
+from typing import Dict, Optional
+from jose import jwt, JWTError
 
+from fast_api_challenge import caching, latency
 from fast_api_challenge.models.api_models import TokenRequestModel, Token
+from utils import get_auth_token_cache_max_entries, get_metrics_bearer_token
 
 """
 Contains methods for creating and validating JWT Oauth2 tokens.
+
+Tokens are signed with the active key of `SIGNING_KEYS`, and carry its id in their `kid` header, so that keys can be
+rotated: a new key is added and made active, and the old one is removed once the tokens it signed have expired. Tokens
+without a `kid` are signed and verified with `SECRET_KEY`.
+
+Verified tokens are cached (keyed by a hash of the token) until they expire, so that clients reusing a token skip the
+signature check and the decoding of its claims.
 """
 
+
+def _parse_signing_keys(signing_keys: str):
+    """
+    :param signing_keys: Comma separated "kid=secret" pairs
+    :return: (dict) Secrets by kid
+    """
+    keys = {}
+    for pair in filter(None, (pair.strip() for pair in signing_keys.split(","))):
+        kid, separator, secret = pair.partition("=")
+        if not separator or not kid.strip() or not secret:
+            raise ValueError(f"Invalid signing key '{kid.strip()}', expected 'kid=secret'.")
+        keys[kid.strip()] = secret
+    return keys
+
+
 SECRET_KEY = os.environ.get("auth_issuer_secret_key")  # TODO: Put this in secrets manager
+SIGNING_KEYS = _parse_signing_keys(os.environ.get("auth_issuer_secret_keys", ""))
+ACTIVE_KID = os.environ.get("auth_issuer_active_kid") or next(iter(SIGNING_KEYS), None)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
+METRICS_BEARER_TOKEN = get_metrics_bearer_token()  # Static token of the metrics scrapes, or None
+
+# Tokens are cached until they expire, but never for longer than the lifetime of the tokens issued here
+token_cache = caching.TTLCache(ACCESS_TOKEN_EXPIRE_MINUTES * 60, max_entries=get_auth_token_cache_max_entries())
+verification_latency = latency.LatencyHistogram()
+
+
+class InvalidTokenError(Exception):
+    """
+    Raised when a token is malformed, expired, or not signed by a known key
+    """
+
+
+def configure_signing_keys(signing_keys: Dict[str, str], active_kid: str = None, secret_key: str = None):
+    """
+    Replace the keys used to sign and verify tokens, eg. to rotate them. Cached tokens are verified again.
+    :param signing_keys: Secrets by kid
+    :param active_kid: Kid of the key to sign new tokens with, by default the first of signing_keys
+    :param secret_key: Key of tokens without a kid
+    """
+    global SECRET_KEY, SIGNING_KEYS, ACTIVE_KID
+    active_kid = active_kid or next(iter(signing_keys), None)
+    if active_kid is not None and active_kid not in signing_keys:
+        raise ValueError(f"Unknown active kid '{active_kid}'.")
+    SECRET_KEY, SIGNING_KEYS, ACTIVE_KID = secret_key, dict(signing_keys), active_kid
+    token_cache.invalidate()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -27,10 +83,80 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    if ACTIVE_KID is not None:
+        encoded_jwt = jwt.encode(to_encode, SIGNING_KEYS[ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": ACTIVE_KID})
+    else:
+        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return Token(token=encoded_jwt, type="Bearer")
 
 
+def _verification_key(token: str):
+    """
+    :return: (dict) The key the token should be signed with, according to its kid
+    :raises InvalidTokenError: If the token is malformed or its kid is unknown
+    """
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except JWTError as e:
+        raise InvalidTokenError("Malformed token.") from e
+    key = SECRET_KEY if kid is None else SIGNING_KEYS.get(kid)
+    if key is None:
+        raise InvalidTokenError(f"Unknown signing key '{kid}'." if kid is not None else "Unknown signing key.")
+    # As a JWK, as jose would otherwise parse secrets which happen to be valid JSON (eg. "1234") when verifying
+    encoded_key = base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+    return {"kty": "oct", "k": encoded_key}
+
+
+def verify_access_token(token: str):
+    """
+    Verifies the signature and expiry of a JWT access token, using the cached result for tokens already verified.
+    :param token: JWT token
+    :return: (dict) The token's claims
+    :raises InvalidTokenError: If the token is invalid or expired
+    """
+    start = time.perf_counter()
+    try:
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        claims = token_cache.get(cache_key)
+        if claims is not None and claims["exp"] > time.time():
+            return dict(claims)
+
+        generation = token_cache.generation
+        try:
+            # The subject is the token request, rather than a string, so isn't validated
+            claims = jwt.decode(token, _verification_key(token), algorithms=[ALGORITHM],
+                                options={"verify_sub": False, "require_exp": True})
+        except JWTError as e:
+            raise InvalidTokenError(str(e)) from e
+        token_cache.set(cache_key, claims, generation=generation, ttl_seconds=claims["exp"] - time.time())
+        return dict(claims)
+    finally:
+        verification_latency.record(time.perf_counter() - start)
+
+
+def is_metrics_bearer_token(token: str):
+    """
+    Checks whether a bearer token is the static METRICS_BEARER_TOKEN of the metrics scrapes, in constant time so that
+    the response time doesn't tell how much of the token was guessed right
+    :param token: Bearer token of a request
+    :return: Bool
+    """
+    if not METRICS_BEARER_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), METRICS_BEARER_TOKEN.encode("utf-8"))
+
+
+def describe_token_verification():
+    """
+    :return: (dict) Usage statistics of the token cache, and the latency of verifications, matching the fields of
+             `api_models.AuthStatusModel`
+    """
+    return {
+        "token_cache": token_cache.describe(),
+        "verification_latency": verification_latency.describe(),
+    }
+
+
 def authenticate_api_user(token_request: TokenRequestModel):
     """
     "Authenticates" the user with the given name. This could be replaced by taking secrets as parameters and using
@@ -0,0 +1,266 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+"""
+Caching utilities.
+
+`TTLCache` is a per-process cache. `SharedCache` offers the same interface on top of a `SharedCacheStore`, a key-value
+store shared by every api node (such as Redis or Memcached), so that a write made through one node is seen by all of
+them. `InMemorySharedCacheStore` is a local stand-in for such a store.
+"""
+
+
+class CacheStatistics:
+    """
+    Thread-safe counters describing the usage of a cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self, expired: bool = False):
+        with self._lock:
+            self.misses += 1
+            if expired:
+                self.expirations += 1
+
+    def record_evictions(self, count: int = 1):
+        with self._lock:
+            self.evictions += count
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def describe(self, entries: int = None):
+        """
+        :param entries: Number of entries currently cached, if known
+        :return: (dict) The counters, matching the fields of `api_models.CacheStatisticsModel`
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class TTLCache:
+    """
+    Thread-safe, per-process cache whose entries expire a fixed number of seconds after they are stored. When
+    max_entries is given, the least recently used entries are evicted to stay within it.
+
+    `invalidate` clears the cache and starts a new generation, as does `delete` for the given keys. Values computed
+    from data read before an invalidation can be stored with the generation they were read in, and are then discarded
+    rather than cached, so a slow reader racing with a writer can never cache stale data.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.statistics = CacheStatistics()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key, default=None):
+        """
+        :return: The unexpired value stored for the key, or the default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.statistics.record_miss()
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.statistics.record_miss(expired=True)
+                return default
+            self._entries.move_to_end(key)
+            self.statistics.record_hit()
+            return value
+
+    def set(self, key, value, generation: int = None, ttl_seconds: float = None):
+        """
+        Store a value for the key.
+        :param generation: The cache generation at the time the value's data was read. The value is not stored if the
+                           cache has been invalidated since.
+        :param ttl_seconds: Expire the entry sooner than the cache's TTL, eg. when the value itself expires
+        :return: Bool, whether the value was stored
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl_seconds <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            if evicted:
+                self.statistics.record_evictions(evicted)
+            return True
+
+    def delete(self, *keys):
+        """
+        Remove the entries of the given keys, and discard values computed from data read before this call
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self._generation += 1
+
+    def invalidate(self):
+        """
+        Remove every entry, and discard values computed from data read before this call
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+        self.statistics.record_invalidation()
+
+    def describe(self):
+        """
+        :return: (dict) Usage statistics, matching the fields of `api_models.CacheStatisticsModel`
+        """
+        return self.statistics.describe(entries=len(self))
+
+
+class SharedCacheStore:
+    """
+    Interface of a key-value store shared by every api node. Implementations adapt a client of a store such as Redis
+    or Memcached, whose operations are expected to be atomic.
+    """
+
+    def get(self, key: str):
+        """
+        :return: (bytes) The unexpired value stored for the key, or None
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def increment(self, key: str):
+        """
+        Atomically increment the (never expiring) integer stored for the key, starting from 0
+        :return: (int) The incremented value
+        """
+        raise NotImplementedError
+
+
+class InMemorySharedCacheStore(SharedCacheStore):
+    """
+    Local, thread-safe stand-in for a shared store, used in tests and when only one api process is run
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl_seconds, value)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def increment(self, key: str):
+        with self._lock:
+            _, value = self._values.get(key, (None, 0))
+            self._values[key] = (None, value + 1)
+            return value + 1
+
+
+class SharedCache:
+    """
+    Cache with the interface of `TTLCache`, whose entries are kept in a `SharedCacheStore` and so are shared by every
+    api node. Values are pickled.
+
+    The generation is a counter kept in the store, and entries are stored under keys prefixed with the generation they
+    were read in, so that `invalidate` only has to increment it: older entries are never read again and expire on their
+    own. A value computed from data read before an invalidation is stored under its (old) generation, so is never read.
+    Eviction is left to the store, so is not counted. Unlike with `TTLCache`, a value read before a `delete` of its key
+    can still be stored after it, so its staleness is only bounded by the TTL.
+    """
+
+    def __init__(self, store: SharedCacheStore, namespace: str, ttl_seconds: float):
+        self.store = store
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.statistics = CacheStatistics()
+
+    @property
+    def generation(self):
+        return int(self.store.get(f"{self.namespace}:generation") or 0)
+
+    def _entry_key(self, key, generation: int):
+        return f"{self.namespace}:{generation}:{key}"
+
+    def get(self, key, default=None):
+        value = self.store.get(self._entry_key(key, self.generation))
+        if value is None:
+            self.statistics.record_miss()
+            return default
+        self.statistics.record_hit()
+        return pickle.loads(value)
+
+    def set(self, key, value, generation: int = None):
+        if self.ttl_seconds <= 0:
+            return False
+        generation = self.generation if generation is None else generation
+        self.store.set(self._entry_key(key, generation), pickle.dumps(value), self.ttl_seconds)
+        return True
+
+    def delete(self, *keys):
+        generation = self.generation
+        self.store.delete(*[self._entry_key(key, generation) for key in keys])
+
+    def invalidate(self):
+        self.store.increment(f"{self.namespace}:generation")
+        self.statistics.record_invalidation()
+
+    def describe(self):
+        return self.statistics.describe()
@@ -0,0 +1,97 @@
+import asyncio
+
+from fast_api_challenge import metrics
+
+"""
+Request coalescing ("single-flight") for the reads of a worker.
+
+When many identical reads arrive at once, eg. the same popular search or the Summary just after the caches were
+cleared, only the first one (the leader) calls the database, and the others wait for its result instead of making the
+same call. Reads are identified by a key (see `database_interface.coalescing_key`) which changes with every write made
+through the worker, so that reads which start after a write never share the result of a call made before it.
+
+Waiting reads give up after a timeout and call the database themselves, so that a slow call can't hold up more reads
+than it would have without coalescing.
+"""
+
+EXECUTED = "executed"  # Outcomes of reads: calls made to the database
+COALESCED = "coalesced"  # Reads which shared the result of a call in flight
+TIMED_OUT = "timed_out"  # Reads which stopped waiting for a call in flight, and made their own call
+
+
+class SingleFlight:
+    """
+    Shares the result of a call in flight with the concurrent calls which have the same key. Only used from the event
+    loop, so it needs no lock.
+    """
+
+    def __init__(self, wait_timeout_seconds: float):
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self._flights = {}  # Future of the result of the call in flight, by key
+        self.outcomes = {EXECUTED: 0, COALESCED: 0, TIMED_OUT: 0}
+
+    def _record(self, outcome: str, name: str):
+        self.outcomes[outcome] += 1
+        metrics.database_read_coalescing.inc(name, outcome)
+
+    async def run(self, key, call, name: str = ""):
+        """
+        :param key: Hashable key of the call
+        :param call: Function() returning an awaitable of the call's result
+        :param name: Name of the call in the metrics, eg. its database function
+        :return: The result of the call, or of the identical call in flight
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            return await self._lead(key, call, name)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight), self.wait_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._record(TIMED_OUT, name)
+            return await self._make_call(call, name)
+        except asyncio.CancelledError:
+            if not flight.cancelled():
+                raise  # This read was cancelled
+            return await self._make_call(call, name)  # The leader was cancelled, eg. its client disconnected
+        except Exception:
+            self._record(COALESCED, name)  # The error of the call in flight
+            raise
+        self._record(COALESCED, name)
+        return result
+
+    async def _make_call(self, call, name: str):
+        self._record(EXECUTED, name)
+        return await call()
+
+    async def _lead(self, key, call, name: str):
+        flight = self._flights[key] = asyncio.get_event_loop().create_future()
+        try:
+            result = await self._make_call(call, name)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # Retrieved, as there may be no waiting reads
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def describe(self):
+        """
+        :return: (dict) The wait timeout, reads in flight and outcome counts, matching the fields of
+                 `api_models.ReadCoalescingStatusModel`
+        """
+        reads = self.outcomes[EXECUTED] + self.outcomes[COALESCED]
+        return {
+            "wait_timeout_seconds": self.wait_timeout_seconds,
+            "in_flight": len(self._flights),
+            "calls": self.outcomes[EXECUTED],
+            "coalesced": self.outcomes[COALESCED],
+            "timed_out": self.outcomes[TIMED_OUT],
+            "coalescing_ratio": self.outcomes[COALESCED] / reads if reads else None,
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import json
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Union
+
+from fast_api_challenge.models import database_models as models
+
+"""
+Validators and precondition evaluation for HTTP conditional requests (RFC 7232) on show resources.
+
+A show's strong ETag is derived from its show_id, row version and last modification time, which change with every
+write to its row (including deleting and re-creating it). A page of search results has a strong ETag derived from the
+ETags of its shows, in order. Pages have no Last-Modified, as the latest modification time of the shows on a page does
+not change when a show stops matching the search.
+
+Shows may be given as models or as the plain rows of `database_interface.get_netflix_show_row`.
+"""
+
+Show = Union[models.NetflixShowVersionModel, Mapping]
+
+
+def _show_value(show: Show, name: str):
+    return show[name] if isinstance(show, Mapping) else getattr(show, name)
+
+
+def show_etag(show: Show):
+    """
+    :return: (str) Strong ETag of a show, quoted
+    """
+    updated_at = _show_value(show, "updated_at")
+    validator = f"{_show_value(show, 'show_id')}:{_show_value(show, 'version')}:" \
+                f"{updated_at.isoformat() if updated_at else ''}"
+    return f'"{hashlib.sha256(validator.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def page_etag(shows: List[Show], facets: dict = None):
+    """
+    :param facets: Facet counts returned along with the page, if any
+    :return: (str) Strong ETag of a page of shows, quoted
+    """
+    validator = ",".join(show_etag(show) for show in shows)
+    if facets is not None:
+        validator += json.dumps(facets, sort_keys=True, default=str)
+    return f'"{hashlib.sha256(validator.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def http_date(moment: datetime):
+    """
+    :param moment: Naive UTC datetime, as stored in the database
+    :return: (str) The moment as an HTTP-date, eg. for a Last-Modified header
+    """
+    return format_datetime(moment.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def show_validator_headers(show: Show):
+    """
+    :return: (dict) ETag and Last-Modified response headers of a show
+    """
+    headers = {"ETag": show_etag(show)}
+    updated_at = _show_value(show, "updated_at")
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    return headers
+
+
+def _parse_etags(header_value: str):
+    return [etag.strip() for etag in header_value.split(",") if etag.strip()]
+
+
+def _opaque_tag(etag: str):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def none_match(if_none_match: str, etag: str):
+    """
+    Evaluates an If-None-Match header, using the weak comparison function
+    :return: Bool, whether the condition holds (ie. the current representation does not match)
+    """
+    etags = _parse_etags(if_none_match)
+    return "*" not in etags and _opaque_tag(etag) not in [_opaque_tag(candidate) for candidate in etags]
+
+
+def match(if_match: str, etag: str = None):
+    """
+    Evaluates an If-Match header, using the strong comparison function
+    :param etag: Strong ETag of the current representation, or None if there is none
+    :return: Bool, whether the condition holds
+    """
+    if etag is None:
+        return False
+    etags = _parse_etags(if_match)
+    return "*" in etags or etag in etags  # Weak ETags never match strongly
+
+
+def not_modified(if_none_match: str = None, if_modified_since: str = None, etag: str = None,
+                 last_modified: datetime = None):
+    """
+    Whether a GET request for a representation with the given validators should be answered with 304 Not Modified.
+    If-Modified-Since is ignored when If-None-Match is sent, or cannot be parsed.
+    :param last_modified: Naive UTC datetime the representation was last modified, if known
+    :return: Bool
+    """
+    if if_none_match:
+        return etag is not None and not none_match(if_none_match, etag)
+    if if_modified_since and last_modified is not None:
+        try:
+            modified_since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if modified_since.tzinfo is None:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= modified_since
+    return False
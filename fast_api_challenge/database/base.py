@@ -1,22 +1,122 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
-from utils import get_database_url
+from fast_api_challenge.database import pool_statistics, replicas, slow_queries
+from utils import get_database_url, get_async_database_url, get_database_pool_settings, get_replica_database_urls, \
+    get_replica_settings, get_slow_query_settings, use_async_database
 
 
 SQLALCHEMY_DATABASE_URL = get_database_url()
+REPLICA_DATABASE_URLS = get_replica_database_urls()
+POOL_SETTINGS = get_database_pool_settings()
 
-connection_args = {}
 
-if not "postgres" in SQLALCHEMY_DATABASE_URL:  # Add specific option for SQLite database usage
-    connection_args["check_same_thread"]: False
+def engine_options(database_url: str, is_async: bool = False):
+    """
+    Keyword arguments for `create_engine` / `create_async_engine`, according to the configured connection pool settings
+    :param database_url: Url of the database the engine connects to
+    :param is_async: Whether the options are for an asyncio engine
+    :return: (dict) Engine keyword arguments
+    """
+    options = {
+        "connect_args": {},
+        "pool_pre_ping": POOL_SETTINGS["pool_pre_ping"],
+        "pool_recycle": POOL_SETTINGS["pool_recycle"],
+    }
+    if not "postgres" in database_url:  # Add specific option for SQLite database usage, using its default pool
+        if not is_async:
+            options["connect_args"]["check_same_thread"] = False
+        return options
+
+    if POOL_SETTINGS["external_pooler"]:
+        # The external pooler hands out a server connection per transaction, so connections are not pooled locally,
+        # and asyncpg must not cache prepared statements, which would not exist on the next server connection.
+        options["poolclass"] = NullPool
+        if is_async:
+            options["connect_args"].update(statement_cache_size=0, prepared_statement_cache_size=0)
+        return options
+
+    options.update(
+        poolclass=pool_statistics.InstrumentedAsyncAdaptedQueuePool if is_async else pool_statistics.InstrumentedQueuePool,
+        pool_size=POOL_SETTINGS["pool_size"],
+        max_overflow=POOL_SETTINGS["max_overflow"],
+        pool_timeout=POOL_SETTINGS["pool_timeout"],
+    )
+    return options
+
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connection_args
+    SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)
 )
+engine_pool_statistics = pool_statistics.attach_pool_statistics(engine)
+
+# Slow statements of every engine below, including the replicas' (see utils.SLOW_QUERY_THRESHOLD_MS)
+slow_query_log = slow_queries.SlowQueryLog(**get_slow_query_settings())
+slow_queries.attach_slow_query_log(engine, slow_query_log)
+
+# Read replicas, only used when replica urls are configured (see utils.DB_REPLICA_URLS)
+replica_router = None
+
+if REPLICA_DATABASE_URLS:
+    replica_router = replicas.ReplicaRouter([create_engine(url, **engine_options(url)) for url in REPLICA_DATABASE_URLS],
+                                            **get_replica_settings())
+    for replica in replica_router.replicas:
+        slow_queries.attach_slow_query_log(replica.engine, slow_query_log)
+    DbSession = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=replicas.RoutingSession,
+                             router=replica_router)
+else:
+    DbSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Asyncio engine, only created when the async database path is enabled (see utils.USE_ASYNC_DATABASE)
+async_engine = None
+async_engine_pool_statistics = None
+async_replica_router = None
+AsyncDbSession = None
+
+if use_async_database():
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_engine = create_async_engine(get_async_database_url(SQLALCHEMY_DATABASE_URL),
+                                       **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True))
+    async_engine_pool_statistics = pool_statistics.attach_pool_statistics(async_engine.sync_engine)
+    slow_queries.attach_slow_query_log(async_engine.sync_engine, slow_query_log)
+    # Objects are not expired on commit, as lazily refreshing them outside of the session's greenlet is not possible
+    if REPLICA_DATABASE_URLS:
+        async_replica_router = replicas.ReplicaRouter(
+            [create_async_engine(get_async_database_url(url), **engine_options(url, is_async=True)).sync_engine
+             for url in REPLICA_DATABASE_URLS], **get_replica_settings())
+        for replica in async_replica_router.replicas:
+            slow_queries.attach_slow_query_log(replica.engine, slow_query_log)
+        AsyncDbSession = sessionmaker(autocommit=False, autoflush=False, bind=async_engine,
+                                      class_=replicas.RoutingAsyncSession, router=async_replica_router,
+                                      expire_on_commit=False)
+    else:
+        AsyncDbSession = sessionmaker(autocommit=False, autoflush=False, bind=async_engine, class_=AsyncSession,
+                                      expire_on_commit=False)
+
+
+def describe_request_engine_pool():
+    """
+    Live status of the connection pool used to serve requests (the async engine's pool, when it is enabled)
+    :return: (dict) Pool description, matching the fields of `api_models.DatabasePoolStatusModel`
+    """
+    if async_engine is not None:
+        return pool_statistics.describe_pool(async_engine.sync_engine, async_engine_pool_statistics,
+                                             external_pooler=POOL_SETTINGS["external_pooler"])
+    return pool_statistics.describe_pool(engine, engine_pool_statistics,
+                                         external_pooler=POOL_SETTINGS["external_pooler"])
+
+
+def describe_request_replicas():
+    """
+    Status of the read replicas used to serve requests (the async engine's replicas, when it is enabled)
+    :return: (dict) Replicas description, matching the fields of `api_models.DatabaseReplicasStatusModel`, or None
+             when no replicas are configured
+    """
+    router = async_replica_router if async_engine is not None else replica_router
+    return router.describe() if router is not None else None
 
-DbSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,633 @@
+import bisect
+import re
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from fast_api_challenge.database import show_entities, typed_columns
+
+"""
+In-memory columnar snapshot of the Netflix table, which answers searches without a database round trip.
+
+Every field of the shows is dictionary encoded: the distinct values of a column are kept sorted, and each show stores
+the code (index) of its value among them, in a NumPy array, with -1 for NULL. As codes are ordered like the values:
+- a filter is evaluated once per distinct value, then applied to every show with a single array lookup
+- the order of the shows by every field, with NULLs and the show_id tie-breaker placed as `database_interface` orders
+  them, is precomputed as a permutation of the shows, sorted by an int64 key packing (NULL, code, show_id). Fields
+  ordered by a typed column (date_added) use the rank of their parsed value among the distinct parsed values instead
+  of their code, and range filters are likewise evaluated on the parsed values.
+
+Snapshots are immutable, so searches never lock. Writes are applied incrementally: `ColumnarSearchEngine` re-reads the
+rows of the shows written through `database_interface` (see `invalidate_netflix_caches`) from the primary at the next
+search, and derives a new snapshot in which only those shows are re-encoded and re-inserted into the permutations.
+
+The snapshot answers a search only when it can return exactly what the database would. Full-text searches (q) go to
+the database, as do orderings by a string field (and integer LIKE filters) on databases other than SQLite, whose
+collation (or typing) the snapshot doesn't reproduce.
+"""
+
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+SQLITE_DIALECT = "sqlite"  # Orders strings by code point and matches LIKE case-insensitively for ASCII letters
+UNENCODED_COLUMNS = ("version", "updated_at")  # Row columns which are only returned, never searched or ordered by
+MAX_SHOW_ID = 2 ** 31 - 1  # show_ids (and codes) must fit in 31 bits of the sort keys
+NULL_KEY = np.int64(1) << np.int64(62)  # NULLs sort after every value
+SEPARATOR = b"\x00"
+MAX_PROBED_INSERTS = 64  # Up to this many shows written are placed in each order by a binary search of their own
+FIRST_SCAN_CHUNK_SIZE = 4096  # Slots of an order checked against the filters at first, doubled until the page is full
+LIKE_WILDCARDS = re.compile(r"[%_]")
+
+
+def _like_regex(pattern: str, fold_case: bool):
+    """
+    :return: Compiled regular expression matching what the LIKE pattern (without an escape character) matches
+    """
+    regex = "".join(".*" if part == "%" else "." if part == "_" else re.escape(part)
+                    for part in re.split(r"([%_])", pattern))
+    flags = re.DOTALL | (re.IGNORECASE | re.ASCII if fold_case else 0)  # Only ASCII letters are folded, like SQLite
+    return re.compile(regex, flags)
+
+
+class EncodedColumn:
+    """
+    Dictionary encoded column: the sorted distinct values, and the code of each show's value among them (-1 for NULL)
+    """
+
+    def __init__(self, values: list, codes, derived: dict = None):
+        self.values = values
+        self.codes = codes
+        # Text blobs and parsed ranks of the values, shared by snapshots with the same values
+        self._derived = derived if derived is not None else {}
+
+    @classmethod
+    def encode(cls, column_values: list):
+        """
+        :param column_values: The value of the column for each show
+        :raises ValueError: If the values can't be ordered (eg. a mix of strings and integers)
+        """
+        try:
+            values = sorted({value for value in column_values if value is not None})
+        except TypeError as e:
+            raise ValueError("The column holds values which can't be ordered.") from e
+        code_of = {value: code for code, value in enumerate(values)}
+        codes = np.fromiter((code_of.get(value, -1) for value in column_values), dtype=np.int32,
+                            count=len(column_values))
+        return cls(values, codes)
+
+    def with_values(self, slots, slot_values: list, size: int):
+        """
+        :param slots: Slots (indexes) of the shows written, some of which may be past the current end of the column
+        :param slot_values: The new value of the column for each of the slots
+        :param size: Number of slots of the new column
+        :return: (EncodedColumn) A new column with the values written. Values which are no longer used are kept until
+                 the next full load.
+        """
+        try:
+            new_values = sorted({value for value in slot_values if value is not None and not self._contains(value)})
+        except TypeError as e:
+            raise ValueError("The column holds values which can't be ordered.") from e
+        values, codes = self.values, np.full(size, -1, dtype=np.int32)
+        codes[:len(self.codes)] = self.codes
+        derived = self._derived
+        if new_values:
+            insert_positions = [bisect.bisect_left(self.values, value) for value in new_values]
+            values, start = [], 0
+            for position, value in zip(insert_positions, new_values):
+                values += self.values[start:position]
+                values.append(value)
+                start = position
+            values += self.values[start:]
+            # Every existing code moves up by the number of new values inserted before its value
+            non_null = codes >= 0
+            codes[non_null] += np.searchsorted(np.array(insert_positions), codes[non_null], side="right") \
+                .astype(np.int32)
+            derived = None
+        codes[slots] = [bisect.bisect_left(values, value) if value is not None else -1 for value in slot_values]
+        return EncodedColumn(values, codes, derived)
+
+    def _contains(self, value):
+        position = bisect.bisect_left(self.values, value)
+        return position < len(self.values) and self.values[position] == value
+
+    def _text_blob(self, fold_case: bool):
+        """
+        :return: (tuple) The text of every value, joined into one bytes string (lowercased for ASCII letters only if
+                 fold_case), and the offset at which each value starts in it
+        """
+        blob = self._derived.get(("text", fold_case))
+        if blob is None:
+            encoded = [str(value).encode("utf-8") for value in self.values]
+            lengths = np.fromiter((len(text) + len(SEPARATOR) for text in encoded), dtype=np.int64, count=len(encoded))
+            joined = SEPARATOR.join(encoded)
+            blob = self._derived[("text", fold_case)] = (joined.lower() if fold_case else joined,
+                                                         (np.cumsum(lengths) - lengths).tolist())
+        return blob
+
+    def parsed_ranks(self, parse):
+        """
+        :param parse: Function(value) returning the typed value of a value, or None (eg. `typed_columns.parse_*`)
+        :return: (tuple) The sorted distinct typed values, and an int32 array of the rank of each code's typed value
+                 among them, with -1 where it is None, and an extra -1 entry indexed by the -1 of NULLs
+        """
+        ranked = self._derived.get(("parsed", parse))
+        if ranked is None:
+            parsed = [parse(value) for value in self.values]
+            keys = sorted({value for value in parsed if value is not None})
+            rank_of = {value: rank for rank, value in enumerate(keys)}
+            ranks = np.fromiter((rank_of.get(value, -1) for value in parsed + [None]), dtype=np.int32,
+                                count=len(parsed) + 1)
+            ranked = self._derived[("parsed", parse)] = (keys, ranks)
+        return ranked
+
+    def containing(self, needle: str, fold_case: bool = False):
+        """
+        :return: (list) Codes of the values whose text contains the needle
+        """
+        needle = needle.encode("utf-8")
+        joined, starts = self._text_blob(fold_case)
+        if fold_case:
+            needle = needle.lower()
+        codes, position = [], joined.find(needle)
+        while position != -1:
+            code = bisect.bisect_right(starts, position) - 1
+            codes.append(code)
+            if code + 1 == len(starts):
+                break
+            position = joined.find(needle, starts[code + 1])  # Skip the rest of the value
+        return codes
+
+    def like_mask(self, pattern: str, fold_case: bool):
+        """
+        :param pattern: Value of a LIKE '%pattern%' filter, where % and _ are wildcards
+        :return: Boolean array of whether each code matches, with an extra False entry indexed by the -1 of NULLs
+        """
+        mask = np.zeros(len(self.values) + 1, dtype=bool)
+        if LIKE_WILDCARDS.search(pattern) or SEPARATOR.decode() in pattern:
+            regex = _like_regex(f"%{pattern}%", fold_case)
+            mask[:-1] = [regex.fullmatch(str(value)) is not None for value in self.values]
+        else:
+            mask[self.containing(pattern, fold_case)] = True
+        return mask
+
+    def name_mask(self, name: str):
+        """
+        :return: Boolean array of whether each code's value, as comma separated names, contains exactly the name
+        """
+        mask = np.zeros(len(self.values) + 1, dtype=bool)
+        if name:
+            mask[[code for code in self.containing(name)
+                  if name in show_entities.split_names(self.values[code])]] = True
+        return mask
+
+    def value_mask(self, predicate):
+        """
+        :param predicate: Function(value) returning whether a (non NULL) value matches
+        :return: Boolean array of whether each code matches, with an extra False entry indexed by the -1 of NULLs
+        """
+        mask = np.zeros(len(self.values) + 1, dtype=bool)
+        mask[:-1] = [bool(predicate(value)) for value in self.values]
+        return mask
+
+    def value_bounds(self, value):
+        """
+        :return: (tuple) The codes between which the value is, such that values[:low] < value < values[high:]
+        """
+        return bisect.bisect_left(self.values, value), bisect.bisect_right(self.values, value)
+
+
+def _check_show_ids(show_ids):
+    if len(show_ids) and (show_ids.min() < 0 or show_ids.max() > MAX_SHOW_ID):
+        raise ValueError(f"The snapshot only holds show_ids between 0 and {MAX_SHOW_ID}.")
+
+
+class ColumnarShowSnapshot:
+    """
+    Immutable columnar copy of the Netflix table. Each show has a slot (index) in every array. Deleted shows keep their
+    slot, which is reused if their show_id is created again.
+    """
+
+    def __init__(self, dialect_name: str, row_columns: List[str], integer_columns: List[str], show_ids, live,
+                 columns: dict, plain_columns: dict, show_id_order, orders: dict = None, loaded_at: float = None):
+        self.dialect_name = dialect_name
+        self.row_columns = row_columns
+        self.integer_columns = integer_columns
+        self.show_ids = show_ids  # int64 show_id of each slot
+        self.live = live  # Whether each slot holds an existing show
+        self.columns = columns  # EncodedColumn by name
+        self.plain_columns = plain_columns  # Object array by name, of the UNENCODED_COLUMNS
+        self.show_id_order = show_id_order  # Every slot, in show_id order, to find the slots of show_ids
+        self.orders = orders if orders is not None else {}  # Slots of the existing shows in ascending order, by field
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at  # Of the last full load
+
+    @classmethod
+    def build(cls, dialect_name: str, row_columns: List[str], integer_columns: List[str], rows):
+        """
+        :param row_columns: Names of the columns of the rows, and of those returned by searches, in order
+        :param integer_columns: Names of the row columns holding integers
+        :param rows: Iterable of the row of every show, as mappings of column name to value
+        :raises ValueError: If the dialect isn't supported, or the rows can't be held by a snapshot (see
+                            `_check_show_ids`)
+        """
+        if dialect_name not in SUPPORTED_DIALECTS:
+            raise ValueError(f"Searches can't be answered like the '{dialect_name}' database dialect does.")
+        column_values = {name: [] for name in row_columns}
+        for row in rows:
+            for name in row_columns:
+                column_values[name].append(row[name])
+        show_ids = np.array(column_values["show_id"], dtype=np.int64)
+        _check_show_ids(show_ids)
+        snapshot = cls(dialect_name, row_columns, integer_columns, show_ids, live=np.ones(len(show_ids), dtype=bool),
+                       columns={name: EncodedColumn.encode(values) for name, values in column_values.items()
+                                if name not in UNENCODED_COLUMNS},
+                       plain_columns={name: _object_array(column_values[name]) for name in UNENCODED_COLUMNS},
+                       show_id_order=np.argsort(show_ids, kind="stable"))
+        live_slots = np.arange(len(show_ids))
+        for order_by in snapshot._orderable_columns():
+            snapshot.orders[order_by] = live_slots[np.argsort(snapshot._sort_keys(order_by, live_slots),
+                                                              kind="stable")]
+        return snapshot
+
+    @property
+    def number_of_shows(self):
+        return int(self.live.sum())
+
+    def _orderable_columns(self):
+        if self.dialect_name == SQLITE_DIALECT:
+            return list(self.columns)
+        return [name for name in self.columns if name in self.integer_columns or name in typed_columns.ORDER_BY_COLUMNS]
+
+    def _order_codes(self, order_by: str):
+        """
+        :return: int32 array of the code by which each slot is ordered: the code of its value, or for the fields ordered
+                 by a typed column, the rank of its parsed value. -1 for NULLs.
+        """
+        column = self.columns[order_by]
+        typed_column = typed_columns.ORDER_BY_COLUMNS.get(order_by)
+        if typed_column is None:
+            return column.codes
+        _, ranks = column.parsed_ranks(typed_column.parse)
+        return ranks[column.codes]
+
+    def _sort_keys(self, order_by: str, slots):
+        """
+        :return: int64 keys of the slots, ordered like the ascending order of searches: values ascending, then NULLs,
+                 ties broken by show_id
+        """
+        show_ids = self.show_ids[slots]
+        if order_by == "show_id":
+            return show_ids
+        codes = self._order_codes(order_by)[slots].astype(np.int64)
+        return np.where(codes < 0, NULL_KEY, codes << np.int64(31)) | show_ids
+
+    def _sort_key(self, order_by: str, slot: int):
+        """
+        :return: (int) `_sort_keys` of a single slot
+        """
+        show_id = int(self.show_ids[slot])
+        if order_by == "show_id":
+            return show_id
+        column = self.columns[order_by]
+        code = int(column.codes[slot])
+        typed_column = typed_columns.ORDER_BY_COLUMNS.get(order_by)
+        if typed_column is not None:
+            code = int(column.parsed_ranks(typed_column.parse)[1][code])
+        return int(NULL_KEY) | show_id if code < 0 else code << 31 | show_id
+
+    def _insert_positions(self, order_by: str, order, keys):
+        """
+        :param keys: Sorted keys to insert into the order
+        :return: The positions at which to insert them. When there are few, each is found by a binary search which only
+                 computes the keys it compares with, instead of computing the key of every slot of the order.
+        """
+        if len(keys) > MAX_PROBED_INSERTS:
+            return np.searchsorted(self._sort_keys(order_by, order), keys)
+        positions = []
+        for key in keys.tolist():
+            low, high = 0, len(order)
+            while low < high:
+                middle = (low + high) // 2
+                if self._sort_key(order_by, order[middle]) < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            positions.append(low)
+        return positions
+
+    def slots_of(self, show_ids):
+        """
+        :return: int64 array of the slot of each show_id, -1 for those which never had one
+        """
+        show_ids = np.asarray(show_ids, dtype=np.int64)
+        if not len(self.show_id_order):
+            return np.full(len(show_ids), -1, dtype=np.int64)
+        sorted_show_ids = self.show_ids[self.show_id_order]
+        positions = np.minimum(np.searchsorted(sorted_show_ids, show_ids), len(sorted_show_ids) - 1)
+        return np.where(sorted_show_ids[positions] == show_ids, self.show_id_order[positions], -1)
+
+    def with_changes(self, rows: list, deleted_show_ids):
+        """
+        :param rows: The current rows of the shows created or updated since this snapshot
+        :param deleted_show_ids: show_ids of the shows deleted since this snapshot
+        :return: (ColumnarShowSnapshot) A new snapshot with the changes applied, leaving this one unchanged
+        """
+        written_show_ids = np.array([row["show_id"] for row in rows], dtype=np.int64)
+        _check_show_ids(written_show_ids)
+        slots = self.slots_of(written_show_ids)
+        new = slots < 0
+        size = len(self.show_ids) + int(new.sum())
+        slots[new] = np.arange(len(self.show_ids), size)
+        deleted_slots = self.slots_of(list(deleted_show_ids))
+        deleted_slots = deleted_slots[deleted_slots >= 0]
+
+        show_ids = np.concatenate([self.show_ids, written_show_ids[new]])
+        live = np.concatenate([self.live, np.zeros(size - len(self.live), dtype=bool)])
+        live[deleted_slots] = False
+        live[slots] = True
+        columns = {name: column.with_values(slots, [row[name] for row in rows], size)
+                   for name, column in self.columns.items()}
+        plain_columns = {}
+        for name, values in self.plain_columns.items():
+            plain_columns[name] = _object_array(values, size)
+            plain_columns[name][slots] = _object_array([row[name] for row in rows])
+
+        show_id_order = self.show_id_order
+        if new.any():
+            new_slots = slots[new][np.argsort(written_show_ids[new], kind="stable")]
+            show_id_order = np.insert(show_id_order, np.searchsorted(show_ids[show_id_order], show_ids[new_slots]),
+                                      new_slots)
+
+        snapshot = ColumnarShowSnapshot(self.dialect_name, self.row_columns, self.integer_columns, show_ids, live,
+                                        columns, plain_columns, show_id_order, loaded_at=self.loaded_at)
+        changed = np.zeros(size, dtype=bool)
+        changed[slots] = True
+        changed[deleted_slots] = True
+        written_slots = slots[live[slots]]
+        for order_by, order in self.orders.items():
+            kept = order[~changed[order]]
+            inserted_keys = snapshot._sort_keys(order_by, written_slots)
+            inserted = written_slots[np.argsort(inserted_keys, kind="stable")]
+            positions = snapshot._insert_positions(order_by, kept, np.sort(inserted_keys))
+            snapshot.orders[order_by] = np.insert(kept, positions, inserted)
+        return snapshot
+
+    @staticmethod
+    def _filtered_column_name(key: str):
+        """
+        :return: Name of the column (field) whose values the filter is evaluated on
+        """
+        if key in typed_columns.RANGE_FILTERS:
+            return typed_columns.RANGE_FILTERS[key].field_name
+        return show_entities.EXACT_MATCH_FILTERS.get(key, key)
+
+    def _filter_mask(self, key: str, value):
+        """
+        :return: Boolean array of whether each code of the filtered column matches the filter, or None if the database
+                 must evaluate it
+        """
+        if key in typed_columns.RANGE_FILTERS:
+            range_filter = typed_columns.RANGE_FILTERS[key]
+            column = self.columns[range_filter.field_name]
+            if range_filter.typed_column is None:
+                return column.value_mask(lambda column_value: range_filter.comparison(column_value, value))
+            keys, ranks = column.parsed_ranks(range_filter.typed_column.parse)  # Each distinct typed value is compared
+            return np.append(np.array([range_filter.comparison(key, value) for key in keys], dtype=bool), False)[ranks]
+        if key in show_entities.EXACT_MATCH_FILTERS:
+            return self.columns[show_entities.EXACT_MATCH_FILTERS[key]].name_mask(value.strip())
+        if self.dialect_name != SQLITE_DIALECT and (key in self.integer_columns or "\\" in str(value)):
+            return None  # Postgres doesn't LIKE integers, and escapes with backslashes
+        return self.columns[key].like_mask(str(value), fold_case=self.dialect_name == SQLITE_DIALECT)
+
+    def _cursor_mask(self, cursor, order_by: str, descending: bool):
+        """
+        :return: Boolean array of whether each slot comes after the cursor, like `_keyset_seek_predicate`, or None if
+                 the cursor's value can't be compared with the column
+        """
+        after_show_id = self.show_ids < cursor.show_id if descending else self.show_ids > cursor.show_id
+        if not order_by or order_by == "show_id":
+            return after_show_id
+        column = self.columns[order_by]
+        typed_column = typed_columns.ORDER_BY_COLUMNS.get(order_by)
+        value = typed_column.parse(cursor.value) if typed_column is not None else cursor.value
+        codes = self._order_codes(order_by)
+        null = codes < 0
+        if value is None:
+            return (null & after_show_id) | ~null if descending else null & after_show_id
+        if typed_column is not None:
+            keys, _ = column.parsed_ranks(typed_column.parse)
+            low, high = bisect.bisect_left(keys, value), bisect.bisect_right(keys, value)
+        elif type(value) is not (int if order_by in self.integer_columns else str):
+            return None
+        else:
+            low, high = column.value_bounds(value)
+        equal = (codes >= low) & (codes < high)
+        if descending:  # Order: NULLs, then values descending
+            return ((codes >= 0) & (codes < low)) | (equal & after_show_id)
+        return (codes >= high) | (equal & after_show_id) | null
+
+    def search(self, filter_args, skip: int = None, limit: int = None, order_by: str = None,
+               descending: bool = False, cursor=None):
+        """
+        Answer a search like `database_interface.search_netflix_show_rows` (without q)
+        :param order_by: Name of the field to order by, or None to order by show_id
+        :param descending: Whether the order is descending
+        :return: (list) The rows of the results, or None if the search must be run by the database
+        """
+        order = self.orders.get(order_by or "show_id")
+        if order is None:
+            return None
+        mask = self.live.copy()
+        for key, value in filter_args.dict().items():
+            if not value:
+                continue
+            code_mask = self._filter_mask(key, value)
+            if code_mask is None:
+                return None
+            mask &= code_mask[self.columns[self._filtered_column_name(key)].codes]
+        if cursor is not None:
+            cursor_mask = self._cursor_mask(cursor, order_by, descending)
+            if cursor_mask is None:
+                return None
+            mask &= cursor_mask
+
+        start = skip or 0
+        slots = _matching_slots(order[::-1] if descending else order, mask, start + limit if limit else None)
+        return self.rows(slots[start:start + limit] if limit else slots[start:])
+
+    def rows(self, slots):
+        """
+        :return: (list) The row of each slot, as a dict of the values of the row columns
+        """
+        values_by_column = []
+        for name in self.row_columns:
+            if name in self.plain_columns:
+                values_by_column.append(self.plain_columns[name][slots].tolist())
+            else:
+                column = self.columns[name]
+                values = column.values
+                values_by_column.append([values[code] if code >= 0 else None for code in column.codes[slots].tolist()])
+        return [dict(zip(self.row_columns, row_values)) for row_values in zip(*values_by_column)]
+
+
+def _matching_slots(order, mask, wanted: int = None):
+    """
+    :param order: Slots in the order of the search
+    :param mask: Boolean array of whether each slot matches the search
+    :param wanted: Number of matching slots needed, or None for all of them
+    :return: The first matching slots of the order (at least the number wanted, if there are as many), checking the
+             order in chunks of growing size so that searches for a page of common values stop early
+    """
+    if wanted is None:
+        return order[mask[order]]
+    matching, found, start, chunk_size = [], 0, 0, FIRST_SCAN_CHUNK_SIZE
+    while start < len(order) and found < wanted:
+        chunk = order[start:start + chunk_size]
+        matching.append(chunk[mask[chunk]])
+        found += len(matching[-1])
+        start, chunk_size = start + chunk_size, chunk_size * 2
+    return np.concatenate(matching) if matching else order[:0]
+
+
+def _object_array(values, size: int = None):
+    array = np.empty(len(values) if size is None else size, dtype=object)
+    array[:len(values)] = values if isinstance(values, np.ndarray) else list(values)
+    return array
+
+
+class ColumnarSearchEngine:
+    """
+    Thread-safe holder of the process' columnar snapshot, which keeps it up to date with the writes made through
+    `database_interface`, and answers the searches it can from it
+    """
+
+    def __init__(self, row_columns: List[str], integer_columns: List[str], max_age_seconds: float = 300):
+        """
+        :param row_columns: Names of the columns of the rows returned by searches, in order
+        :param integer_columns: Names of the row columns holding integers
+        :param max_age_seconds: The snapshot is loaded again once this old, to pick up writes made by other processes.
+                                0 to never load it again.
+        """
+        self._lock = threading.Lock()
+        self.row_columns = row_columns
+        self.integer_columns = integer_columns
+        self.max_age_seconds = max_age_seconds
+        self._snapshot = None
+        self._reload = True  # Whether the snapshot must be loaded in full, eg. after writes to unknown shows
+        self._pending_show_ids = set()  # show_ids written since the snapshot
+        self._refreshing = False
+        self._failed_at = None  # time.monotonic() of the last load which failed with an error
+        self.error = None
+        self.searches = 0
+        self.database_searches = 0  # Searches which the snapshot couldn't answer
+        self.loads = 0
+        self.incremental_refreshes = 0
+
+    def invalidate(self, show_ids: List[int] = None):
+        """
+        Record that shows were written, so that their rows are read again before the next search
+        :param show_ids: show_ids of the only shows written, or None if unknown (the snapshot is then loaded in full)
+        """
+        with self._lock:
+            if show_ids is None:
+                self._reload = True
+            else:
+                self._pending_show_ids.update(show_ids)
+
+    def _expired(self, since: float):
+        return 0 < self.max_age_seconds <= time.monotonic() - since
+
+    def current_snapshot(self, db_session, load_rows):
+        """
+        The snapshot, brought up to date with the writes recorded so far. The first request which finds it outdated
+        refreshes it, without holding the lock (which would block the event loop when called via `run_sync`).
+        :param db_session: SQLAlchemy Session used to read the rows
+        :param load_rows: Function(db_session, show_ids=None) returning the rows of the given shows (or of every show)
+        :return: (ColumnarShowSnapshot) The snapshot, or None if it isn't up to date (as it is being refreshed by
+                 another request) or can't be loaded
+        """
+        with self._lock:
+            if self._failed_at is not None and not self._reload and not self._expired(self._failed_at):
+                return None
+            full_load = self._snapshot is None or self._reload or self._expired(self._snapshot.loaded_at)
+            if not full_load and not self._pending_show_ids:
+                return self._snapshot
+            if self._refreshing:
+                up_to_date = self._snapshot is not None and not self._reload and not self._pending_show_ids
+                return self._snapshot if up_to_date else None  # Only expired, which can still be served meanwhile
+            self._refreshing = True
+            self._reload = False
+            pending_show_ids, self._pending_show_ids = self._pending_show_ids, set()
+            snapshot = self._snapshot
+
+        try:
+            if full_load:
+                snapshot = ColumnarShowSnapshot.build(db_session.get_bind().dialect.name, self.row_columns,
+                                                      self.integer_columns, load_rows(db_session))
+            else:
+                rows = load_rows(db_session, show_ids=sorted(pending_show_ids))
+                snapshot = snapshot.with_changes(rows, pending_show_ids - {row["show_id"] for row in rows})
+        except ValueError as e:  # The table can't be held by a snapshot, so every search goes to the database
+            with self._lock:
+                self._refreshing = False
+                self._snapshot, self._failed_at, self.error = None, time.monotonic(), str(e)
+            return None
+        except Exception:
+            with self._lock:
+                self._refreshing = False
+                self._reload = self._reload or full_load
+                self._pending_show_ids |= pending_show_ids
+            raise
+
+        with self._lock:
+            self._refreshing = False
+            self._snapshot, self._failed_at, self.error = snapshot, None, None
+            if full_load:
+                self.loads += 1
+            else:
+                self.incremental_refreshes += 1
+            if self._reload or self._pending_show_ids:
+                return None  # Written to again while refreshing
+        return snapshot
+
+    def search(self, db_session, load_rows, filter_args, skip: int = None, limit: int = None, order_by: str = None,
+               descending: bool = False, q: str = None, cursor=None):
+        """
+        Answer a search from the snapshot, when it can be answered exactly like the database would
+        :param load_rows: See `current_snapshot`
+        :return: (list) The rows of the results, like `database_interface.search_netflix_show_rows`, or None if the
+                 search must be run by the database
+        """
+        rows = None
+        if not q:
+            snapshot = self.current_snapshot(db_session, load_rows)
+            if snapshot is not None:
+                rows = snapshot.search(filter_args, skip=skip, limit=limit, order_by=order_by, descending=descending,
+                                       cursor=cursor)
+        with self._lock:
+            self.searches += 1
+            if rows is None:
+                self.database_searches += 1
+        return rows
+
+    def describe(self):
+        """
+        :return: (dict) The state of the snapshot and the number of searches it answered, matching the fields of
+                 `api_models.ColumnarSearchStatusModel`
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "loaded": snapshot is not None,
+                "dialect": snapshot.dialect_name if snapshot is not None else None,
+                "shows": snapshot.number_of_shows if snapshot is not None else None,
+                "slots": len(snapshot.show_ids) if snapshot is not None else None,
+                "age_seconds": time.monotonic() - snapshot.loaded_at if snapshot is not None else None,
+                "max_age_seconds": self.max_age_seconds,
+                "pending_writes": len(self._pending_show_ids),
+                "reload_pending": self._reload,
+                "searches": self.searches,
+                "database_searches": self.database_searches,
+                "loads": self.loads,
+                "incremental_refreshes": self.incremental_refreshes,
+                "error": self.error,
+            }
@@ -1,6 +1,14 @@
-from sqlalchemy import Column, Date, Integer, String
+from datetime import datetime
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, String, func
 from fast_api_challenge.database.base import Base
 
+# Columns which can be used to order searches. Each gets a (column, show_id) index so keyset pagination is a seek
+ORDERABLE_COLUMNS = ["type", "title", "director", "cast", "country", "date_added", "release_year", "rating", "duration",
+                     "listed_in", "description"]
+# Columns parsed from the date_added and duration strings (see `typed_columns`), indexed for range filters
+TYPED_COLUMNS = ["date_added_on", "duration_minutes", "seasons"]
+
 
 class NetflixShow(Base):
     __tablename__ = "netflix"
@@ -11,12 +19,22 @@ class NetflixShow(Base):
     director = Column(String)
     cast = Column(String)
     country = Column(String)
-    date_added = Column(String)  # TODO: Possibly sanitize table data and use formal dates, not priority
+    date_added = Column(String)  # Free-form, as in the dataset. Parsed into date_added_on
     release_year = Column(Integer)  # This should be only positive, enforced in API.
     rating = Column(String)
-    duration = Column(String)
+    duration = Column(String)  # eg. "90 min" or "3 Seasons". Parsed into duration_minutes or seasons
     listed_in = Column(String)
     description = Column(String)
+    # Incremented (and updated_at set) by every write to a row, to identify versions of a show in conditional requests
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.current_timestamp())
+    # Typed values of the date_added and duration strings, NULL where they can't be parsed
+    date_added_on = Column(Date)
+    duration_minutes = Column(Integer)
+    seasons = Column(Integer)
+
+    __table_args__ = tuple(Index(f"ix_netflix_{column_name}_show_id", column_name, "show_id")
+                           for column_name in ORDERABLE_COLUMNS + TYPED_COLUMNS)
 
     def dict(self):
         """
@@ -26,4 +44,70 @@ class NetflixShow(Base):
         for key, value in self.__dict__.items():
             if not key.startswith("_"):  # Doesn't return protected values which are not actually class variables but are python builtins
                 return_dict[key] = value
-        return return_dict
\ No newline at end of file
+        return return_dict
+
+
+# Normalized entities of the comma separated director, cast, country and listed_in strings of shows. The strings remain
+# the source of the show fields returned by the Api, and the tables below are kept in sync with them on every write
+# (see `show_entities`), so that shows can be filtered and counted by individual people, countries and genres.
+
+class Person(Base):
+    __tablename__ = "person"
+
+    person_id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+class Country(Base):
+    __tablename__ = "country"
+
+    country_id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+class Genre(Base):
+    __tablename__ = "genre"
+
+    genre_id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+def _show_id_foreign_key():
+    return Column(Integer, ForeignKey("netflix.show_id", ondelete="CASCADE"), primary_key=True)
+
+
+class NetflixShowDirector(Base):
+    __tablename__ = "netflix_show_director"
+
+    show_id = _show_id_foreign_key()
+    person_id = Column(Integer, ForeignKey("person.person_id"), primary_key=True)
+
+    # The primary key serves lookups by show, this index serves lookups of the shows of an entity
+    __table_args__ = (Index("ix_netflix_show_director_person_id_show_id", "person_id", "show_id"),)
+
+
+class NetflixShowCast(Base):
+    __tablename__ = "netflix_show_cast"
+
+    show_id = _show_id_foreign_key()
+    person_id = Column(Integer, ForeignKey("person.person_id"), primary_key=True)
+
+    __table_args__ = (Index("ix_netflix_show_cast_person_id_show_id", "person_id", "show_id"),)
+
+
+class NetflixShowCountry(Base):
+    __tablename__ = "netflix_show_country"
+
+    show_id = _show_id_foreign_key()
+    country_id = Column(Integer, ForeignKey("country.country_id"), primary_key=True)
+
+    __table_args__ = (Index("ix_netflix_show_country_country_id_show_id", "country_id", "show_id"),)
+
+
+class NetflixShowGenre(Base):
+    __tablename__ = "netflix_show_genre"
+
+    show_id = _show_id_foreign_key()
+    genre_id = Column(Integer, ForeignKey("genre.genre_id"), primary_key=True)
+
+    __table_args__ = (Index("ix_netflix_show_genre_genre_id_show_id", "genre_id", "show_id"),)
@@ -0,0 +1,152 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+"""
+Live usage statistics for SQLAlchemy connection pools.
+
+Checkouts, checkins, new connections and invalidations are counted with pool events. The time spent waiting for a
+connection (including any overflow connection being opened) is measured by the instrumented pool classes below, which
+are used in place of the default QueuePool.
+"""
+
+
+class PoolStatistics:
+    """
+    Thread-safe counters describing the usage of a connection pool
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checkout_timeouts = 0
+        self.peak_checked_out = 0
+        self.checked_out = 0
+        self.timed_checkouts = 0
+        self.total_checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def record_invalidate(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_checkout_wait(self, wait_seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.timed_checkouts += 1
+            self.total_checkout_wait_seconds += wait_seconds
+            self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, wait_seconds)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+
+class _InstrumentedPoolMixin:
+    """
+    Records how long each checkout waited for a connection into the pool's PoolStatistics
+    """
+    statistics: PoolStatistics = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            if self.statistics is not None:
+                self.statistics.record_checkout_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.statistics is not None:
+            self.statistics.record_checkout_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        new_pool = super().recreate()  # Pools are recreated when disposed or after a disconnect error
+        new_pool.statistics = self.statistics
+        return new_pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def attach_pool_statistics(engine):
+    """
+    Start collecting statistics for the connection pool of the given engine.
+    :param engine: SQLAlchemy Engine (for an AsyncEngine, use its `sync_engine`)
+    :return: (PoolStatistics) The statistics, which are updated as the pool is used
+    """
+    statistics = PoolStatistics()
+    event.listen(engine, "connect", lambda dbapi_connection, connection_record: statistics.record_connect())
+    event.listen(engine, "checkout",
+                 lambda dbapi_connection, connection_record, connection_proxy: statistics.record_checkout())
+    event.listen(engine, "checkin", lambda dbapi_connection, connection_record: statistics.record_checkin())
+    event.listen(engine, "invalidate",
+                 lambda dbapi_connection, connection_record, exception: statistics.record_invalidate())
+    if isinstance(engine.pool, _InstrumentedPoolMixin):
+        engine.pool.statistics = statistics
+    return statistics
+
+
+def describe_pool(engine, statistics: PoolStatistics, external_pooler: bool = False):
+    """
+    Live description of the connection pool of the given engine, combining the pool's current state with the
+    collected statistics.
+    :param engine: SQLAlchemy Engine (for an AsyncEngine, use its `sync_engine`)
+    :param statistics: The engine's PoolStatistics, from `attach_pool_statistics`
+    :param external_pooler: Whether connections are pooled by an external pooler such as PgBouncer
+    :return: (dict) Pool description, matching the fields of `api_models.DatabasePoolStatusModel`
+    """
+    pool = engine.pool
+    description = {
+        "pool_class": type(pool).__name__,
+        "external_pooler": external_pooler,
+        "size": None,
+        "max_overflow": None,
+        "timeout_seconds": None,
+        "checked_in": None,
+        "checked_out": statistics.checked_out,
+        "overflow": None,
+        "saturated": False,
+        "connections_created": statistics.connections_created,
+        "checkouts": statistics.checkouts,
+        "checkins": statistics.checkins,
+        "invalidations": statistics.invalidations,
+        "peak_checked_out": statistics.peak_checked_out,
+        "checkout_timeouts": statistics.checkout_timeouts,
+        "average_checkout_wait_ms": None,
+        "max_checkout_wait_ms": None,
+    }
+    if isinstance(pool, QueuePool):
+        description.update(size=pool.size(), max_overflow=pool._max_overflow, timeout_seconds=pool.timeout(),
+                           checked_in=pool.checkedin(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0))
+        # Once every connection, including overflow connections, is checked out, new checkouts have to wait
+        description["saturated"] = pool._max_overflow > -1 and \
+            pool.checkedout() >= pool.size() + pool._max_overflow
+    if statistics.timed_checkouts:
+        description.update(
+            average_checkout_wait_ms=1000 * statistics.total_checkout_wait_seconds / statistics.timed_checkouts,
+            max_checkout_wait_ms=1000 * statistics.max_checkout_wait_seconds)
+    return description
@@ -0,0 +1,213 @@
+import contextlib
+import itertools
+import threading
+import time
+from typing import List
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+"""
+Routing of read-only queries to read replicas of the primary database.
+
+Queries go to the primary, unless they are made within `replica_reads`, which `database_interface` uses for searches,
+show reads and counts. Those reads are sent to the replicas in round-robin order, skipping the replicas whose last
+health check failed or found them lagging behind the primary by more than the max lag. Reads still go to the primary:
+- when no replica is healthy
+- once the session has written to the primary (until it is closed), so a request reads its own writes (eg.
+  `create_netflix_show` returns the show it has just created)
+- for `read_your_writes_seconds` after this process committed a write, so that a read right after a write (which is
+  then cached) doesn't return what the replicas had before it
+
+Health checks run at most every `health_check_interval_seconds` per replica, when a read is routed, and a replica is
+marked unhealthy as soon as one of its connections is found disconnected.
+"""
+
+READ_FROM_REPLICA = "read_from_replica"  # Session.info key set by `replica_reads`
+HAS_WRITTEN = "has_written"  # Session.info key set once the session has sent a write to the primary
+
+# Seconds the replica's last replayed transaction is behind the primary. 0 when it has replayed everything it received,
+# as pg_last_xact_replay_timestamp() doesn't advance while the primary is idle.
+POSTGRES_LAG_QUERY = "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 " \
+                     "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+
+
+class Replica:
+    """
+    A read replica's engine, and the outcome of its last health check
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.healthy = True  # Until checked
+        self.lag_seconds = None
+        self.checked_at = None  # time.monotonic() of the last health check
+        self.error = None
+        self.reads = 0
+
+
+class ReplicaRouter:
+    """
+    Thread-safe choice of the engine of each read, shared by every session of the process
+    """
+
+    def __init__(self, replica_engines: List[Engine], max_lag_seconds: float = 10,
+                 read_your_writes_seconds: float = 5, health_check_interval_seconds: float = 5):
+        """
+        :param replica_engines: Engines of the replicas (the `sync_engine` of asyncio engines)
+        :param max_lag_seconds: Replicas lagging further behind the primary are not read from
+        :param read_your_writes_seconds: Reads go to the primary for this long after this process commits a write
+        :param health_check_interval_seconds: Min seconds between the health checks of a replica
+        """
+        self._lock = threading.Lock()
+        self.replicas = [Replica(replica_engine) for replica_engine in replica_engines]
+        self.max_lag_seconds = max_lag_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.health_check_interval_seconds = health_check_interval_seconds
+        self._next_replica = itertools.count()
+        self._last_write_at = None
+        self.primary_reads = 0
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self._disconnect_handler(replica))
+
+    @staticmethod
+    def _disconnect_handler(replica: Replica):
+        def handle_error(context):
+            if context.is_disconnect:
+                replica.healthy = False
+                replica.error = str(context.original_exception)
+        return handle_error
+
+    def record_write(self):
+        with self._lock:
+            self._last_write_at = time.monotonic()
+
+    def check_health(self, replica: Replica):
+        """
+        Check that the replica can be queried, and how far behind the primary it is
+        """
+        try:
+            with replica.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag_seconds = float(connection.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag_seconds = 0.0
+        except Exception as error:
+            replica.healthy, replica.lag_seconds, replica.error = False, None, str(error)
+        else:
+            replica.healthy, replica.lag_seconds = lag_seconds <= self.max_lag_seconds, lag_seconds
+            replica.error = None if replica.healthy else f"Lagging {lag_seconds:.1f}s behind the primary."
+
+    def read_engine(self):
+        """
+        :return: The engine of the replica to send the next read to, or None to read from the primary
+        """
+        now = time.monotonic()
+        with self._lock:
+            recently_written = self._last_write_at is not None and \
+                now - self._last_write_at < self.read_your_writes_seconds
+            first = next(self._next_replica)
+        if not recently_written:
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(first + offset) % len(self.replicas)]
+                if replica.checked_at is None or now - replica.checked_at >= self.health_check_interval_seconds:
+                    replica.checked_at = now  # Before checking, so that concurrent reads don't check it too
+                    self.check_health(replica)
+                if replica.healthy:
+                    with self._lock:
+                        replica.reads += 1
+                    return replica.engine
+        with self._lock:
+            self.primary_reads += 1
+        return None
+
+    def describe(self):
+        """
+        :return: (dict) The replicas' status, matching the fields of `api_models.DatabaseReplicasStatusModel`
+        """
+        now = time.monotonic()
+        return {
+            "max_lag_seconds": self.max_lag_seconds,
+            "read_your_writes_seconds": self.read_your_writes_seconds,
+            "primary_reads": self.primary_reads,
+            "replicas": [{
+                "url": repr(replica.engine.url),  # Without the password
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag_seconds,
+                "seconds_since_check": now - replica.checked_at if replica.checked_at is not None else None,
+                "error": replica.error,
+                "reads": replica.reads,
+            } for replica in self.replicas],
+        }
+
+
+@contextlib.contextmanager
+def replica_reads(db_session: Session):
+    """
+    Send the queries made with the session within this context to a read replica, when the session routes reads (is a
+    `RoutingSession`). Has no effect on other sessions.
+    """
+    previous = db_session.info.get(READ_FROM_REPLICA, False)
+    db_session.info[READ_FROM_REPLICA] = True
+    try:
+        yield
+    finally:
+        db_session.info[READ_FROM_REPLICA] = previous
+
+
+@contextlib.contextmanager
+def primary_reads(db_session: Session):
+    """
+    Send the queries made with the session within this context to the primary, even within `replica_reads`
+    """
+    previous = db_session.info.get(READ_FROM_REPLICA, False)
+    db_session.info[READ_FROM_REPLICA] = False
+    try:
+        yield
+    finally:
+        db_session.info[READ_FROM_REPLICA] = previous
+
+
+class RoutingSession(Session):
+    """
+    Session bound to the primary, which sends the reads made within `replica_reads` to the engine chosen by its router
+    """
+
+    def __init__(self, router: ReplicaRouter = None, **kwargs):
+        super().__init__(**kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        reading = self.info.get(READ_FROM_REPLICA, False)
+        if self._flushing or (clause is not None and clause.is_dml) or (not reading and not isinstance(clause, Select)):
+            # Outside of `replica_reads`, anything but a SELECT (eg. DDL, text or the connection itself) may write
+            self.info[HAS_WRITTEN] = True
+        elif reading and not self.info.get(HAS_WRITTEN) and isinstance(clause, Select) and self.router is not None:
+            replica_engine = self.router.read_engine()
+            if replica_engine is not None:
+                return replica_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def commit(self):
+        super().commit()
+        if self.info.get(HAS_WRITTEN) and self.router is not None:
+            self.router.record_write()
+
+    def close(self):
+        super().close()
+        self.info.pop(HAS_WRITTEN, None)
+
+
+class RoutingAsyncSession(AsyncSession):
+    """
+    AsyncSession whose underlying Session is a `RoutingSession`
+    """
+
+    def __init__(self, bind=None, router: ReplicaRouter = None, **kwargs):
+        super().__init__(bind=bind, **kwargs)
+        self.sync_session = self._proxied = RoutingSession(router=router, bind=self.sync_session.bind, future=True,
+                                                           **kwargs)
@@ -0,0 +1,88 @@
+import os
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from fast_api_challenge.database import orm, search_index, show_entities
+from fast_api_challenge.database.orm import Base
+
+"""
+Preparation of the database schema when the Api starts, according to `utils.DB_SCHEMA_STARTUP`:
+- "create": create any missing table and search index, which connects to the database and checks each of them
+- "migrated": skip that when the database's Alembic revision is already the latest migration, which only reads the
+  alembic_version table (on a connection which is kept in the pool for the first request), and create them otherwise
+- "skip": don't touch the database at all, so that the engine only connects on the first request. The schema must be
+  migrated beforehand (eg. `alembic upgrade head` when deploying).
+"""
+
+SCHEMA_STARTUP_MODES = ("create", "migrated", "skip")
+ALEMBIC_VERSIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic", "versions")
+REVISION_PATTERN = re.compile(r"^revision\s*=\s*['\"](\w+)['\"]", re.MULTILINE)
+DOWN_REVISION_PATTERN = re.compile(r"^down_revision\s*=\s*(.+)$", re.MULTILINE)  # None, a revision or a tuple
+
+
+def create_schema(engine: Engine):
+    """
+    Create the tables and search indexes which don't exist yet. Join tables created for a Netflix table which already
+    has shows are filled from their strings, as their migration does.
+    """
+    inspector = inspect(engine)
+    netflix_existed = inspector.has_table(orm.NetflixShow.__tablename__)
+    new_relations = [relation for relation in show_entities.RELATIONS
+                     if not inspector.has_table(relation.link.__tablename__)]
+    Base.metadata.create_all(bind=engine)
+    search_index.create_search_index(engine)
+    if netflix_existed and new_relations:
+        with Session(bind=engine) as db_session:
+            show_entities.backfill_show_entities(db_session, new_relations)
+
+
+def alembic_head_revisions(versions_directory: str = ALEMBIC_VERSIONS_DIRECTORY):
+    """
+    The revisions of the latest migrations, read from the revision identifiers of the migration scripts rather than
+    by loading them with Alembic, which is much slower to import
+    :return: (set) Revisions which no other migration revises
+    """
+    revisions, revised = set(), set()
+    for file_name in os.listdir(versions_directory):
+        if not file_name.endswith(".py"):
+            continue
+        with open(os.path.join(versions_directory, file_name), "r") as script:
+            source = script.read()
+        revision = REVISION_PATTERN.search(source)
+        if revision:
+            revisions.add(revision.group(1))
+            down_revision = DOWN_REVISION_PATTERN.search(source)
+            revised.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)) if down_revision else [])
+    return revisions - revised
+
+
+def schema_is_migrated(engine: Engine, versions_directory: str = ALEMBIC_VERSIONS_DIRECTORY):
+    """
+    :return: Bool, whether the database's Alembic revision is the latest migration
+    """
+    try:
+        with engine.connect() as connection:
+            current_revisions = {row[0] for row in connection.execute(text("SELECT version_num FROM alembic_version"))}
+    except DBAPIError:
+        return False  # Not migrated with Alembic
+    return bool(current_revisions) and current_revisions == alembic_head_revisions(versions_directory)
+
+
+def prepare_schema(engine: Engine, mode: str = "create"):
+    """
+    :param mode: One of SCHEMA_STARTUP_MODES
+    :return: (str) What was done: "created", "migrated" (the schema was up to date), or "skipped"
+    """
+    if mode not in SCHEMA_STARTUP_MODES:
+        raise ValueError(f"Invalid schema startup mode '{mode}', expected one of: {', '.join(SCHEMA_STARTUP_MODES)}.")
+    if mode == "skip":
+        return "skipped"
+    if mode == "migrated" and schema_is_migrated(engine):
+        return "migrated"
+    create_schema(engine)
+    return "created"
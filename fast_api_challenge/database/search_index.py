@@ -0,0 +1,187 @@
+import re
+
+from sqlalchemy import false, func, literal_column, select, table, column, text
+from sqlalchemy.engine import Engine
+
+from fast_api_challenge.database.orm import NetflixShow
+
+"""
+Full-text and trigram search indexes for the Netflix table.
+
+Postgres uses a generated, weighted `tsvector` column with a GIN index for ranked full-text search, along with pg_trgm
+GIN indexes so the substring (LIKE '%value%') filters of the Search endpoint can be served by an index. SQLite (used
+locally and in tests) uses an external-content FTS5 table which is kept in sync with the Netflix table via triggers.
+"""
+
+SEARCHABLE_COLUMNS = ["title", "description", "cast", "director", "listed_in"]
+
+# Relative weights of each searchable column, used to rank matches. Postgres only supports four weight classes (A-D)
+POSTGRES_COLUMN_WEIGHTS = {"title": "A", "director": "B", "cast": "B", "listed_in": "C", "description": "D"}
+SQLITE_COLUMN_WEIGHTS = {"title": 10.0, "director": 4.0, "cast": 4.0, "listed_in": 2.0, "description": 1.0}
+
+POSTGRES_TEXT_SEARCH_CONFIG = "english"
+SQLITE_FTS_TABLE = "netflix_fts"
+
+
+def _quoted_columns(prefix: str = ""):
+    return ", ".join(f'{prefix}"{column_name}"' for column_name in SEARCHABLE_COLUMNS)
+
+
+def _postgres_ddl():
+    search_vector = " || ".join(
+        f"setweight(to_tsvector('{POSTGRES_TEXT_SEARCH_CONFIG}', coalesce(\"{column_name}\", '')), "
+        f"'{POSTGRES_COLUMN_WEIGHTS[column_name]}')"
+        for column_name in SEARCHABLE_COLUMNS)
+
+    statements = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"ALTER TABLE netflix ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({search_vector}) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_netflix_search_vector ON netflix USING GIN (search_vector)",
+    ]
+    for column_name in SEARCHABLE_COLUMNS:
+        statements.append(f'CREATE INDEX IF NOT EXISTS ix_netflix_{column_name}_trgm '
+                          f'ON netflix USING GIN ("{column_name}" gin_trgm_ops)')
+    return statements
+
+
+def _sqlite_ddl():
+    new_values = _quoted_columns(prefix="new.")
+    old_values = _quoted_columns(prefix="old.")
+    columns = _quoted_columns()
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5({columns}, content='netflix', "
+        f"content_rowid='show_id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_after_insert AFTER INSERT ON netflix BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, {columns}) VALUES (new.show_id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_after_delete AFTER DELETE ON netflix BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.show_id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_after_update AFTER UPDATE ON netflix BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.show_id, {old_values}); "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, {columns}) VALUES (new.show_id, {new_values}); END",
+        f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",  # Index any pre-existing rows
+    ]
+
+
+def create_search_index(bind):
+    """
+    Create the full-text and trigram search indexes for the Netflix table, if they do not already exist.
+    :param bind: SQLAlchemy Engine or Connection for a database which already contains the Netflix table
+    :return: None
+    """
+    dialect_name = bind.dialect.name
+    if dialect_name == "postgresql":
+        statements = _postgres_ddl()
+    elif dialect_name == "sqlite":
+        if _sqlite_search_index_exists(bind):
+            return  # The triggers keep an existing index up to date, so there is no need to rebuild it
+        statements = _sqlite_ddl()
+    else:
+        raise NotImplementedError(f"Full-text search is not supported for the '{dialect_name}' database dialect.")
+
+    _execute_statements(bind, statements)
+
+
+def drop_search_index(bind):
+    """
+    Remove the full-text and trigram search indexes created by `create_search_index`.
+    :param bind: SQLAlchemy Engine or Connection
+    :return: None
+    """
+    dialect_name = bind.dialect.name
+    if dialect_name == "postgresql":
+        statements = [f"DROP INDEX IF EXISTS ix_netflix_{column_name}_trgm" for column_name in SEARCHABLE_COLUMNS]
+        statements += ["DROP INDEX IF EXISTS ix_netflix_search_vector",
+                       "ALTER TABLE netflix DROP COLUMN IF EXISTS search_vector"]
+    elif dialect_name == "sqlite":
+        statements = [f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_after_{event}"
+                      for event in ("insert", "delete", "update")]
+        statements += [f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}"]
+    else:
+        raise NotImplementedError(f"Full-text search is not supported for the '{dialect_name}' database dialect.")
+
+    _execute_statements(bind, statements)
+
+
+def _execute_statements(bind, statements):
+    if isinstance(bind, Engine):  # Run everything in one transaction
+        with bind.begin() as connection:
+            _execute_statements(connection, statements)
+        return
+    for statement in statements:
+        bind.execute(text(statement))
+
+
+def _sqlite_search_index_exists(bind):
+    query = text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name")
+    if isinstance(bind, Engine):
+        with bind.connect() as connection:
+            return connection.execute(query, {"name": SQLITE_FTS_TABLE}).first() is not None
+    return bind.execute(query, {"name": SQLITE_FTS_TABLE}).first() is not None
+
+
+def _sqlite_match_expression(query_text: str):
+    """
+    Convert free text into an FTS5 MATCH expression. Every word is quoted so that user input can never be interpreted
+    as FTS5 query syntax, and words are implicitly AND-ed together.
+    """
+    words = re.findall(r"\w+", query_text)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def full_text_query_value(query_text: str, dialect_name: str):
+    """
+    The value to bind as the query of `apply_full_text_match`, for the given free text
+    :return: (str) The query, or None if the free text can't match anything
+    """
+    if dialect_name == "postgresql":
+        return query_text
+    if dialect_name == "sqlite":
+        return _sqlite_match_expression(query_text) or None
+    raise NotImplementedError(f"Full-text search is not supported for the '{dialect_name}' database dialect.")
+
+
+def apply_full_text_search(db_query, query_text: str, dialect_name: str, rank: bool = True):
+    """
+    Restrict a query over the Netflix table to the shows matching the given free text, optionally ordering the results
+    by relevance (most relevant first).
+    :param db_query: SQLAlchemy Query or Select over the NetflixShow ORM model
+    :param query_text: Free text to search for within the searchable columns
+    :param dialect_name: Name of the database dialect the query will run against (eg. "postgresql", "sqlite")
+    :param rank: Whether or not to order the results by relevance
+    :return: The modified query
+    """
+    query_value = full_text_query_value(query_text, dialect_name)
+    if query_value is None:
+        return db_query.where(false())
+    return apply_full_text_match(db_query, query_value, dialect_name, rank=rank)
+
+
+def apply_full_text_match(db_query, query_value, dialect_name: str, rank: bool = True):
+    """
+    `apply_full_text_search`, for a query value from `full_text_query_value`, which can be given as a bound parameter
+    so that the resulting statement can be reused for other queries
+    """
+    if dialect_name == "postgresql":
+        ts_query = func.plainto_tsquery(POSTGRES_TEXT_SEARCH_CONFIG, query_value)
+        search_vector = literal_column("netflix.search_vector")
+        db_query = db_query.where(search_vector.op("@@")(ts_query))
+        if rank:
+            db_query = db_query.order_by(func.ts_rank_cd(search_vector, ts_query).desc())
+        return db_query
+
+    if dialect_name == "sqlite":
+        fts_table = table(SQLITE_FTS_TABLE, column("rowid"), column(SQLITE_FTS_TABLE))
+        weights = ", ".join(str(SQLITE_COLUMN_WEIGHTS[column_name]) for column_name in SEARCHABLE_COLUMNS)
+        matches = select(fts_table.c.rowid.label("show_id"),
+                         literal_column(f"bm25({SQLITE_FTS_TABLE}, {weights})").label("score")) \
+            .where(fts_table.c[SQLITE_FTS_TABLE].op("MATCH")(query_value)) \
+            .subquery()
+        db_query = db_query.join(matches, matches.c.show_id == NetflixShow.show_id)
+        if rank:
+            db_query = db_query.order_by(matches.c.score)  # bm25 scores are negative, lower is more relevant
+        return db_query
+
+    raise NotImplementedError(f"Full-text search is not supported for the '{dialect_name}' database dialect.")
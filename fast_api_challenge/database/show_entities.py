@@ -0,0 +1,178 @@
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from fast_api_challenge.database import orm
+
+"""
+Normalization of the comma separated director, cast, country and listed_in strings of shows into the person, country
+and genre tables and their join tables.
+
+The strings stay on the Netflix table as the source of the show fields returned by the Api. Every write to the table
+made through `database_interface` calls `sync_show_entities` (or `delete_show_entities`) in the same transaction, so
+that the join tables always match the strings, and exact-match filters and counts by individual names can be served by
+their indexes instead of LIKE '%name%' scans.
+"""
+
+MAX_NAMES_PER_STATEMENT = 500  # Bounds the number of bound parameters of the IN lists below
+BACKFILL_BATCH_SIZE = 1000  # Shows read per statement and committed per transaction by `backfill_show_entities`
+
+
+class ShowEntityRelation:
+    """
+    How one string column of the Netflix table is normalized: into which entity table, via which join table
+    """
+
+    def __init__(self, show_column_name: str, entity, link):
+        self.show_column_name = show_column_name
+        self.entity = entity  # ORM class of the entity table, with an id column and a unique name
+        self.link = link  # ORM class of the join table, with show_id and the id of the entity
+        self.entity_id_name = entity.__table__.primary_key.columns.values()[0].name
+
+    @property
+    def entity_id(self):
+        return getattr(self.entity, self.entity_id_name)
+
+    @property
+    def link_entity_id(self):
+        return getattr(self.link, self.entity_id_name)
+
+
+RELATIONS = [
+    ShowEntityRelation("director", orm.Person, orm.NetflixShowDirector),
+    ShowEntityRelation("cast", orm.Person, orm.NetflixShowCast),
+    ShowEntityRelation("country", orm.Country, orm.NetflixShowCountry),
+    ShowEntityRelation("listed_in", orm.Genre, orm.NetflixShowGenre),
+]
+RELATIONS_BY_COLUMN = {relation.show_column_name: relation for relation in RELATIONS}
+
+# Exact-match search filters (fields of `NetflixShowSearchModel`), and the column whose entities they match
+EXACT_MATCH_FILTERS = {"director_name": "director", "cast_member": "cast", "country_name": "country",
+                       "genre": "listed_in"}
+
+
+def split_names(value: str):
+    """
+    :param value: Comma separated names, eg. "Sami Bouajila, Tracy Gotoas"
+    :return: (list) The distinct, stripped, non-empty names, in their original order
+    """
+    if not value:
+        return []
+    names = (name.strip() for name in value.split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def _batches(items: list, batch_size: int = MAX_NAMES_PER_STATEMENT):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _insert_ignoring_existing(db_session: Session, table, index_elements: list):
+    dialect_name = db_session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=index_elements)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=index_elements)
+    return table.insert()
+
+
+def _entity_ids(db_session: Session, entity, entity_id_name: str, names: list):
+    """
+    :return: (dict) The id of each name in the entity table, creating the names which don't exist yet
+    """
+    ids = {}
+    entity_id = getattr(entity, entity_id_name)
+    for batch in _batches(names):
+        ids.update(db_session.execute(select(entity.name, entity_id).where(entity.name.in_(batch))).all())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        db_session.execute(_insert_ignoring_existing(db_session, entity.__table__, ["name"]),
+                           [{"name": name} for name in missing])
+        for batch in _batches(missing):
+            ids.update(db_session.execute(select(entity.name, entity_id).where(entity.name.in_(batch))).all())
+    return ids
+
+
+def delete_show_entities(db_session: Session, show_ids: list):
+    """
+    Remove the given shows from the join tables (the entities themselves are kept). Does not commit.
+    """
+    for relation in RELATIONS:
+        for batch in _batches(list(show_ids)):
+            db_session.execute(relation.link.__table__.delete().where(relation.link.show_id.in_(batch)))
+
+
+def sync_show_entities(db_session: Session, shows: dict, new_shows: bool = False):
+    """
+    Rebuild the join table rows of the given shows from their strings. Does not commit.
+    :param db_session: SQLAlchemy DB session object
+    :param shows: The values written to each show, by show_id: mappings with the director, cast, country and listed_in
+                  strings (eg. from `NetflixShowModel.dict()`)
+    :param new_shows: Whether the shows were just created, so have no join table rows to remove
+    """
+    if not shows:
+        return
+    if not new_shows:
+        delete_show_entities(db_session, list(shows))
+
+    for relation in RELATIONS:
+        _link_show_entities(db_session, shows, relation)
+
+
+def _link_show_entities(db_session: Session, shows: dict, relation: ShowEntityRelation):
+    """
+    Insert the join table rows of a relation for the given shows, which have none yet
+    """
+    names_by_show = {show_id: split_names(values.get(relation.show_column_name)) for show_id, values in shows.items()}
+    all_names = list(dict.fromkeys(name for names in names_by_show.values() for name in names))
+    if not all_names:
+        return
+    ids = _entity_ids(db_session, relation.entity, relation.entity_id_name, all_names)
+    db_session.execute(relation.link.__table__.insert(),
+                       [{"show_id": show_id, relation.entity_id_name: ids[name]}
+                        for show_id, names in names_by_show.items() for name in names])
+
+
+def backfill_show_entities(db_session: Session, relations: list = RELATIONS, batch_size: int = BACKFILL_BATCH_SIZE):
+    """
+    Fill the empty join tables of the given relations from the strings of every existing show, eg. once they were
+    created for a database whose Netflix table already has shows. Commits every `batch_size` shows.
+    :return: (int) Number of shows read
+    """
+    columns = [orm.NetflixShow.show_id] + [getattr(orm.NetflixShow, relation.show_column_name)
+                                           for relation in relations]
+    last_show_id, shows_read = None, 0
+    while True:
+        statement = select(*columns).order_by(orm.NetflixShow.show_id).limit(batch_size)
+        if last_show_id is not None:
+            statement = statement.where(orm.NetflixShow.show_id > last_show_id)
+        rows = db_session.execute(statement).mappings().all()
+        if not rows:
+            return shows_read
+        last_show_id, shows_read = rows[-1]["show_id"], shows_read + len(rows)
+        shows = {row["show_id"]: row for row in rows}
+        for relation in relations:
+            _link_show_entities(db_session, shows, relation)
+        db_session.commit()
+
+
+def exact_match_predicate(filter_name: str, name):
+    """
+    WHERE clause selecting the shows linked to the entity with exactly the given name, using the unique index on the
+    entity's name and the (entity id, show_id) index of the join table
+    :param filter_name: One of `EXACT_MATCH_FILTERS`
+    :param name: The stripped name, or a bound parameter
+    """
+    relation = RELATIONS_BY_COLUMN[EXACT_MATCH_FILTERS[filter_name]]
+    show_ids = select(relation.link.show_id) \
+        .join(relation.entity, relation.entity_id == relation.link_entity_id) \
+        .where(relation.entity.name == name)
+    return orm.NetflixShow.show_id.in_(show_ids)
+
+
+def count_distinct_entities(show_column_name: str):
+    """
+    Scalar subquery counting the distinct entities linked to at least one show, eg. the countries of shows
+    """
+    relation = RELATIONS_BY_COLUMN[show_column_name]
+    return select(func.count(relation.link_entity_id.distinct())).scalar_subquery()
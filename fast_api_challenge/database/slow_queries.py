@@ -0,0 +1,195 @@
+import collections
+import hashlib
+import re
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+from fast_api_challenge import metrics
+
+"""
+Log of the slow SQL statements executed by the Api, to find which combinations of Search filters need indexes.
+
+Statements which take longer than the threshold are recorded, with event hooks, in a ring buffer of the latest ones:
+their normalized SQL (whitespace collapsed, and lists of bound parameters collapsed to one), the shape of their bound
+parameters (their names and types, never their values), the endpoint and `database_interface` call which executed
+them, and optionally their query plan (`EXPLAIN (ANALYZE, BUFFERS)` on Postgres, `EXPLAIN QUERY PLAN` on SQLite).
+Only SELECT statements are explained, as EXPLAIN ANALYZE executes the statement again, and each normalized statement is
+explained at most once every EXPLAIN_INTERVAL_SECONDS.
+"""
+
+EXPLAIN_INTERVAL_SECONDS = 60
+WHITESPACE_PATTERN = re.compile(r"\s+")
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+# Expanded lists of bound parameters (eg. "IN (?, ?, ?)" or "IN (%(show_id_1_1)s, %(show_id_1_2)s)"), whose length
+# varies with the values
+PARAMETER_LIST_PATTERN = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+))+\s*\)")
+EXPANDED_PARAMETER_PATTERN = re.compile(r"(_\d+)_\d+$")  # Parameters of an expanded list, eg. show_id_1_2 of show_id_1
+
+
+def normalize_statement(statement: str):
+    """
+    :return: (str) The statement with its whitespace collapsed, and its string literals and lists of bound
+             parameters replaced with one placeholder, so that statements which only differ by their values are equal
+    """
+    statement = WHITESPACE_PATTERN.sub(" ", statement).strip()
+    statement = STRING_LITERAL_PATTERN.sub("?", statement)
+    return PARAMETER_LIST_PATTERN.sub("(?...)", statement)
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    """
+    :param parameters: Bound parameters of a statement, as passed to the DBAPI cursor
+    :param executemany: Whether the parameters are a list of sets of parameters
+    :return: (dict) The type name of each parameter, by name (or position), without their values. For executemany
+             statements, the shape of the first set of parameters, with the number of sets in "executemany".
+    """
+    if executemany:
+        parameters = list(parameters or [])
+        shape = parameter_shape(parameters[0]) if parameters else {}
+        return {**shape, "executemany": len(parameters)}
+    if isinstance(parameters, dict):
+        items = parameters.items()
+    else:
+        items = ((str(position), value) for position, value in enumerate(parameters or ()))
+    return {EXPANDED_PARAMETER_PATTERN.sub(r"\1", name): type(value).__name__ for name, value in items}
+
+
+def explain_statement(connection, statement: str, parameters):
+    """
+    Explain a statement with a new cursor of the connection, in a savepoint on Postgres so that a failure can't abort
+    the request's transaction
+    :param connection: SQLAlchemy Connection which executed the statement
+    :return: (list) The lines of the query plan
+    """
+    dialect_name = connection.dialect.name
+    cursor = connection.connection.cursor()  # The statement's own cursor may still have rows to fetch
+    try:
+        if dialect_name == "postgresql":
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                plan = [str(row[0]) for row in cursor.fetchall()]
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return plan
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [" | ".join(str(value) for value in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """
+    Thread-safe ring buffer of the latest statements which took longer than the threshold
+    """
+
+    def __init__(self, threshold_ms: float = 100, size: int = 100, explain: bool = False):
+        self._lock = threading.Lock()
+        self.threshold_ms = threshold_ms  # Negative to disable the log
+        self.size = size
+        self.explain = explain
+        self.queries = collections.deque(maxlen=size)
+        self.slow_queries = 0  # Including those which were dropped from the buffer since
+        self._explained_at = {}  # Fingerprint: time.monotonic() it was last explained
+
+    def _should_explain(self, fingerprint: str, statement: str):
+        if not self.explain or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained_at.get(fingerprint, -EXPLAIN_INTERVAL_SECONDS) < EXPLAIN_INTERVAL_SECONDS:
+                return False
+            self._explained_at = {key: explained_at for key, explained_at in self._explained_at.items()
+                                  if now - explained_at < EXPLAIN_INTERVAL_SECONDS}
+            self._explained_at[fingerprint] = now
+        return True
+
+    def record(self, connection, statement: str, parameters, duration_seconds: float, executemany: bool = False):
+        """
+        Record a statement, if it took longer than the threshold
+        :param connection: SQLAlchemy Connection which executed the statement, used to explain it
+        """
+        duration_ms = duration_seconds * 1000
+        if self.threshold_ms < 0 or duration_ms < self.threshold_ms:
+            return
+        normalized = normalize_statement(statement)
+        shape = parameter_shape(parameters, executemany)
+        fingerprint = hashlib.sha1(f"{normalized}|{sorted(shape)}".encode()).hexdigest()[:16]
+        scope = metrics.current_request_scope.get()
+        query = {
+            "fingerprint": fingerprint,
+            "statement": normalized,
+            "parameter_shape": shape,
+            "duration_ms": duration_ms,
+            "endpoint": f"{scope['method']} {metrics.route_template(scope)}" if scope is not None else None,
+            "database_function": metrics.database_function_name.get(),
+            "dialect": connection.dialect.name,
+            "recorded_at": datetime.utcnow(),
+            "plan": None,
+            "explain_error": None,
+        }
+        if not executemany and self._should_explain(fingerprint, statement):
+            try:
+                query["plan"] = explain_statement(connection, statement, parameters)
+            except Exception as error:  # Explaining is best effort, and must never fail the request
+                query["explain_error"] = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.queries.append(query)
+            self.slow_queries += 1
+
+    def clear(self):
+        with self._lock:
+            self.queries.clear()
+            self._explained_at.clear()
+
+    def describe(self):
+        """
+        :return: (dict) The latest slow statements (most recent first), and a summary of each distinct statement among
+                 them (slowest in total first), matching the fields of `api_models.SlowQueryLogModel`
+        """
+        with self._lock:
+            queries = list(reversed(self.queries))
+            slow_queries = self.slow_queries
+        statements = {}
+        for query in queries:
+            summary = statements.get(query["fingerprint"])
+            if summary is None:
+                summary = statements[query["fingerprint"]] = {
+                    "fingerprint": query["fingerprint"], "statement": query["statement"],
+                    "parameter_shape": query["parameter_shape"], "endpoints": [], "count": 0, "total_ms": 0.0,
+                    "max_ms": 0.0, "plan": None}
+            summary["count"] += 1
+            summary["total_ms"] += query["duration_ms"]
+            summary["max_ms"] = max(summary["max_ms"], query["duration_ms"])
+            summary["plan"] = summary["plan"] or query["plan"]  # The latest plan, as queries are most recent first
+            if query["endpoint"] and query["endpoint"] not in summary["endpoints"]:
+                summary["endpoints"].append(query["endpoint"])
+        return {
+            "threshold_ms": self.threshold_ms,
+            "size": self.size,
+            "explain": self.explain,
+            "slow_queries": slow_queries,
+            "statements": sorted(statements.values(), key=lambda summary: summary["total_ms"], reverse=True),
+            "queries": queries,
+        }
+
+
+def attach_slow_query_log(engine, slow_query_log: SlowQueryLog):
+    """
+    Record the slow statements executed by the given engine into the log
+    :param engine: SQLAlchemy Engine (for an AsyncEngine, use its `sync_engine`)
+    """
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.slow_query_start_time = time.perf_counter()
+
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "slow_query_start_time", None)
+        if start is not None:
+            slow_query_log.record(connection, statement, parameters, time.perf_counter() - start, executemany)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
@@ -0,0 +1,148 @@
+import operator
+import re
+from datetime import datetime
+from typing import Mapping
+
+from fast_api_challenge.database import orm
+
+"""
+Typed columns of the Netflix table, parsed from the free-form date_added and duration strings of shows.
+
+The strings stay on the table as the source of the show fields returned by the Api. Every write to the table made
+through `database_interface` stores the values parsed from them (see `typed_values`) in the same statement, so that
+range filters ("added in the last 90 days", "movies under 100 minutes") are served by the indexes of the typed columns,
+and orderBy=date_added orders shows by date rather than lexically. Strings which can't be parsed leave their typed
+columns NULL.
+"""
+
+MAX_INTEGER = 2147483647  # Parsed numbers which don't fit the Integer columns are left NULL
+# Formats of the date_added strings, eg. "September 9, 2019" (the dataset's), "Sep 9, 2019", "2019-09-09", "9-Sep-19"
+DATE_ADDED_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d", "%d-%b-%y")
+DURATION_MINUTES_PATTERN = re.compile(r"(\d+)\s*min", re.ASCII | re.IGNORECASE)  # eg. "90 min"
+SEASONS_PATTERN = re.compile(r"(\d+)\s*seasons?", re.ASCII | re.IGNORECASE)  # eg. "1 Season", "3 Seasons"
+
+
+def parse_date_added(value):
+    """
+    :param value: date_added string of a show, eg. "September 9, 2019"
+    :return: (date) The date, or None if the value isn't a date in one of the DATE_ADDED_FORMATS
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for date_format in DATE_ADDED_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_count(pattern, value):
+    if not isinstance(value, str):
+        return None
+    match = pattern.fullmatch(value.strip())
+    if match is None:
+        return None
+    count = int(match.group(1))
+    return count if count <= MAX_INTEGER else None
+
+
+def parse_duration_minutes(value):
+    """
+    :param value: duration string of a show, eg. "90 min" for a movie
+    :return: (int) The number of minutes, or None if the duration isn't in minutes (eg. a number of seasons)
+    """
+    return _parse_count(DURATION_MINUTES_PATTERN, value)
+
+
+def parse_seasons(value):
+    """
+    :param value: duration string of a show, eg. "3 Seasons" for a TV show
+    :return: (int) The number of seasons, or None if the duration isn't in seasons
+    """
+    return _parse_count(SEASONS_PATTERN, value)
+
+
+class TypedColumn:
+    """
+    Column of the Netflix table holding the value parsed from a string field of shows
+    """
+
+    def __init__(self, name: str, field_name: str, parse):
+        self.name = name
+        self.field_name = field_name
+        self.parse = parse  # Function(field value) returning the column's value, or None
+
+    @property
+    def column(self):
+        return getattr(orm.NetflixShow, self.name)
+
+
+TYPED_COLUMNS = [
+    TypedColumn("date_added_on", "date_added", parse_date_added),
+    TypedColumn("duration_minutes", "duration", parse_duration_minutes),
+    TypedColumn("seasons", "duration", parse_seasons),
+]
+TYPED_COLUMNS_BY_NAME = {typed_column.name: typed_column for typed_column in TYPED_COLUMNS}
+
+# Fields which searches order by the value of a typed column, rather than by their string
+ORDER_BY_COLUMNS = {"date_added": TYPED_COLUMNS_BY_NAME["date_added_on"]}
+
+
+def typed_values(values: Mapping):
+    """
+    :param values: The fields of a show, eg. from `NetflixShowModel.dict()`
+    :return: (dict) The value of each typed column, parsed from the fields
+    """
+    return {typed_column.name: typed_column.parse(values.get(typed_column.field_name))
+            for typed_column in TYPED_COLUMNS}
+
+
+def order_by_value(order_by: str, value):
+    """
+    :param order_by: Name of the field a search is ordered by
+    :param value: Value of the field, eg. from a cursor
+    :return: The value of the column the search is actually ordered by
+    """
+    typed_column = ORDER_BY_COLUMNS.get(order_by)
+    return typed_column.parse(value) if typed_column is not None else value
+
+
+class RangeFilter:
+    """
+    Search filter matching the shows whose value of a column is within a bound: operator(column value, bound)
+    """
+
+    def __init__(self, column_name: str, comparison):
+        self.column_name = column_name
+        self.comparison = comparison  # eg. operator.ge, for the shows whose value is greater than or equal to the bound
+        self.typed_column = TYPED_COLUMNS_BY_NAME.get(column_name)
+
+    @property
+    def column(self):
+        return getattr(orm.NetflixShow, self.column_name)
+
+    @property
+    def field_name(self):
+        """
+        Name of the show field holding (or parsed into) the column's value
+        """
+        return self.typed_column.field_name if self.typed_column is not None else self.column_name
+
+    def predicate(self, bound):
+        """
+        :param bound: Value (or bound parameter) to compare the column with
+        :return: SQLAlchemy WHERE clause of the filter, which excludes NULLs
+        """
+        return self.comparison(self.column, bound)
+
+
+# Range search filters (fields of `NetflixShowSearchModel`), which compile to indexed range predicates
+RANGE_FILTERS = {
+    "release_year_gte": RangeFilter("release_year", operator.ge),
+    "release_year_lte": RangeFilter("release_year", operator.le),
+    "date_added_from": RangeFilter("date_added_on", operator.ge),
+    "date_added_to": RangeFilter("date_added_on", operator.le),
+    "duration_max": RangeFilter("duration_minutes", operator.le),
+}
@@ -1,12 +1,192 @@
+import functools
+import hashlib
+import io
+import json
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Integer, String, and_, bindparam, case, cast, false, func, literal, or_, select, text, tuple_, \
+    union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from fast_api_challenge.models import database_models as models
-from fast_api_challenge.database import orm
+from fast_api_challenge.models import api_enums, api_models
+from fast_api_challenge.database import columnar, orm, replicas, search_index, show_entities, typed_columns
+from fast_api_challenge import caching, metrics
+from utils import get_columnar_search_max_age_seconds, get_response_cache_max_entries, \
+    get_response_cache_ttl_seconds, get_summary_cache_ttl_seconds, use_columnar_search
 
 """
 Interface methods which reconcile usage of Pydantic Models with SQLAlchemy ORM Models and interact with the Database.
+
+Searches, show reads and counts are made within `replicas.replica_reads`, so that sessions which route reads send them
+to a read replica. Reads made to check a precondition before writing (use_cache=False) stay on the primary.
+
+Writes store the `typed_columns` parsed from the date_added and duration strings of shows along with them (see
+`_show_values`), which the range filters and orderBy=date_added of searches use.
+
+When the columnar search is enabled, searches without q are answered from the `columnar` snapshot of the table instead
+of the database, whenever it can answer them exactly like the database would.
+
+The `COALESCED_READS` return plain values, so the api shares the result of one call between concurrent identical
+calls (see `coalescing_key`).
 """
 
+summary_cache = caching.TTLCache(ttl_seconds=get_summary_cache_ttl_seconds())  # Aggregate counts for the Summary
+show_cache = caching.TTLCache(ttl_seconds=get_response_cache_ttl_seconds(),  # Existing shows, keyed by show_id
+                              max_entries=get_response_cache_max_entries())
+search_cache = caching.TTLCache(ttl_seconds=get_response_cache_ttl_seconds(),  # Search results, keyed by parameters
+                                max_entries=get_response_cache_max_entries())
+
+_MISSING = object()
+
+_invalidations = 0  # Number of calls to invalidate_netflix_caches made by this process
+
+# Reads returning plain values (rather than ORM objects), which concurrent identical calls can share
+COALESCED_READS = {"get_netflix_show_row", "get_netflix_show_model", "get_netflix_show_rows",
+                   "search_netflix_show_rows", "search_netflix_show_models", "get_netflix_show_facets",
+                   "get_netflix_show_summary_counts", "get_number_netflix_shows",
+                   "get_number_of_unique_for_given_netflix_show_table_column"}
+
+# Columns of the Netflix table holding the fields of a show, as opposed to its row version
+SHOW_COLUMNS = [column for column in orm.NetflixShow.__table__.columns
+                if column.name in models.NetflixShowModel.__fields__]
+# Columns of the plain rows returned by the read methods: the fields of a show, in the order of the NetflixShowModel
+# fields, and its row version
+SHOW_ROW_COLUMNS = sorted(SHOW_COLUMNS, key=lambda column: list(models.NetflixShowModel.__fields__).index(column.name)) \
+    + [orm.NetflixShow.__table__.c.version, orm.NetflixShow.__table__.c.updated_at]
+
+columnar_search = columnar.ColumnarSearchEngine(  # Searches answered from an in-memory snapshot, or None if disabled
+    row_columns=[column.name for column in SHOW_ROW_COLUMNS],
+    integer_columns=[column.name for column in SHOW_ROW_COLUMNS if isinstance(column.type, Integer)],
+    max_age_seconds=get_columnar_search_max_age_seconds()) if use_columnar_search() else None
+
+
+def use_shared_cache_store(store: caching.SharedCacheStore):
+    """
+    Cache shows and search results in a store shared by every api node, instead of per process, so that writes made
+    through any node are seen by all of them
+    """
+    global show_cache, search_cache
+    show_cache = caching.SharedCache(store, namespace="show", ttl_seconds=get_response_cache_ttl_seconds(shared=True))
+    search_cache = caching.SharedCache(store, namespace="search",
+                                       ttl_seconds=get_response_cache_ttl_seconds(shared=True))
+
+
+def invalidate_netflix_caches(show_ids: List[int] = None):
+    """
+    Invalidate the data cached from the Netflix table. Called after every committed write made through this module, and
+    must be called after writing to the table by any other means.
+    :param show_ids: show_ids of the only shows written, or None if unknown
+    """
+    global _invalidations
+    _invalidations += 1
+    summary_cache.invalidate()
+    search_cache.invalidate()
+    if columnar_search is not None:
+        columnar_search.invalidate(show_ids)
+    if show_ids is None:
+        show_cache.invalidate()
+    else:
+        show_cache.delete(*[_show_cache_key(show_id) for show_id in show_ids])
+
+
+def netflix_show_rows(db_session: Session, show_ids: List[int] = None):
+    """
+    Read the rows of shows from the primary (regardless of `replicas.replica_reads`), eg. to load the columnar snapshot
+    :param db_session: SQLAlchemy Session
+    :param show_ids: show_ids of the shows to read, or None to stream every show in show_id order
+    :return: (iterable) For each existing show, a dict of the values of its `SHOW_ROW_COLUMNS`
+    """
+    statement = select(*SHOW_ROW_COLUMNS)
+    with replicas.primary_reads(db_session):
+        if show_ids is None:
+            result = db_session.execute(statement.order_by(orm.NetflixShow.show_id)
+                                        .execution_options(stream_results=True))
+            return (dict(row) for partition in result.mappings().partitions(1000) for row in partition)
+        rows = []
+        for _, batch in _chunks(list(show_ids), show_entities.MAX_NAMES_PER_STATEMENT):
+            rows += _rows(db_session.execute(statement.where(orm.NetflixShow.show_id.in_(batch))))
+        return rows
+
+
+def describe_caches():
+    """
+    :return: (dict) Usage statistics of each cache, by name
+    """
+    return {"show": show_cache.describe(), "search": search_cache.describe(), "summary": summary_cache.describe()}
+
+
+def _show_values(show, **dict_kwargs):
+    """
+    :param show: Pydantic NetflixShow model
+    :param dict_kwargs: Arguments of the model's dict(), eg. exclude
+    :return: (dict) The values to write to the show's row: its fields, and the `typed_columns` parsed from them
+    """
+    values = show.dict(**dict_kwargs)
+    return {**values, **typed_columns.typed_values(values)}
+
+
+def _show_cache_key(show_id: int):
+    return f"show:{show_id}"
+
+
+def _parameters_digest(**parameters):
+    """
+    Hash of the normalized parameters of a call: parameters and filters which are not applied (empty values) are
+    dropped, and enums are reduced to their values.
+    """
+    normalized = {}
+    for name, value in parameters.items():
+        if isinstance(value, models.NetflixShowSearchModel):
+            value = {key: filter_value for key, filter_value in value.dict().items() if filter_value}
+        elif isinstance(value, api_models.SearchCursorModel):  # Before enums, as cursors also have a value
+            value = value.dict()
+        elif hasattr(value, "value"):
+            value = value.value
+        if value:
+            normalized[name] = value
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _search_cache_key(**search_parameters):
+    """
+    Key identifying the results of a search, from the `_parameters_digest` of its parameters
+    """
+    return f"search:{_parameters_digest(**search_parameters)}"
+
+
+def coalescing_key(function_name: str, **kwargs):
+    """
+    Key identifying the result of a read, which concurrent identical reads can share (see `coalescing`): the name of
+    its function, the digest of its parameters, and the number of invalidations made by this process, so that reads
+    which start after a write never share the result of a read made before it.
+    :param function_name: Name of the function of this module called
+    :param kwargs: Arguments of the function, besides the database session
+    :return: (tuple) The key, or None if the call can't be shared: writes, reads of ORM objects (which belong to the
+             session of the request), and reads of the current row made to check a precondition (use_cache=False)
+    """
+    if function_name not in COALESCED_READS or not kwargs.get("use_cache", True):
+        return None
+    return function_name, _invalidations, _parameters_digest(**kwargs)
+
+
+def _read_through(cache, key, load):
+    """
+    :return: The value cached for the key, or the value returned by load, which is then cached unless the cache was
+             invalidated while it was loading. None (eg. a show which doesn't exist) isn't cached, as the write creating
+             it may be made through a worker which doesn't share the cache.
+    """
+    generation = cache.generation
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = load()
+        if value is not None:
+            cache.set(key, value, generation=generation)
+    return value
+
 
 def create_netflix_show(db_session: Session, show: orm.NetflixShow):
     """
@@ -14,12 +194,20 @@ def create_netflix_show(db_session: Session, show: orm.NetflixShow):
     :param db_session: SQLAlchemy DB session object
     :param show: ORM NetflixShow object to add (Can be sent as Pydantic NetflixShow model)
     :return: The newly created database record, queried directly from the DB. (Pydantic NetflixShow model)
+    :raises IntegrityError: If a show with the given show_id already exists
     """
-    netflix_db_show = orm.NetflixShow(**show.dict())
+    netflix_db_show = orm.NetflixShow(**_show_values(show))
     db_session.add(netflix_db_show)
+    try:
+        db_session.flush()  # Assigns the show_id, which would otherwise have to be reloaded after the commit
+    except IntegrityError:
+        db_session.rollback()  # The show_id already exists
+        raise
+    show_id = netflix_db_show.show_id
+    show_entities.sync_show_entities(db_session, {show_id: show.dict()}, new_shows=True)
     db_session.commit()
-    db_session.refresh(netflix_db_show)
-    return get_netflix_show(db_session=db_session, show_id=netflix_db_show.show_id)
+    invalidate_netflix_caches(show_ids=[show_id])
+    return get_netflix_show(db_session=db_session, show_id=show_id)
 
 
 def get_netflix_show(db_session: Session, show_id: int):
@@ -29,31 +217,464 @@ def get_netflix_show(db_session: Session, show_id: int):
         :param show_id: Possibly existing NetflixShow ID to return
         :return: Existing NetflixShow Model Object, or None
         """
-    return db_session.query(orm.NetflixShow).filter(orm.NetflixShow.show_id == show_id).one_or_none()
+    with replicas.replica_reads(db_session):
+        return db_session.query(orm.NetflixShow).filter(orm.NetflixShow.show_id == show_id).one_or_none()
+
+
+_SHOW_ROW_STATEMENT = select(*SHOW_ROW_COLUMNS).where(orm.NetflixShow.show_id == bindparam("show_id"))
+
+
+def _rows(result):
+    """
+    :return: (list) The rows of a Core result, as dicts of column name to value
+    """
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
 
 
-def update_netflix_show(db_session: Session, show: orm.NetflixShow, show_id: int):
+def get_netflix_show_row(db_session: Session, show_id: int, use_cache: bool = True):
+    """
+    Retrieves an existing show using its show_id as a plain row (without loading an ORM object), read through the
+    show cache
+    :param db_session: SQLAlchemy Session
+    :param show_id: Possibly existing NetflixShow ID to return
+    :param use_cache: Whether to read through the cache, rather than always reading the current row
+    :return: (dict) The values of the `SHOW_ROW_COLUMNS` of the show, or None
+    """
+    def load():
+        rows = _rows(db_session.execute(_SHOW_ROW_STATEMENT, {"show_id": show_id}))
+        return rows[0] if rows else None
+
+    if not use_cache:
+        return load()
+    with replicas.replica_reads(db_session):
+        return _read_through(show_cache, _show_cache_key(show_id), load)
+
+
+def get_netflix_show_model(db_session: Session, show_id: int, use_cache: bool = True):
+    """
+    Retrieves an existing show using its show_id, read through the show cache
+    :param db_session: SQLAlchemy Session
+    :param show_id: Possibly existing NetflixShow ID to return
+    :param use_cache: Whether to read through the cache, rather than always reading the current row
+    :return: Existing show (Pydantic NetflixShowVersion model), or None
+    """
+    row = get_netflix_show_row(db_session, show_id=show_id, use_cache=use_cache)
+    return models.NetflixShowVersionModel.construct(**row) if row is not None else None  # Rows are already valid
+
+
+def _row_version_values():
+    """
+    Values which record a write in a row's version columns
+    """
+    return {"version": orm.NetflixShow.version + 1, "updated_at": datetime.utcnow()}
+
+
+def _show_filter(show_id: int, expected_version: int = None):
+    criteria = [orm.NetflixShow.show_id == show_id]
+    if expected_version is not None:
+        criteria.append(orm.NetflixShow.version == expected_version)
+    return and_(*criteria)
+
+
+def update_netflix_show(db_session: Session, show: orm.NetflixShow, show_id: int, expected_version: int = None):
     """
     Update show in the database Netflix table
     :param db_session: SQLAlchemy DB session object
     :param show: ORM NetflixShow object to add (Can be sent as Pydantic NetflixShow model)
     :param show_id: show_id of the show to update (int)
-    :return: Newly upated show (Pydantic NetflixShow Model Object)
+    :param expected_version: If given, the show is only updated if this is still its version (optimistic concurrency)
+    :return: Newly upated show (Pydantic NetflixShow Model Object), or None if no show has the show_id (and version)
     """
-    db_session.query(orm.NetflixShow).filter(orm.NetflixShow.show_id == show_id).update(show.dict())
+    updated = db_session.query(orm.NetflixShow).filter(_show_filter(show_id, expected_version)) \
+        .update({**_show_values(show), **_row_version_values()})
+    if updated:
+        show_entities.sync_show_entities(db_session, {show_id: show.dict()})
     db_session.commit()
+    if not updated:
+        return None
+    invalidate_netflix_caches(show_ids=[show_id])
     return show
 
 
-def delete_netflix_show(db_session: Session, show_id: int):
+def delete_netflix_show(db_session: Session, show_id: int, expected_version: int = None):
     """
     Delete the show with the given show_id in the table
     :param db_session: SQLAlchemy DB session object
     :param show_id: show_id of the show to delete (int)
-    :return: None (throw exception if failure)
+    :param expected_version: If given, the show is only deleted if this is still its version (optimistic concurrency)
+    :return: Bool, whether a show with the show_id (and version) existed and was deleted (throw exception if failure)
     """
-    db_session.query(orm.NetflixShow).filter(orm.NetflixShow.show_id == show_id).delete()
+    deleted = db_session.query(orm.NetflixShow).filter(_show_filter(show_id, expected_version)).delete()
+    if deleted:
+        show_entities.delete_show_entities(db_session, [show_id])
     db_session.commit()
+    if deleted:
+        invalidate_netflix_caches(show_ids=[show_id])
+    return bool(deleted)
+
+
+def _chunks(items: list, chunk_size: int):
+    for start in range(0, len(items), chunk_size):
+        yield start, items[start:start + chunk_size]
+
+
+def _existing_show_ids(db_session: Session, show_ids: List[int]):
+    if not show_ids:
+        return set()
+    return set(db_session.execute(select(orm.NetflixShow.show_id)
+                                  .where(orm.NetflixShow.show_id.in_(set(show_ids)))).scalars())
+
+
+def _insert_ignoring_existing_shows(dialect_name: str):
+    """
+    INSERT statement for the Netflix table which skips rows whose show_id already exists, where the dialect supports it
+    """
+    netflix_table = orm.NetflixShow.__table__
+    if dialect_name == "postgresql":
+        return postgresql.insert(netflix_table).on_conflict_do_nothing(index_elements=["show_id"])
+    if dialect_name == "sqlite":
+        return sqlite.insert(netflix_table).on_conflict_do_nothing(index_elements=["show_id"])
+    return netflix_table.insert()
+
+
+def _bulk_item_result(index: int, status: api_enums.BulkItemStatusEnum, show_id: int = None, detail: str = None):
+    return api_models.BulkItemResultModel(index=index, show_id=show_id, status=status, detail=detail)
+
+
+def _run_bulk_chunks(db_session: Session, items: list, chunk_size: int, write_chunk):
+    """
+    Apply a bulk write one chunk at a time, committing one transaction per chunk. If a chunk fails, it is rolled back,
+    its items are reported as failed, and the remaining chunks are still applied.
+    :param write_chunk: Function(start_index, chunk) which writes a chunk and returns a result per item in it
+    :return: (list) BulkItemResultModel per item, in the order of the items
+    """
+    results = []
+    for start, chunk in _chunks(items, chunk_size):
+        try:
+            results += write_chunk(start, chunk)
+            db_session.commit()
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            results = results[:start] + [_bulk_item_result(start + offset, api_enums.BulkItemStatusEnum.FAILED,
+                                                           detail=e.__class__.__name__)
+                                         for offset in range(len(chunk))]
+        written_statuses = (api_enums.BulkItemStatusEnum.CREATED, api_enums.BulkItemStatusEnum.UPDATED,
+                            api_enums.BulkItemStatusEnum.DELETED)
+        written_show_ids = [result.show_id for result in results[start:] if result.status in written_statuses]
+        if written_show_ids:
+            invalidate_netflix_caches(show_ids=written_show_ids)
+    return results
+
+
+def bulk_create_netflix_shows(db_session: Session, shows: List[models.NetflixShowModel], chunk_size: int):
+    """
+    Create many shows, in one transaction per chunk of shows. Shows with a show_id are inserted with a single
+    executemany INSERT per chunk, skipping show_ids which already exist. Shows without a show_id have one generated.
+    :param db_session: SQLAlchemy DB session object
+    :param shows: Pydantic NetflixShow models to create
+    :param chunk_size: Number of shows to write per transaction
+    :return: (list) BulkItemResultModel per show, with the status "created", "conflict" or "failed"
+    """
+    insert_statement = _insert_ignoring_existing_shows(db_session.get_bind().dialect.name)
+
+    def write_chunk(start: int, chunk: List[models.NetflixShowModel]):
+        existing_show_ids = _existing_show_ids(db_session, [show.show_id for show in chunk if show.show_id])
+        results, rows, generated_id_shows = [], [], []
+        for index, show in enumerate(chunk, start=start):
+            if show.show_id is None:
+                netflix_db_show = orm.NetflixShow(**_show_values(show))
+                generated_id_shows.append(netflix_db_show)
+                results.append(netflix_db_show)  # Replaced with its result once the show_id has been generated
+            elif show.show_id in existing_show_ids:
+                results.append(_bulk_item_result(index, api_enums.BulkItemStatusEnum.CONFLICT, show_id=show.show_id,
+                                                 detail="Show already exists with given show_id."))
+            else:
+                existing_show_ids.add(show.show_id)  # Also catches duplicate show_ids within the request
+                rows.append(_show_values(show))
+                results.append(_bulk_item_result(index, api_enums.BulkItemStatusEnum.CREATED, show_id=show.show_id))
+
+        if rows:
+            db_session.execute(insert_statement, rows)
+        if generated_id_shows:
+            db_session.add_all(generated_id_shows)
+            db_session.flush()
+        created_shows = {row["show_id"]: row for row in rows}
+        created_shows.update({show.show_id: show.dict() for show in generated_id_shows})
+        show_entities.sync_show_entities(db_session, created_shows, new_shows=True)
+        return [_bulk_item_result(index, api_enums.BulkItemStatusEnum.CREATED, show_id=result.show_id)
+                if isinstance(result, orm.NetflixShow) else result
+                for index, result in enumerate(results, start=start)]
+
+    return _run_bulk_chunks(db_session, shows, chunk_size, write_chunk)
+
+
+def bulk_update_netflix_shows(db_session: Session, shows: List[models.NetflixShowBulkUpdateModel], chunk_size: int):
+    """
+    Update many shows, identified by their show_id, in one transaction per chunk of shows. Each chunk is written with a
+    single executemany UPDATE.
+    :param db_session: SQLAlchemy DB session object
+    :param shows: Pydantic models with the show_id and new fields of each show
+    :param chunk_size: Number of shows to write per transaction
+    :return: (list) BulkItemResultModel per show, with the status "updated", "not_found" or "failed"
+    """
+    netflix_table = orm.NetflixShow.__table__
+    update_statement = netflix_table.update().where(netflix_table.c.show_id == bindparam("target_show_id")) \
+        .values(version=netflix_table.c.version + 1)
+
+    def write_chunk(start: int, chunk: List[models.NetflixShowBulkUpdateModel]):
+        existing_show_ids = _existing_show_ids(db_session, [show.show_id for show in chunk])
+        results, rows = [], []
+        for index, show in enumerate(chunk, start=start):
+            if show.show_id in existing_show_ids:
+                rows.append({"target_show_id": show.show_id, "updated_at": datetime.utcnow(),
+                             **_show_values(show, exclude={"show_id"})})
+                results.append(_bulk_item_result(index, api_enums.BulkItemStatusEnum.UPDATED, show_id=show.show_id))
+            else:
+                results.append(_bulk_item_result(index, api_enums.BulkItemStatusEnum.NOT_FOUND, show_id=show.show_id,
+                                                 detail="Show not found."))
+        if rows:
+            db_session.execute(update_statement, rows)
+            show_entities.sync_show_entities(db_session, {row["target_show_id"]: row for row in rows})
+        return results
+
+    return _run_bulk_chunks(db_session, shows, chunk_size, write_chunk)
+
+
+def bulk_delete_netflix_shows(db_session: Session, show_ids: List[int], chunk_size: int):
+    """
+    Delete many shows, in one transaction (and one DELETE statement) per chunk of show_ids.
+    :param db_session: SQLAlchemy DB session object
+    :param show_ids: show_ids of the shows to delete
+    :param chunk_size: Number of shows to delete per transaction
+    :return: (list) BulkItemResultModel per show_id, with the status "deleted", "not_found" or "failed"
+    """
+    def write_chunk(start: int, chunk: List[int]):
+        existing_show_ids = _existing_show_ids(db_session, chunk)
+        if existing_show_ids:
+            db_session.execute(orm.NetflixShow.__table__.delete()
+                               .where(orm.NetflixShow.show_id.in_(existing_show_ids)))
+            show_entities.delete_show_entities(db_session, existing_show_ids)
+        return [_bulk_item_result(index, api_enums.BulkItemStatusEnum.DELETED, show_id=show_id)
+                if show_id in existing_show_ids else
+                _bulk_item_result(index, api_enums.BulkItemStatusEnum.NOT_FOUND, show_id=show_id,
+                                  detail="Show not found.")
+                for index, show_id in enumerate(chunk, start=start)]
+
+    return _run_bulk_chunks(db_session, show_ids, chunk_size, write_chunk)
+
+
+NETFLIX_COPY_STAGING_TABLE = "netflix_copy_staging"
+
+
+def _copy_text_value(value):
+    """
+    Format a value for the text format of Postgres' COPY
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_netflix_shows(db_session: Session, shows: List[models.NetflixShowModel]):
+    """
+    Insert shows using Postgres' COPY, via a temporary staging table so that show_ids which already exist are skipped
+    and shows without a show_id have one generated.
+    :return: (int) Number of shows inserted
+    """
+    # The fields and typed columns of the shows. The row version columns are filled by their server defaults
+    columns = [column.name for column in SHOW_COLUMNS] + [column.name for column in typed_columns.TYPED_COLUMNS]
+    data_columns = [column_name for column_name in columns if column_name != "show_id"]
+    column_list = ", ".join(f'"{column_name}"' for column_name in columns)
+    data_column_list = ", ".join(f'"{column_name}"' for column_name in data_columns)
+
+    buffer = io.StringIO()
+    for show in shows:
+        values = _show_values(show)
+        buffer.write("\t".join(_copy_text_value(values.get(column_name)) for column_name in columns) + "\n")
+    buffer.seek(0)
+
+    db_session.execute(text(f"CREATE TEMPORARY TABLE IF NOT EXISTS {NETFLIX_COPY_STAGING_TABLE} "
+                            f"(LIKE netflix INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"))
+    # LIKE copies the primary key's NOT NULL, which would fail the COPY of shows without a show_id
+    db_session.execute(text(f"ALTER TABLE {NETFLIX_COPY_STAGING_TABLE} ALTER COLUMN show_id DROP NOT NULL"))
+    cursor = db_session.connection().connection.cursor()  # COPY is only available on the DBAPI (psycopg2) cursor
+    try:
+        cursor.copy_expert(f"COPY {NETFLIX_COPY_STAGING_TABLE} ({column_list}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+    returning = ", ".join(f'"{column_name}"' for column_name in ["show_id", *show_entities.RELATIONS_BY_COLUMN])
+    inserted = db_session.execute(text(
+        f"INSERT INTO netflix ({column_list}) SELECT {column_list} FROM {NETFLIX_COPY_STAGING_TABLE} "
+        f"WHERE show_id IS NOT NULL ON CONFLICT (show_id) DO NOTHING RETURNING {returning}")).mappings().all()
+    inserted += db_session.execute(text(
+        f"INSERT INTO netflix ({data_column_list}) SELECT {data_column_list} FROM {NETFLIX_COPY_STAGING_TABLE} "
+        f"WHERE show_id IS NULL RETURNING {returning}")).mappings().all()
+    show_entities.sync_show_entities(db_session, {row["show_id"]: row for row in inserted}, new_shows=True)
+    return len(inserted)
+
+
+def load_netflix_shows(db_session: Session, shows: List[models.NetflixShowModel]):
+    """
+    Insert a batch of shows as fast as the database allows, in one transaction: using COPY on Postgres, and an
+    executemany INSERT otherwise. Shows whose show_id already exists are skipped.
+    :param db_session: SQLAlchemy DB session object
+    :param shows: Pydantic NetflixShow models to insert
+    :return: (int) Number of shows inserted
+    """
+    if db_session.get_bind().dialect.name == "postgresql":
+        try:
+            inserted = _copy_netflix_shows(db_session, shows)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            invalidate_netflix_caches()
+        return inserted
+
+    results = bulk_create_netflix_shows(db_session, shows=shows, chunk_size=max(len(shows), 1))
+    failed = [result for result in results if result.status == api_enums.BulkItemStatusEnum.FAILED]
+    if failed:
+        raise RuntimeError(f"Failed to load a batch of {len(shows)} shows ({failed[0].detail}).")
+    return sum(1 for result in results if result.status == api_enums.BulkItemStatusEnum.CREATED)
+
+
+SEARCH_STATEMENT_CACHE_SIZE = 1024  # Number of distinct search shapes whose statement is kept
+
+
+def netflix_show_search_statement(dialect_name: str,
+                                  filter_args: models.NetflixShowSearchModel,
+                                  orderBy: str = None,
+                                  sort: str = None,
+                                  q: str = None,
+                                  cursor: api_models.SearchCursorModel = None,
+                                  columns: list = None):
+    """
+    Dynamically construct the (unpaginated) select statement of a search, based on the passed parameters
+    :param dialect_name: Name of the database dialect the statement will run against (eg. "postgresql", "sqlite")
+    :param filter_args: Filter argument values for each column in the form of a Pydantic Model. Columns are matched as
+                        substrings, the exact-match filters (eg. cast_member) by the exact name of a person, country
+                        or genre, and the range filters (eg. date_added_from) by comparing a (typed) column with them.
+    :param orderBy: Name of column in Netflix table to order by (date_added orders by date)
+    :param sort: Descending / Ascending (desc/asc)
+    :param q: Free text to full-text search for. Results are ranked by relevance unless orderBy is given.
+    :param cursor: Position of the last show of the previous page, for keyset pagination. Must have been created for
+                   the same orderBy and sort.
+    :param columns: Columns to select instead of NetflixShow ORM objects, eg. to fetch plain rows. As statements are
+                    cached by their columns, these should be the same objects across calls (eg. not new labels).
+    :return: SQLAlchemy Select
+    """
+    statement, parameters = _search_statement_and_parameters(dialect_name, filter_args=filter_args, orderBy=orderBy,
+                                                             sort=sort, q=q, cursor=cursor, columns=columns)
+    return statement.params(**parameters)
+
+
+def _search_statement_and_parameters(dialect_name: str,
+                                     filter_args: models.NetflixShowSearchModel,
+                                     orderBy=None,
+                                     sort=None,
+                                     q: str = None,
+                                     cursor: api_models.SearchCursorModel = None,
+                                     columns: list = None,
+                                     skip: int = None,
+                                     limit: int = None):
+    """
+    The statement of a search, in which every value is a bound parameter, along with the values of the parameters.
+    Statements are cached by the shape of the search (which filters are active, orderBy, sort, and whether q, a cursor,
+    skip and limit are given), so that searches of the same shape reuse the same statement object. This skips building
+    the statement, and computing the key under which SQLAlchemy caches its compiled form, which is memoized per object.
+    :return: (tuple) The SQLAlchemy Select, and (dict) the values of its bound parameters
+    """
+    parameters = {}
+    filter_names = []
+    for key, value in filter_args.dict().items():
+        if not value:
+            continue
+        filter_names.append(key)
+        if key in show_entities.EXACT_MATCH_FILTERS:
+            parameters[f"filter_{key}"] = value.strip()
+        elif key in typed_columns.RANGE_FILTERS:
+            parameters[f"filter_{key}"] = value
+        else:
+            parameters[f"filter_{key}"] = f"%{value}%"  # searches for value as substring on both sides
+
+    full_text = None
+    if q:
+        query_value = search_index.full_text_query_value(q, dialect_name)
+        full_text = query_value is not None
+        if full_text:
+            parameters["q"] = query_value
+
+    cursor_value_is_null = None
+    if cursor:
+        cursor_value = typed_columns.order_by_value(orderBy.value, cursor.value) if orderBy else cursor.value
+        cursor_value_is_null = cursor_value is None
+        parameters["cursor_show_id"] = cursor.show_id
+        if not cursor_value_is_null:
+            parameters["cursor_value"] = cursor_value
+
+    if skip:
+        parameters["skip"] = skip
+    if limit:
+        parameters["limit"] = limit
+
+    statement = _search_statement(dialect_name, filter_names=tuple(filter_names),
+                                  order_by=orderBy.value if orderBy else None, descending=_is_descending(sort),
+                                  full_text=full_text, cursor_value_is_null=cursor_value_is_null, skip=bool(skip),
+                                  limit=bool(limit), columns=tuple(columns) if columns else None)
+    return statement, parameters
+
+
+@functools.lru_cache(maxsize=SEARCH_STATEMENT_CACHE_SIZE)
+def _search_statement(dialect_name: str,
+                      filter_names: tuple,
+                      order_by: str,
+                      descending: bool,
+                      full_text: bool,
+                      cursor_value_is_null: bool,
+                      skip: bool,
+                      limit: bool,
+                      columns: tuple):
+    """
+    Build the statement of a search shape, with the bound parameters described by `_search_statement_and_parameters`
+    :param full_text: None without q, otherwise whether the q can match anything
+    :param cursor_value_is_null: None without a cursor, otherwise whether the cursor's orderBy value is NULL
+    """
+    statement = select(*columns) if columns else select(orm.NetflixShow)  # Create initial query
+
+    # add in each active filter, as an SQL "LIKE" search, an exact match of a normalized name or a range predicate
+    for key in filter_names:
+        if key in typed_columns.RANGE_FILTERS:
+            range_filter = typed_columns.RANGE_FILTERS[key]
+            statement = statement.where(range_filter.predicate(bindparam(f"filter_{key}",
+                                                                         type_=range_filter.column.type)))
+            continue
+        parameter = bindparam(f"filter_{key}", type_=String)
+        if key in show_entities.EXACT_MATCH_FILTERS:
+            statement = statement.where(show_entities.exact_match_predicate(key, parameter))
+        else:
+            statement = statement.where(getattr(orm.NetflixShow, key).like(parameter))
+
+    if full_text is not None:
+        if full_text:
+            statement = search_index.apply_full_text_match(statement, bindparam("q", type_=String),
+                                                           dialect_name=dialect_name, rank=not order_by)
+        else:
+            statement = statement.where(false())
+
+    if cursor_value_is_null is not None:
+        statement = statement.where(_keyset_seek_predicate(order_by, descending, cursor_value_is_null))
+
+    # Handle order by and sort (descending/ascending), with show_id as a tie-breaker so that pages are stable
+    statement = statement.order_by(*_search_order_by_clauses(order_by, descending))
+
+    if skip:
+        statement = statement.offset(bindparam("skip", type_=Integer))
+    if limit:
+        statement = statement.limit(bindparam("limit", type_=Integer))
+    return statement
 
 
 def search_netflix_show(db_session: Session,
@@ -61,7 +682,9 @@ def search_netflix_show(db_session: Session,
                         skip: int = None,
                         limit: int = None,
                         orderBy: str = None,
-                        sort: str = None):
+                        sort: str = None,
+                        q: str = None,
+                        cursor: api_models.SearchCursorModel = None):
     """
     Dynamically construct query based on the passed parameters and execute it
     :param db_session: SQLAlchemy database session object
@@ -70,31 +693,287 @@ def search_netflix_show(db_session: Session,
     :param limit: Max number of records to return
     :param orderBy: Name of column in Netflix table to order by
     :param sort: Descending / Ascending (desc/asc)
+    :param q: Free text to full-text search for. Results are ranked by relevance unless orderBy is given.
+    :param cursor: Position of the last show of the previous page, for keyset pagination. Must have been created for
+                   the same orderBy and sort.
     :return: (list) A list of NetflixShow Pydantic Model objects, representing the results retrieved from the DB.
 
     """
-    db_query = db_session.query(orm.NetflixShow)  # Create initial query
+    with replicas.replica_reads(db_session):
+        statement, parameters = _search_statement_and_parameters(db_session.get_bind().dialect.name,
+                                                                 filter_args=filter_args, orderBy=orderBy, sort=sort,
+                                                                 q=q, cursor=cursor, skip=skip, limit=limit)
 
-    # loop over all filters and add them in as SQL "LIKE" searches
-    for key, value in filter_args.dict().items():
-        if value:
-            db_query = db_query.filter(getattr(orm.NetflixShow, key).like(f"%{value}%"))  # searches for value as substring on both sides
+        shows = db_session.execute(statement, parameters).scalars().all()  # Execute the (cached) statement of the search
+    metrics.search_result_shows.observe(len(shows))
+    return shows
 
-    # Handle order by and sort (descending/ascending)
-    if orderBy:
-        order_by_attribute = getattr(orm.NetflixShow, orderBy.value)
-        if sort:
-            order_by_attribute = getattr(order_by_attribute, sort.value)()
 
-        db_query = db_query.order_by(order_by_attribute)
+def show_row_columns(column_names: List[str] = None):
+    """
+    :param column_names: Names of `SHOW_ROW_COLUMNS` to select, or None for all of them
+    :return: (tuple) The columns, in the order of `SHOW_ROW_COLUMNS` (so that the same names always give the same
+             statements)
+    :raises ValueError: If a name is not one of the `SHOW_ROW_COLUMNS`
+    """
+    if column_names is None:
+        return tuple(SHOW_ROW_COLUMNS)
+    unknown = set(column_names) - {column.name for column in SHOW_ROW_COLUMNS}
+    if unknown:
+        raise ValueError(f"Unknown show columns: {', '.join(sorted(unknown))}")
+    return tuple(column for column in SHOW_ROW_COLUMNS if column.name in column_names)
 
-    if limit:
-        db_query = db_query.limit(limit)
 
-    if skip:
-        db_query = db_query.offset(skip)
+def get_netflix_show_rows(db_session: Session, show_ids: List[int], columns: List[str] = None):
+    """
+    Retrieves existing shows using their show_ids as plain rows, with one statement per
+    `show_entities.MAX_NAMES_PER_STATEMENT` show_ids, eg. to load the shows requested by many parts of a GraphQL query
+    at once. The show cache is not used, as it holds whole rows.
+    :param db_session: SQLAlchemy Session
+    :param show_ids: Possibly existing NetflixShow IDs to return
+    :param columns: Names of the `SHOW_ROW_COLUMNS` to select, or None for all of them
+    :return: (dict) For each existing show_id, a dict of the values of the selected columns of the show
+    """
+    selected = show_row_columns(columns)
+    statement = select(*selected)
+    if orm.NetflixShow.__table__.c.show_id not in selected:
+        statement = statement.add_columns(orm.NetflixShow.__table__.c.show_id)
+    rows = {}
+    with replicas.replica_reads(db_session):
+        for _, batch in _chunks(sorted(set(show_ids)), show_entities.MAX_NAMES_PER_STATEMENT):
+            for row in _rows(db_session.execute(statement.where(orm.NetflixShow.show_id.in_(batch)))):
+                rows[row["show_id"]] = {column.name: row[column.name] for column in selected}
+    return rows
+
 
-    return db_query.all()  # Execute the dynamically generated, chained, filter expression
+def search_netflix_show_rows(db_session: Session,
+                             filter_args: models.NetflixShowSearchModel,
+                             skip: int = None,
+                             limit: int = None,
+                             orderBy: str = None,
+                             sort: str = None,
+                             q: str = None,
+                             cursor: api_models.SearchCursorModel = None,
+                             columns: List[str] = None):
+    """
+    `search_netflix_show`, fetching plain rows rather than loading ORM objects, read through the search cache, which
+    is keyed by a hash of the normalized parameters
+    :param columns: Names of the `SHOW_ROW_COLUMNS` to select, or None for all of them
+    :return: (list) For each result, a dict of the values of its selected `SHOW_ROW_COLUMNS`
+    """
+    selected = show_row_columns(columns)
+    search_parameters = dict(filter_args=filter_args, skip=skip, limit=limit, orderBy=orderBy, sort=sort, q=q,
+                             cursor=cursor)
+
+    def load():
+        if columnar_search is not None:
+            rows = columnar_search.search(db_session, netflix_show_rows, filter_args=filter_args, skip=skip,
+                                          limit=limit, order_by=orderBy.value if orderBy else None,
+                                          descending=_is_descending(sort), q=q, cursor=cursor)
+            if rows is not None:
+                if len(selected) == len(SHOW_ROW_COLUMNS):
+                    return rows
+                return [{column.name: row[column.name] for column in selected} for row in rows]
+        statement, parameters = _search_statement_and_parameters(db_session.get_bind().dialect.name,
+                                                                 columns=selected, **search_parameters)
+        return _rows(db_session.execute(statement, parameters))
+
+    projection = [column.name for column in selected] if len(selected) < len(SHOW_ROW_COLUMNS) else None
+    with replicas.replica_reads(db_session):
+        rows = _read_through(search_cache, _search_cache_key(**search_parameters, columns=projection), load)
+    metrics.search_result_shows.observe(len(rows))
+    return rows
+
+
+def search_netflix_show_models(db_session: Session,
+                               filter_args: models.NetflixShowSearchModel,
+                               skip: int = None,
+                               limit: int = None,
+                               orderBy: str = None,
+                               sort: str = None,
+                               q: str = None,
+                               cursor: api_models.SearchCursorModel = None):
+    """
+    `search_netflix_show_rows`, as Pydantic models
+    :return: (list) Pydantic NetflixShowVersion models of the results
+    """
+    rows = search_netflix_show_rows(db_session, filter_args=filter_args, skip=skip, limit=limit, orderBy=orderBy,
+                                    sort=sort, q=q, cursor=cursor)
+    return [models.NetflixShowVersionModel.construct(**row) for row in rows]  # Rows are already valid
+
+
+def netflix_show_facets_statement(dialect_name: str,
+                                  filter_args: models.NetflixShowSearchModel,
+                                  facets: List[str],
+                                  facet_limit: int,
+                                  q: str = None):
+    """
+    Construct the single select statement counting the shows matching a search by each value of each facet. The
+    matching show_ids are selected once, as a CTE, and grouped by each facet in a UNION ALL, from which the facet_limit
+    values with the most shows are kept per facet with a window function. Facets normalized by `show_entities` (eg.
+    country) are grouped by individual name from their join table, rather than by comma separated string.
+    :param dialect_name: Name of the database dialect the statement will run against (eg. "postgresql", "sqlite")
+    :param filter_args: Filter argument values for each column in the form of a Pydantic Model
+    :param facets: Names of the Netflix table columns to count the values of
+    :param facet_limit: Max number of values returned per facet
+    :param q: Free text to full-text search for
+    :return: SQLAlchemy Select of (facet, value, count) rows, where value is cast to a string
+    """
+    matching_show_ids = netflix_show_search_statement(dialect_name, filter_args=filter_args, q=q,
+                                                      columns=[orm.NetflixShow.show_id]) \
+        .order_by(None).cte("matching_shows")
+
+    facet_counts = []
+    for facet in facets:
+        if facet in show_entities.RELATIONS_BY_COLUMN:
+            relation = show_entities.RELATIONS_BY_COLUMN[facet]
+            value = relation.entity.name
+            facet_count = select(literal(facet).label("facet"), value.label("value"), func.count().label("count")) \
+                .select_from(relation.link) \
+                .join(relation.entity, relation.entity_id == relation.link_entity_id) \
+                .join(matching_show_ids, matching_show_ids.c.show_id == relation.link.show_id)
+        else:
+            value = getattr(orm.NetflixShow, facet)
+            facet_count = select(literal(facet).label("facet"), cast(value, String).label("value"),
+                                 func.count().label("count")) \
+                .join(matching_show_ids, matching_show_ids.c.show_id == orm.NetflixShow.show_id) \
+                .where(value.isnot(None))
+        facet_counts.append(facet_count.group_by(value))
+
+    counts = union_all(*facet_counts).subquery()
+    ranked = select(counts, func.row_number().over(partition_by=counts.c.facet,
+                                                   order_by=(counts.c.count.desc(), counts.c.value)).label("rank")) \
+        .subquery()
+    return select(ranked.c.facet, ranked.c.value, ranked.c.count) \
+        .where(ranked.c.rank <= facet_limit) \
+        .order_by(ranked.c.facet, ranked.c.rank)
+
+
+def get_netflix_show_facets(db_session: Session,
+                            filter_args: models.NetflixShowSearchModel,
+                            facets: List[str],
+                            facet_limit: int = 10,
+                            q: str = None):
+    """
+    Count the shows matching a search by each value of the given facets, in one query, read through the search cache
+    :param db_session: SQLAlchemy database session object
+    :param filter_args: Filter argument values for each column in the form of a Pydantic Model
+    :param facets: Names of the Netflix table columns to count the values of
+    :param facet_limit: Max number of values returned per facet, those with the most shows
+    :param q: Free text to full-text search for
+    :return: (dict) For each facet, a list of {"value", "count"} dicts in descending order of count
+    """
+    facets = list(dict.fromkeys(facets))
+
+    def load():
+        statement = netflix_show_facets_statement(db_session.get_bind().dialect.name, filter_args=filter_args,
+                                                  facets=facets, facet_limit=facet_limit, q=q)
+        facet_values = {facet: [] for facet in facets}
+        for facet, value, count in db_session.execute(statement):
+            if isinstance(getattr(orm.NetflixShow, facet).type, Integer):
+                value = int(value)  # Values are cast to strings to be combined into one column
+            facet_values[facet].append({"value": value, "count": count})
+        return facet_values
+
+    cache_key = _search_cache_key(filter_args=filter_args, q=q, facets=facets, facet_limit=facet_limit)
+    with replicas.replica_reads(db_session):
+        return _read_through(search_cache, cache_key, load)
+
+
+def netflix_show_export_statement(dialect_name: str,
+                                  filter_args: models.NetflixShowSearchModel,
+                                  orderBy: str = None,
+                                  sort: str = None,
+                                  q: str = None):
+    """
+    Search statement selecting plain rows of every Netflix table column, rather than ORM objects, and streaming them
+    from a server-side cursor where the database driver supports it
+    """
+    return netflix_show_search_statement(dialect_name, filter_args=filter_args, orderBy=orderBy, sort=sort, q=q,
+                                         columns=SHOW_COLUMNS) \
+        .execution_options(stream_results=True)
+
+
+def stream_netflix_shows(db_session: Session,
+                         filter_args: models.NetflixShowSearchModel,
+                         orderBy: str = None,
+                         sort: str = None,
+                         q: str = None,
+                         batch_size: int = 1000):
+    """
+    Run a search without materializing its results, fetching them batch_size rows at a time.
+    :param db_session: SQLAlchemy database session object
+    :param filter_args: Filter argument values for each column in the form of a Pydantic Model
+    :param orderBy: Name of column in Netflix table to order by
+    :param sort: Descending / Ascending (desc/asc)
+    :param q: Free text to full-text search for. Results are ranked by relevance unless orderBy is given.
+    :param batch_size: Number of rows fetched per round trip
+    :return: (generator) Lists of at most batch_size rows, each a mapping of column name to value
+    """
+    with replicas.replica_reads(db_session):
+        statement = netflix_show_export_statement(db_session.get_bind().dialect.name, filter_args=filter_args,
+                                                  orderBy=orderBy, sort=sort, q=q)
+        result = db_session.execute(statement)
+    try:
+        for partition in result.mappings().partitions(batch_size):
+            yield partition
+    finally:
+        result.close()
+
+
+def _is_descending(sort):
+    return sort is not None and sort.value == api_enums.SearchSortEnum.DESCENDING.value
+
+
+def _order_by_attribute(order_by: str):
+    """
+    :return: The column a search ordered by the given field is ordered by: the field's typed column if it has one in
+             `typed_columns.ORDER_BY_COLUMNS` (eg. date_added is ordered by date), otherwise its own column
+    """
+    typed_column = typed_columns.ORDER_BY_COLUMNS.get(order_by)
+    return typed_column.column if typed_column is not None else getattr(orm.NetflixShow, order_by)
+
+
+def _search_order_by_clauses(order_by: str = None, descending: bool = False):
+    """
+    ORDER BY clauses for a search. NULLs are placed last when ascending and first when descending (Postgres' default
+    placement, so plain B-tree indexes on (column, show_id) can serve every ordering), and show_id breaks ties.
+    :param order_by: Name of the field to order by
+    """
+    show_id_clause = orm.NetflixShow.show_id.desc() if descending else orm.NetflixShow.show_id.asc()
+    if not order_by or order_by == "show_id":
+        return [show_id_clause]
+
+    order_by_attribute = _order_by_attribute(order_by)
+    if descending:
+        return [order_by_attribute.desc().nullsfirst(), show_id_clause]
+    return [order_by_attribute.asc().nullslast(), show_id_clause]
+
+
+def _keyset_seek_predicate(order_by: str = None, descending: bool = False, cursor_value_is_null: bool = False):
+    """
+    WHERE clause selecting the shows which come after the cursor position, in the order given by
+    `_search_order_by_clauses`. This is the equivalent of WHERE (column, show_id) > (value, show_id), extended to take
+    the placement of NULLs into account. The cursor's position is bound as the cursor_value (unless it is NULL) and
+    cursor_show_id parameters, where the cursor_value is that of the column ordered by (see `_order_by_attribute`).
+    """
+    show_id = orm.NetflixShow.show_id
+    cursor_show_id = bindparam("cursor_show_id", type_=Integer)
+    if not order_by or order_by == "show_id":
+        return show_id < cursor_show_id if descending else show_id > cursor_show_id
+
+    order_by_attribute = _order_by_attribute(order_by)
+    key = tuple_(order_by_attribute, show_id)
+    cursor_key = tuple_(bindparam("cursor_value", type_=order_by_attribute.type), cursor_show_id)
+    if descending:  # Order: NULLs (show_id descending), then values descending
+        if cursor_value_is_null:
+            return or_(and_(order_by_attribute.is_(None), show_id < cursor_show_id), order_by_attribute.isnot(None))
+        return key < cursor_key
+
+    # Order: values ascending, then NULLs (show_id ascending)
+    if cursor_value_is_null:
+        return and_(order_by_attribute.is_(None), show_id > cursor_show_id)
+    return or_(key > cursor_key, order_by_attribute.is_(None))
 
 
 def get_number_netflix_shows(db_session: Session):
@@ -103,7 +982,8 @@ def get_number_netflix_shows(db_session: Session):
     :param db_session: SQLAlchemy DB session object
     :return: number of shows (records) in the database (int)
     """
-    return db_session.query(orm.NetflixShow).count()
+    with replicas.replica_reads(db_session):
+        return db_session.query(orm.NetflixShow).count()
 
 
 def get_number_of_unique_for_given_netflix_show_table_column(db_session: Session, column_name: str = None):
@@ -118,4 +998,46 @@ def get_number_of_unique_for_given_netflix_show_table_column(db_session: Session
     else:
         orm_database_object = orm.NetflixShow
 
-    return db_session.query(orm_database_object).distinct().count()
+    with replicas.replica_reads(db_session):
+        return db_session.query(orm_database_object).distinct().count()
+
+
+def _count_distinct_including_null(column):
+    """
+    Aggregate expression counting the distinct values of a column, counting NULL as a value like SELECT DISTINCT does
+    """
+    has_null = func.max(case([(column.is_(None), 1)], else_=0))
+    return func.count(column.distinct()) + func.coalesce(has_null, 0)
+
+
+def get_netflix_show_summary_counts(db_session: Session, use_cache: bool = True):
+    """
+    Compute the aggregate counts shown by the Summary in a single query. Directors and countries are counted
+    individually, from the join tables of `show_entities`, rather than as distinct comma separated strings. The result
+    is cached for this process until the cache's TTL expires or the table is written to through this module.
+    :param db_session: SQLAlchemy DB session object
+    :param use_cache: Whether the cached counts can be returned
+    :return: (dict) number_of_shows, number_of_unique_shows, number_of_unique_titles, number_of_unique_directors and
+             number_of_unique_countries
+    """
+    if use_cache:
+        cached_counts = summary_cache.get("counts")
+        if cached_counts is not None:
+            return dict(cached_counts)
+
+    generation = summary_cache.generation
+    show = orm.NetflixShow
+    with replicas.replica_reads(db_session):
+        row = db_session.execute(select(
+            func.count().label("number_of_shows"),
+            # Every show is unique, as distinct rows always have distinct show_ids (the primary key)
+            func.count().label("number_of_unique_shows"),
+            _count_distinct_including_null(show.title).label("number_of_unique_titles"),
+            # Individual directors and countries, rather than distinct comma separated strings
+            show_entities.count_distinct_entities("director").label("number_of_unique_directors"),
+            show_entities.count_distinct_entities("country").label("number_of_unique_countries"),
+        ).select_from(show)).one()
+
+    counts = dict(row._mapping)
+    summary_cache.set("counts", dict(counts), generation=generation)
+    return counts
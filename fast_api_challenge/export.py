@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+from typing import AsyncIterable, Iterable, List, Mapping
+
+from fast_api_challenge import database_interface
+from fast_api_challenge.models import api_enums
+
+"""
+Serialization of streamed search results, for the Export endpoint.
+
+Rows are serialized one batch at a time as they are fetched from the database, so the size of an export never affects
+memory use. Exported CSV files use the column names of the Netflix table as their header, so they can be loaded back
+with the ingestion CLI.
+"""
+
+EXPORT_COLUMNS = [column.name for column in database_interface.SHOW_COLUMNS]
+
+MEDIA_TYPES = {
+    api_enums.FileFormatEnum.CSV: "text/csv",
+    api_enums.FileFormatEnum.NDJSON: "application/x-ndjson",
+}
+
+
+def format_header(export_format: api_enums.FileFormatEnum):
+    """
+    :return: (str) Text preceding the rows of an export: the header row for CSV, nothing for NDJSON
+    """
+    if export_format == api_enums.FileFormatEnum.CSV:
+        return format_rows([{column_name: column_name for column_name in EXPORT_COLUMNS}], export_format)
+    return ""
+
+
+def format_rows(rows: List[Mapping], export_format: api_enums.FileFormatEnum):
+    """
+    Serialize a batch of rows, each a mapping of Netflix table column name to value
+    :return: (str) One line (CSV record) per row
+    """
+    if export_format == api_enums.FileFormatEnum.NDJSON:
+        return "".join(json.dumps({column_name: row[column_name] for column_name in EXPORT_COLUMNS}) + "\n"
+                       for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)  # The default "\r\n" line terminator also makes fields containing "\r" be quoted
+    writer.writerows([row[column_name] for column_name in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+
+def export_chunks(batches: Iterable[List[Mapping]], export_format: api_enums.FileFormatEnum):
+    """
+    :param batches: Batches of rows, eg. from `database_interface.stream_netflix_shows`
+    :return: (generator) Chunks of text of the export, one per batch of rows
+    """
+    yield format_header(export_format)
+    for rows in batches:
+        yield format_rows(rows, export_format)
+
+
+async def async_export_chunks(batches: AsyncIterable[List[Mapping]], export_format: api_enums.FileFormatEnum):
+    """
+    Async variant of `export_chunks`, for batches from `async_database_interface.stream_netflix_shows`
+    """
+    yield format_header(export_format)
+    async for rows in batches:
+        yield format_rows(rows, export_format)
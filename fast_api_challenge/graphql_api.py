@@ -0,0 +1,375 @@
+import asyncio
+import functools
+from datetime import date
+from inspect import isawaitable
+from typing import Any, Dict, List, Optional
+
+from graphql import FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLArgument, GraphQLEnumType, \
+    GraphQLEnumValue, GraphQLError, GraphQLField, GraphQLInputField, GraphQLInputObjectType, GraphQLInt, GraphQLList, \
+    GraphQLNonNull, GraphQLObjectType, GraphQLScalarType, GraphQLSchema, GraphQLString, InlineFragmentNode, \
+    StringValueNode, execute, get_operation_ast, parse, print_schema, validate
+from graphql.execution.values import get_argument_values, get_variable_values
+from pydantic import ValidationError
+from sqlalchemy import DateTime, Integer
+
+from fast_api_challenge import database_interface, pagination
+from fast_api_challenge.models import database_models as models
+from fast_api_challenge.models import api_enums
+from utils import get_graphql_limits
+
+"""
+GraphQL interface to the shows, served by the /graphql endpoint, with the same filters, ordering and pagination as the
+Search endpoint.
+
+Only the columns of the show fields a query selects are read from the database: searches select them (see the columns
+of `database_interface.search_netflix_show_rows`), and shows requested by id are read by a `BatchLoader` per set of
+columns, which reads every show_id requested in the same step of the execution (eg. by many aliased show fields) with
+a single statement.
+
+Before it is executed, a query is rejected if its fields are nested deeper than the max depth, or if its cost (an
+estimate of the shows it reads: 1 per show, the number of show_ids of shows, and SEARCH_COST plus the limit of each
+search) is above the max cost. Introspection fields are not limited.
+"""
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 999  # As for the Search endpoint
+MAX_Q_LENGTH = 500
+MAX_CURSOR_LENGTH = 2048
+SEARCH_COST = 50  # Cost of a search besides the shows it returns, as it may have to scan many more
+QUERY_CACHE_SIZE = 256  # Number of distinct query strings whose parsed and validated document is kept
+
+
+def _serialize_date(value):
+    return value.isoformat()
+
+
+def _parse_date_value(value):
+    if not isinstance(value, str):
+        raise ValueError("Dates must be strings in the format YYYY-MM-DD.")
+    return date.fromisoformat(value)
+
+
+def _parse_date_literal(value_node, _variables=None):
+    if not isinstance(value_node, StringValueNode):
+        raise ValueError("Dates must be strings in the format YYYY-MM-DD.")
+    return _parse_date_value(value_node.value)
+
+
+DateScalar = GraphQLScalarType("Date", description="Date in the ISO 8601 format YYYY-MM-DD, eg. 2021-01-31",
+                               serialize=_serialize_date, parse_value=_parse_date_value,
+                               parse_literal=_parse_date_literal)
+DateTimeScalar = GraphQLScalarType("DateTime", description="Date and time in the ISO 8601 format",
+                                   serialize=_serialize_date)
+
+
+def _column_type(column):
+    if column.name in ("show_id", "version"):
+        return GraphQLNonNull(GraphQLInt)
+    if isinstance(column.type, Integer):
+        return GraphQLInt
+    if isinstance(column.type, DateTime):
+        return DateTimeScalar
+    return GraphQLString
+
+
+def _filter_type(field):
+    if issubclass(field.outer_type_, int):
+        return GraphQLInt
+    if issubclass(field.outer_type_, date):
+        return DateScalar
+    return GraphQLString
+
+
+ShowType = GraphQLObjectType(
+    "Show", description="A Netflix movie or TV show, along with its row version",
+    fields={column.name: GraphQLField(_column_type(column)) for column in database_interface.SHOW_ROW_COLUMNS})
+ShowSearchFilterType = GraphQLInputObjectType(
+    "ShowSearchFilter", description="Filters of a search, as the filter parameters of the Search endpoint",
+    fields={name: GraphQLInputField(_filter_type(field))
+            for name, field in models.NetflixShowSearchModel.__fields__.items()})
+ShowOrderByType = GraphQLEnumType("ShowOrderBy", {member.value: GraphQLEnumValue(member)
+                                                  for member in api_enums.SearchOrderByEnum})
+SortType = GraphQLEnumType("Sort", {member.value: GraphQLEnumValue(member) for member in api_enums.SearchSortEnum})
+ShowPageType = GraphQLObjectType(
+    "ShowPage", description="A page of search results",
+    fields={
+        "shows": GraphQLField(GraphQLNonNull(GraphQLList(GraphQLNonNull(ShowType)))),
+        "next_cursor": GraphQLField(GraphQLString, description="Cursor of the next page, when the page is full and "
+                                                               "the search is not ranked by relevance"),
+    })
+
+
+class BatchLoader:
+    """
+    Loads the values of many keys with one call: the keys requested until the event loop runs the pending load are
+    loaded together, and each key is only loaded once
+    """
+
+    def __init__(self, load_batch):
+        self.load_batch = load_batch  # Async function(list of keys) returning a dict of key to value
+        self._futures = {}
+        self._pending = []
+
+    def load(self, key):
+        """
+        :return: (Future) The value of the key, or None if the loaded dict doesn't have it
+        """
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._pending:
+                loop.create_task(self._load_pending())  # Runs after the resolvers which are already scheduled
+            self._pending.append(key)
+        return future
+
+    async def _load_pending(self):
+        keys, self._pending = self._pending, []
+        try:
+            values = await self.load_batch(keys)
+        except Exception as e:
+            for key in keys:
+                self._futures[key].set_exception(e)
+            return
+        for key in keys:
+            self._futures[key].set_result(values.get(key))
+
+
+class GraphQLContext:
+    """
+    State of the execution of a query: its database calls, which are made one at a time as they share the request's
+    database session, and its show loaders
+    """
+
+    def __init__(self, call_database):
+        self._call_database = call_database  # Async function(database_interface function, **kwargs)
+        self._lock = asyncio.Lock()
+        self._show_loaders = {}
+        self.database_error = None  # Unexpected error raised by a database call, which fails the request
+
+    async def call_database(self, database_function, **kwargs):
+        async with self._lock:
+            try:
+                return await self._call_database(database_function, **kwargs)
+            except Exception as e:
+                self.database_error = e
+                raise
+
+    def show_loader(self, columns: tuple):
+        """
+        :return: (BatchLoader) Loader of the rows of shows by show_id, with the given columns
+        """
+        loader = self._show_loaders.get(columns)
+        if loader is None:
+            loader = self._show_loaders[columns] = BatchLoader(
+                lambda show_ids: self.call_database(database_interface.get_netflix_show_rows, show_ids=show_ids,
+                                                    columns=list(columns)))
+        return loader
+
+
+def _selected_fields(info, selection_sets):
+    """
+    :return: (dict) The field nodes selected by the selection sets (and their fragments), by field name
+    """
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+                continue
+            if isinstance(selection, InlineFragmentNode):
+                fragment_selection_set = selection.selection_set
+            else:
+                fragment_selection_set = info.fragments[selection.name.value].selection_set
+            for name, nodes in _selected_fields(info, [fragment_selection_set]).items():
+                fields.setdefault(name, []).extend(nodes)
+    return fields
+
+
+def _show_columns(info, field_nodes: List[FieldNode], *required: str):
+    """
+    :return: (tuple) Names of the columns of the show fields selected by the field nodes, and of the required columns,
+             in the order of `SHOW_ROW_COLUMNS`
+    """
+    selected = set(_selected_fields(info, [node.selection_set for node in field_nodes])) | {"show_id", *required}
+    return tuple(column.name for column in database_interface.SHOW_ROW_COLUMNS if column.name in selected)
+
+
+async def _resolve_show(_, info, show_id: int):
+    return await info.context.show_loader(_show_columns(info, info.field_nodes)).load(show_id)
+
+
+async def _resolve_shows(_, info, show_ids: List[int]):
+    loader = info.context.show_loader(_show_columns(info, info.field_nodes))
+    return await asyncio.gather(*[loader.load(show_id) for show_id in show_ids])
+
+
+def _validation_message(error: ValidationError):
+    return "; ".join(f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+
+
+async def _resolve_search(_, info, filter: Optional[Dict[str, Any]] = None, skip: int = None,
+                          limit: int = DEFAULT_SEARCH_LIMIT, orderBy: api_enums.SearchOrderByEnum = None,
+                          sort: api_enums.SearchSortEnum = None, q: str = None, cursor: str = None):
+    if skip is not None and skip < 0:
+        raise GraphQLError("skip must be greater than or equal to 0.")
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        raise GraphQLError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}.")
+    if q is not None and not 0 < len(q) <= MAX_Q_LENGTH:
+        raise GraphQLError(f"q must be between 1 and {MAX_Q_LENGTH} characters long.")
+    if cursor is not None and len(cursor) > MAX_CURSOR_LENGTH:
+        raise GraphQLError(f"cursor must be at most {MAX_CURSOR_LENGTH} characters long.")
+    try:
+        filter_args = models.NetflixShowSearchModel(**(filter or {}))
+    except ValidationError as e:
+        raise GraphQLError(f"Invalid filter: {_validation_message(e)}")
+    try:
+        search_cursor = pagination.decode_search_cursor(cursor, skip=skip, q=q, orderBy=orderBy, sort=sort)
+    except ValueError as e:
+        raise GraphQLError(str(e))
+
+    shows_nodes = _selected_fields(info, [node.selection_set for node in info.field_nodes]).get("shows", [])
+    columns = _show_columns(info, shows_nodes, *([orderBy.value] if orderBy else []))
+    shows = await info.context.call_database(database_interface.search_netflix_show_rows, filter_args=filter_args,
+                                             skip=skip, limit=limit, orderBy=orderBy, sort=sort, q=q,
+                                             cursor=search_cursor, columns=list(columns))
+    next_cursor = None
+    if len(shows) == limit and not (q and not orderBy):
+        next_cursor = pagination.encode_cursor(shows[-1], orderBy=orderBy, sort=sort)
+    return {"shows": shows, "next_cursor": next_cursor}
+
+
+QueryType = GraphQLObjectType("Query", fields={
+    "show": GraphQLField(ShowType, description="The show with the given show_id, or null",
+                         args={"show_id": GraphQLArgument(GraphQLNonNull(GraphQLInt))}, resolve=_resolve_show),
+    "shows": GraphQLField(GraphQLNonNull(GraphQLList(ShowType)),
+                          description="The shows with the given show_ids, in order, with null for missing shows",
+                          args={"show_ids": GraphQLArgument(GraphQLNonNull(GraphQLList(GraphQLNonNull(GraphQLInt))))},
+                          resolve=_resolve_shows),
+    "search": GraphQLField(
+        GraphQLNonNull(ShowPageType),
+        description="Search for shows, as the Search endpoint does, returning a page of limit shows",
+        args={
+            "filter": GraphQLArgument(ShowSearchFilterType),
+            "skip": GraphQLArgument(GraphQLInt),
+            "limit": GraphQLArgument(GraphQLNonNull(GraphQLInt), default_value=DEFAULT_SEARCH_LIMIT,
+                                     description=f"At most {MAX_SEARCH_LIMIT}"),
+            "orderBy": GraphQLArgument(ShowOrderByType),
+            "sort": GraphQLArgument(SortType),
+            "q": GraphQLArgument(GraphQLString, description="Free text to full-text search for, ranking the results "
+                                                            "by relevance unless orderBy is given"),
+            "cursor": GraphQLArgument(GraphQLString, description="next_cursor of the previous page"),
+        },
+        resolve=_resolve_search),
+})
+
+schema = GraphQLSchema(query=QueryType)
+
+SCHEMA_SDL = print_schema(schema)
+
+
+def _field_cost(field_node: FieldNode, variables: Dict[str, Any]):
+    """
+    :param variables: Variables of the query, coerced to their types
+    :return: (int) Cost of a root field of a query, 0 if its arguments are invalid (which fails its execution)
+    """
+    field = QueryType.fields.get(field_node.name.value)
+    if field is None:
+        return 0
+    try:
+        arguments = get_argument_values(field, field_node, variables)
+    except GraphQLError:
+        return 0
+    if field_node.name.value == "shows":
+        return len(arguments["show_ids"] or [])
+    if field_node.name.value == "search":
+        return SEARCH_COST + max(arguments["limit"] or 0, 0)
+    return 1
+
+
+def _limit_errors(document, operation_name: Optional[str], variables: Optional[Dict[str, Any]], max_depth: int,
+                  max_cost: int):
+    """
+    :return: (list) Errors of the operation of a (valid) query whose variables are invalid, or whose depth or cost is
+             above the limits
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return []  # Reported by the execution
+    # The cost is computed from the arguments, which are only valid with variables coerced to their types
+    variables = get_variable_values(schema, operation.variable_definitions or [], variables or {})
+    if isinstance(variables, list):
+        return variables
+    fragments = {definition.name.value: definition for definition in document.definitions
+                 if isinstance(definition, FragmentDefinitionNode)}
+
+    def fields(selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                if not selection.name.value.startswith("__"):
+                    yield selection
+            elif isinstance(selection, FragmentSpreadNode):
+                yield from fields(fragments[selection.name.value].selection_set)
+            else:
+                yield from fields(selection.selection_set)
+
+    def depth(selection_set):
+        return 1 + max((depth(field.selection_set) if field.selection_set else 1 for field in fields(selection_set)),
+                       default=0)
+
+    errors = []
+    query_depth = depth(operation.selection_set) - 1
+    if query_depth > max_depth:
+        errors.append(GraphQLError(f"The query has a depth of {query_depth}, above the max depth of {max_depth}."))
+    cost = sum(_field_cost(field, variables) for field in fields(operation.selection_set))
+    if cost > max_cost:
+        errors.append(GraphQLError(f"The query has a cost of {cost}, above the max cost of {max_cost}."))
+    return errors
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _parse_and_validate(query: str):
+    """
+    Parse and validate a query, which is cached as clients send the same queries with different variables, and
+    validating takes most of the time of executing simple queries
+    :return: (tuple) The document of the query, or None if it can't be parsed, and (tuple) its errors
+    """
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        return None, (e,)
+    return document, tuple(validate(schema, document))
+
+
+async def execute_query(query: str, variables: Optional[Dict[str, Any]], operation_name: Optional[str],
+                        call_database, max_depth: int = None, max_cost: int = None):
+    """
+    Validate and execute a GraphQL query
+    :param call_database: Async function(database_interface function, **kwargs) returning the result of the function
+                          called with a database session
+    :param max_depth: Max depth of the query's fields, defaults to GRAPHQL_MAX_QUERY_DEPTH
+    :param max_cost: Max cost of the query, defaults to GRAPHQL_MAX_QUERY_COST
+    :return: (tuple) HTTP status code (400 if the query can't be executed), and the response content: the data and
+             errors of the execution
+    """
+    limits = get_graphql_limits()
+    document, errors = _parse_and_validate(query)
+    errors = errors or _limit_errors(
+        document, operation_name, variables, max_depth=limits["max_depth"] if max_depth is None else max_depth,
+        max_cost=limits["max_cost"] if max_cost is None else max_cost)
+    if errors:
+        return 400, {"errors": [error.formatted for error in errors]}
+
+    context = GraphQLContext(call_database)
+    result = execute(schema, document, context_value=context, variable_values=variables,
+                     operation_name=operation_name)
+    if isawaitable(result):
+        result = await result
+    if context.database_error is not None:
+        raise context.database_error
+    content = result.formatted
+    if content["errors"] is None:
+        del content["errors"]  # Only present when there are errors
+    return 200, content
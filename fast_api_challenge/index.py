@@ -1,21 +1,45 @@
+from fast_api_challenge import startup  # First, so that the startup timer includes the imports below
+
+import json
+import logging
+import math
+import os
+import time
 import uvicorn
-from typing import Optional, List
-from fastapi import Depends, FastAPI, HTTPException, Query, status
+from typing import Optional, List, Union
+from fastapi import Body, Depends, FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile, \
+    status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
 from fast_api_challenge.models import database_models as models
 from fast_api_challenge.models import api_enums, api_models
-from fast_api_challenge import database_interface
-from fast_api_challenge.auth import create_access_token, authenticate_api_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from fast_api_challenge import admission, async_database_interface, coalescing, conditional, database_interface, \
+    export, ingestion, metrics, pagination, serialization
+from fast_api_challenge.auth import create_access_token, authenticate_api_user, verify_access_token, \
+    describe_token_verification, is_metrics_bearer_token, InvalidTokenError, ACCESS_TOKEN_EXPIRE_MINUTES
+
+from fast_api_challenge.database import base, schema
+from utils import get_admission_settings, get_bulk_chunk_size, get_export_batch_size, get_openapi_schema_file, \
+    get_rate_limit_settings, get_read_coalescing_timeout_seconds, get_schema_startup_mode
+
+startup.timer.lap("imports")
 
-from fast_api_challenge.database import base
+logger = logging.getLogger(__name__)
 
-base.Base.metadata.create_all(bind=base.engine)  # Create table schema in db if not exists
+SCHEMA_STARTUP = schema.prepare_schema(base.engine, get_schema_startup_mode())  # Create table schema if needed
+if base.async_engine is not None:
+    base.engine.dispose()  # Requests use the async engine, so don't keep the connection used for the schema open
+startup.timer.lap("schema")
 
 
-version = open("VERSION", "r")
+# Read relative to the project root rather than the working directory
+version = open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "VERSION"), "r")
 VERSION = version.readline()  # Used for metadata info
 version.close()
 
@@ -25,6 +49,33 @@ app = FastAPI(
     description="Showcases many FastApi features and good coding practices by exposing the Netflix Movies and TV Shows "
                 "database via a RESTful Api, along with a Search feature.",
     version=VERSION,)
+
+
+def create_admission_controller():
+    """
+    Creates the rate limiter and concurrency cap configured by the environment. The shared memory of the rate limits
+    is created at import, so that with gunicorn's preload_app it is shared by every worker.
+    :return: (admission.AdmissionController) Its limits, which are None when disabled
+    """
+    rate_limit_settings, admission_settings = get_rate_limit_settings(), get_admission_settings()
+    rate_limiter = None
+    if rate_limit_settings["per_second"] > 0:
+        store = admission.SharedMemoryRateLimitStore(rate_limit_settings["shared_slots"]) \
+            if rate_limit_settings["shared_slots"] > 0 else admission.InMemoryRateLimitStore()
+        rate_limiter = admission.RateLimiter(rate_limit_settings["per_second"], rate_limit_settings["burst"], store)
+    concurrency_limiter = None
+    if admission_settings["max_concurrency"] > 0:
+        concurrency_limiter = admission.ConcurrencyLimiter(
+            admission_settings["max_concurrency"], admission_settings["queue_timeout_seconds"],
+            min_retry_after_seconds=admission_settings["retry_after_seconds"])
+    return admission.AdmissionController(rate_limiter, concurrency_limiter)
+
+
+admission_controller = create_admission_controller()
+app.add_middleware(admission.AdmissionControlMiddleware, controller=admission_controller)  # Inside the metrics
+app.add_middleware(startup.FirstRequestTimingMiddleware)
+app.add_middleware(metrics.PrometheusMiddleware)
+metrics.instrument_sql()
 APPLICATION_START_TIME = datetime.utcnow()  # Used for metadata info
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -34,82 +85,430 @@ tags_metadata = [
         "name": "REST Api",
         "description": "RESTful data operations, along with Search."
     },
+    {
+        "name": "GraphQL",
+        "description": "GraphQL queries of the shows, and Search."
+    },
     {
         "name": "Auth",
         "description": "Authentication related endpoints."
     },
+    {
+        "name": "Monitoring",
+        "description": "Operational metrics of the current Api node."
+    },
 ]
 
 
-def get_db():
-    db = base.DbSession()
+async def get_db():
+    if base.AsyncDbSession is not None:
+        db = base.AsyncDbSession()
+        try:
+            yield db
+        finally:
+            await db.close()
+    else:
+        db = base.DbSession()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
+    """
+    Verifies the request's bearer token, unless the admission control already has.
+    :return: (dict) The token's claims
+    """
+    verified_token, claims = request.scope.get(admission.VERIFIED_TOKEN_SCOPE_KEY, (None, None))
+    if verified_token == token:
+        return dict(claims)
     try:
-        yield db
-    finally:
-        db.close()
+        return verify_access_token(token)
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def verify_metrics_token(request: Request, token: str = Depends(oauth2_scheme)):
+    """
+    Verifies the request's bearer token, which may also be the static METRICS_BEARER_TOKEN of the metrics scrapes.
+    :return: (dict) The token's claims, empty for the static token
+    """
+    if is_metrics_bearer_token(token):
+        return {}
+    return await verify_token(request, token)
+
+
+# Shares the result of a read with the identical reads made while it is in flight, unless disabled
+read_coalescer = coalescing.SingleFlight(get_read_coalescing_timeout_seconds()) \
+    if get_read_coalescing_timeout_seconds() > 0 else None
+
+
+async def run_database_call(database_function, db, **kwargs):
+    """
+    Runs a `database_interface` function using the request's database session. With the async database engine, its
+    `async_database_interface` variant is awaited directly, otherwise the blocking function is run in the threadpool.
+    Reads which are identical to a read in flight in this worker wait for its result instead (see `coalescing`).
+    :param database_function: Function in `database_interface` to call
+    :param db: Database session from `get_db`
+    :param kwargs: Keyword arguments of the function, besides the database session
+    :return: The function's return value
+    """
+    async def call():
+        with metrics.database_call(database_function.__name__):
+            if base.AsyncDbSession is not None:
+                return await getattr(async_database_interface, database_function.__name__)(db, **kwargs)
+            return await run_in_threadpool(database_function, db, **kwargs)
+
+    key = database_interface.coalescing_key(database_function.__name__, **kwargs) if read_coalescer else None
+    if key is None:
+        return await call()
+    return await read_coalescer.run(key, call, name=database_function.__name__)
 
 
 @app.post("/show/", response_model=models.NetflixShowModel, status_code=201, tags=["REST Api"])
-def create_show(show: models.NetflixShowModel, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def create_show(show: models.NetflixShowModel, response: Response, db: Session = Depends(get_db),
+                      claims: dict = Depends(verify_token)):
     """
     Create a new show in the database. Throws an error if a show with the given show_id already exists, and generates
     a new show_id if one is not specified.
     """
-    if show.show_id and database_interface.get_netflix_show(db, show_id=show.show_id):
+    try:
+        created = await run_database_call(database_interface.create_netflix_show, db, show=show)
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Show already exists with given show_id.")
-    return database_interface.create_netflix_show(db, show=show)
+    response.headers.update(conditional.show_validator_headers(models.NetflixShowVersionModel.from_orm(created)))
+    return created
 
 
-@app.get("/show/{show_id}", response_model=models.NetflixShowModel, tags=["REST Api"])
-def get_show(show_id: int, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+@app.get("/show/{show_id}", response_model=models.NetflixShowModel, tags=["REST Api"],
+         responses={304: {"description": "Not Modified"}})
+async def get_show(show_id: int,
+                   if_none_match: Optional[str] = Header(None),
+                   if_modified_since: Optional[str] = Header(None),
+                   db: Session = Depends(get_db),
+                   claims: dict = Depends(verify_token)):
     """
     Retrieve a show from the database with the given show_id, if one exists.
+
+    The response carries the show's ETag and Last-Modified headers. When the If-None-Match (or If-Modified-Since)
+    header shows the client already has the current version of the show, an empty 304 Not Modified is returned.
     """
-    show = database_interface.get_netflix_show(db, show_id=show_id)
+    show = await run_database_call(database_interface.get_netflix_show_row, db, show_id=show_id)
     if show is None:
         raise HTTPException(status_code=404, detail="Show not found.")
-    return show
+    validator_headers = conditional.show_validator_headers(show)
+    if conditional.not_modified(if_none_match, if_modified_since, etag=validator_headers["ETag"],
+                                last_modified=show["updated_at"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers)
+    return ORJSONResponse(serialization.show_content(show), headers=validator_headers)
 
 
-@app.get("/shows", response_model=List[models.NetflixShowModel], tags=["REST Api"])
-def get_shows(
+@app.get("/shows", response_model=Union[List[models.NetflixShowModel], api_models.SearchResultsModel],
+         tags=["REST Api"], responses={304: {"description": "Not Modified"}})
+async def get_shows(
               filter_args: models.NetflixShowSearchModel=Depends(),
               skip: Optional[int] = Query(None, ge=0),
               limit: Optional[int] = Query(None, gt=0, lt=1000),
               orderBy: api_enums.SearchOrderByEnum = None,
               sort: api_enums.SearchSortEnum = None,
+              q: Optional[str] = Query(None, min_length=1, max_length=500),
+              cursor: Optional[str] = Query(None, max_length=2048),
+              facets: Optional[str] = Query(None, max_length=200),
+              facet_limit: int = Query(10, gt=0, le=100),
+              if_none_match: Optional[str] = Header(None),
               db: Session = Depends(get_db),
-              token: str = Depends(oauth2_scheme)):
+              claims: dict = Depends(verify_token)):
     """
     Search for shows, based on query parameters. Includes the ability to paginate using skip and limit, the ability to
     sort using sort and orderBy, and the ability to filter based on any database field with a parameter identical to
-    each field name.
+    each field name. The q parameter performs a full-text search over the title, description, cast, director and
+    listed_in fields, returning the results ranked by relevance unless orderBy is given.
+
+    The range parameters release_year_gte and release_year_lte, date_added_from and date_added_to (dates, eg.
+    2021-01-31) and duration_max (in minutes, which only movies have) keep the shows within (inclusive) bounds, using
+    the dates and durations parsed from the date_added and duration fields. orderBy=date_added also orders shows by
+    date, with those whose date_added can't be parsed as a date placed like missing values.
+
+    When a full page of `limit` results is returned, the `X-Next-Cursor` response header contains an opaque cursor.
+    Passing it as the cursor parameter (with the same filters, orderBy and sort) fetches the next page, which costs
+    the same as fetching the first page, unlike skip.
+
+    The facets parameter is a comma separated list of fields (type, rating, release_year, country, listed_in) whose
+    values to count over every show matching the search, not only those on the page. When given, the shows and the
+    facet_limit most common values of each facet are returned together as {"shows": [...], "facets": {...}}. Shows are
+    counted once for each of their individual countries and genres.
+
+    The response carries an ETag for the page of results. When the If-None-Match header shows the client already has
+    the current page, an empty 304 Not Modified is returned.
+    """
+    ranked_by_relevance = q and not orderBy
+    try:
+        search_cursor = pagination.decode_search_cursor(cursor, skip=skip, q=q, orderBy=orderBy, sort=sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    facet_names = None
+    if facets is not None:
+        try:
+            facet_names = [api_enums.SearchFacetEnum(name.strip()).value for name in facets.split(",") if name.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid facets, expected a comma separated list of: " +
+                                                        ", ".join(facet.value for facet in api_enums.SearchFacetEnum))
+
+    shows = await run_database_call(database_interface.search_netflix_show_rows, db, filter_args=filter_args,
+                                    skip=skip, limit=limit, orderBy=orderBy, sort=sort, q=q, cursor=search_cursor)
+    facet_values = None
+    if facet_names:
+        facet_values = await run_database_call(database_interface.get_netflix_show_facets, db, filter_args=filter_args,
+                                               facets=facet_names, facet_limit=facet_limit, q=q)
+    headers = {"ETag": conditional.page_etag(shows, facets=facet_values)}
+    if limit and len(shows) == limit and not ranked_by_relevance:
+        headers["X-Next-Cursor"] = pagination.encode_cursor(shows[-1], orderBy=orderBy, sort=sort)
+    if conditional.not_modified(if_none_match, etag=headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if facet_values is not None:
+        return ORJSONResponse({"shows": serialization.shows_content(shows), "facets": facet_values}, headers=headers)
+    return ORJSONResponse(serialization.shows_content(shows), headers=headers)
+
+
+def export_shows_chunks(export_format: api_enums.FileFormatEnum, **search_kwargs):
+    """
+    Stream an export with its own database session, which stays open until the whole export has been sent
+    """
+    db = base.DbSession()
+    try:
+        yield from export.export_chunks(database_interface.stream_netflix_shows(db, **search_kwargs), export_format)
+    finally:
+        db.close()
+
+
+async def async_export_shows_chunks(export_format: api_enums.FileFormatEnum, **search_kwargs):
+    """
+    Async variant of `export_shows_chunks`
+    """
+    db = base.AsyncDbSession()
+    try:
+        async for chunk in export.async_export_chunks(async_database_interface.stream_netflix_shows(db, **search_kwargs),
+                                                      export_format):
+            yield chunk
+    finally:
+        await db.close()
+
+
+@app.get("/shows/export", response_class=StreamingResponse, tags=["REST Api"])
+async def export_shows(filter_args: models.NetflixShowSearchModel = Depends(),
+                       orderBy: api_enums.SearchOrderByEnum = None,
+                       sort: api_enums.SearchSortEnum = None,
+                       q: Optional[str] = Query(None, min_length=1, max_length=500),
+                       format: api_enums.FileFormatEnum = api_enums.FileFormatEnum.NDJSON,
+                       claims: dict = Depends(verify_token)):
+    """
+    Export every show matching a search, with the same filters, q, orderBy and sort parameters as the Search endpoint,
+    as an NDJSON (default) or CSV file. The results are streamed from the database as they are sent, so exports of any
+    size can be downloaded.
     """
     if sort and not orderBy:
         raise HTTPException(status_code=400, detail="Cannot use the sort parameter without the orderBy parameter.")
-    return database_interface.search_netflix_show(db, filter_args=filter_args, skip=skip, limit=limit, orderBy=orderBy,
-                                                  sort=sort)
+    search_kwargs = dict(filter_args=filter_args, orderBy=orderBy, sort=sort, q=q,
+                         batch_size=get_export_batch_size())
+    if base.AsyncDbSession is not None:
+        chunks = async_export_shows_chunks(format, **search_kwargs)
+    else:
+        chunks = export_shows_chunks(format, **search_kwargs)
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="shows.{format.value}"'})
+
+
+async def expected_show_version(db, show_id: int, if_match: Optional[str]):
+    """
+    Evaluates the If-Match header of a write to a show, against the show's current row
+    :return: (int) The version the show must still have when it is written, or None if there is no If-Match header
+    """
+    if if_match is None:
+        return None
+    current = await run_database_call(database_interface.get_netflix_show_model, db, show_id=show_id, use_cache=False)
+    if not conditional.match(if_match, conditional.show_etag(current) if current else None):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                            detail="The show does not match the If-Match header.")
+    return current.version
 
 
 @app.put("/show/{show_id}", response_model=models.NetflixShowModel, tags=["REST Api"])
-def update_show(show: models.NetflixShowUpdateModel, show_id: int, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def update_show(show: models.NetflixShowUpdateModel, show_id: int, response: Response,
+                      if_match: Optional[str] = Header(None), db: Session = Depends(get_db),
+                      claims: dict = Depends(verify_token)):
     """
     Update the show with the given show_id using the fields in the request. Throws an error if the show_id does not
-    exist.
+    exist. If an If-Match header is sent, the show is only updated if it still matches one of the given ETags (or
+    any version, for "*"), otherwise 412 Precondition Failed is returned.
     """
-    if not database_interface.get_netflix_show(db, show_id=show_id):
+    expected_version = await expected_show_version(db, show_id, if_match)
+    updated = await run_database_call(database_interface.update_netflix_show, db, show=show, show_id=show_id,
+                                      expected_version=expected_version)
+    if updated is None and expected_version is not None:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                            detail="The show was modified concurrently.")
+    current = await run_database_call(database_interface.get_netflix_show_model, db, show_id=show_id)
+    if updated is None or current is None:
         raise HTTPException(status_code=404, detail="Show not found.")
-    return database_interface.update_netflix_show(db, show=show, show_id=show_id)
+    response.headers.update(conditional.show_validator_headers(current))
+    return current
 
 
 @app.delete("/show/{show_id}", tags=["REST Api"])
-def delete_show(show_id: int, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def delete_show(show_id: int, if_match: Optional[str] = Header(None), db: Session = Depends(get_db),
+                      claims: dict = Depends(verify_token)):
     """
-    Remove the show with the given show_id from the databse, if one exists.
+    Remove the show with the given show_id from the databse, if one exists. If an If-Match header is sent, the show
+    is only deleted if it still matches one of the given ETags, otherwise 412 Precondition Failed is returned.
     """
-    if not database_interface.get_netflix_show(db, show_id=show_id):
+    expected_version = await expected_show_version(db, show_id, if_match)
+    if not await run_database_call(database_interface.delete_netflix_show, db, show_id=show_id,
+                                   expected_version=expected_version):
+        if expected_version is not None:
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                detail="The show was modified concurrently.")
         raise HTTPException(status_code=404, detail="Show not found.")
-    return database_interface.delete_netflix_show(db, show_id=show_id)
+
+
+def bulk_operation_response(results: List[api_models.BulkItemResultModel], chunk_size: int, elapsed_seconds: float):
+    """
+    Summarize the per-item results of a bulk operation, along with its throughput
+    """
+    failed = sum(1 for result in results if result.status in (api_enums.BulkItemStatusEnum.FAILED,
+                                                              api_enums.BulkItemStatusEnum.CONFLICT,
+                                                              api_enums.BulkItemStatusEnum.NOT_FOUND))
+    return api_models.BulkOperationResponseModel(items=results,
+                                                 succeeded=len(results) - failed,
+                                                 failed=failed,
+                                                 chunk_size=chunk_size,
+                                                 chunks=math.ceil(len(results) / chunk_size),
+                                                 elapsed_seconds=elapsed_seconds,
+                                                 rows_per_second=len(results) / elapsed_seconds if elapsed_seconds else 0)
+
+
+@app.post("/shows/bulk", response_model=api_models.BulkOperationResponseModel, tags=["REST Api"])
+async def bulk_create_shows(shows: List[models.NetflixShowModel],
+                            chunk_size: int = Query(None, gt=0, le=10000),
+                            db: Session = Depends(get_db),
+                            claims: dict = Depends(verify_token)):
+    """
+    Create many shows, committing one transaction per chunk of chunk_size shows. Returns a status for each show in the
+    request: shows whose show_id already exists are reported as conflicts, and a chunk which fails as a whole is
+    reported as failed without affecting the other chunks. Also reports the throughput of the operation.
+    """
+    chunk_size = chunk_size or get_bulk_chunk_size()
+    start = time.perf_counter()
+    results = await run_database_call(database_interface.bulk_create_netflix_shows, db, shows=shows,
+                                      chunk_size=chunk_size)
+    return bulk_operation_response(results, chunk_size, time.perf_counter() - start)
+
+
+@app.put("/shows/bulk", response_model=api_models.BulkOperationResponseModel, tags=["REST Api"])
+async def bulk_update_shows(shows: List[models.NetflixShowBulkUpdateModel],
+                            chunk_size: int = Query(None, gt=0, le=10000),
+                            db: Session = Depends(get_db),
+                            claims: dict = Depends(verify_token)):
+    """
+    Update many shows, identified by the show_id of each show in the request, committing one transaction per chunk of
+    chunk_size shows. Returns a status for each show in the request, along with the throughput of the operation.
+    """
+    chunk_size = chunk_size or get_bulk_chunk_size()
+    start = time.perf_counter()
+    results = await run_database_call(database_interface.bulk_update_netflix_shows, db, shows=shows,
+                                      chunk_size=chunk_size)
+    return bulk_operation_response(results, chunk_size, time.perf_counter() - start)
+
+
+@app.delete("/shows/bulk", response_model=api_models.BulkOperationResponseModel, tags=["REST Api"])
+async def bulk_delete_shows(show_ids: List[int] = Body(...),
+                            chunk_size: int = Query(None, gt=0, le=10000),
+                            db: Session = Depends(get_db),
+                            claims: dict = Depends(verify_token)):
+    """
+    Delete the shows with the show_ids in the request, committing one transaction per chunk of chunk_size shows.
+    Returns a status for each show_id in the request, along with the throughput of the operation.
+    """
+    chunk_size = chunk_size or get_bulk_chunk_size()
+    start = time.perf_counter()
+    results = await run_database_call(database_interface.bulk_delete_netflix_shows, db, show_ids=show_ids,
+                                      chunk_size=chunk_size)
+    return bulk_operation_response(results, chunk_size, time.perf_counter() - start)
+
+
+def ingest_upload(upload: UploadFile, ingestion_format: api_enums.FileFormatEnum, batch_size: int,
+                  skip_records: int):
+    """
+    Ingest an uploaded file with its own (sync) database session, as COPY is only available to the sync driver
+    """
+    db = base.DbSession()
+    try:
+        return ingestion.ingest(db, ingestion.iter_text_lines(upload.file), ingestion_format,
+                                batch_size=batch_size, skip_records=skip_records)
+    finally:
+        db.close()
+
+
+@app.post("/shows/upload", response_model=api_models.IngestionReportModel, tags=["REST Api"])
+async def upload_shows(file: UploadFile = File(...),
+                       format: api_enums.FileFormatEnum = Query(None),
+                       batch_size: int = Query(None, gt=0, le=100000),
+                       skip_records: int = Query(0, ge=0),
+                       claims: dict = Depends(verify_token)):
+    """
+    Load a CSV (such as the Kaggle netflix_titles.csv) or NDJSON file of shows, streamed in batches of batch_size shows
+    with one transaction per batch. The format defaults to the file's extension. Shows whose show_id already exists
+    are skipped, and invalid records are reported without stopping the upload. If a batch fails, the error's report
+    gives the last committed record, so the upload can be resumed by re-sending the file with skip_records set to it.
+    """
+    try:
+        ingestion_format = format or ingestion.format_from_filename(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    try:
+        return await run_in_threadpool(ingest_upload, file, ingestion_format, batch_size or get_bulk_chunk_size(),
+                                       skip_records)
+    except ingestion.IngestionError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail={"message": str(e), "report": jsonable_encoder(e.report)})
+    finally:
+        await file.close()
+
+
+@app.post("/graphql", response_model=api_models.GraphQLResponseModel, tags=["GraphQL"])
+async def post_graphql_query(graphql_request: api_models.GraphQLRequestModel, db: Session = Depends(get_db),
+                             claims: dict = Depends(verify_token)):
+    """
+    Execute a GraphQL query of the shows (see /graphql/schema for the schema). The search field takes the same filters,
+    q, orderBy, sort, skip and cursor parameters as the Search endpoint, and returns a page of limit shows (20 by
+    default) along with the cursor of the next page. Only the columns of the requested fields are read, and the shows
+    requested by show_id are read together.
+
+    Queries which can't be parsed or validated, or are nested deeper than GRAPHQL_MAX_QUERY_DEPTH or would read more
+    than GRAPHQL_MAX_QUERY_COST shows, are rejected with a 400 status and their errors.
+    """
+    from fast_api_challenge import graphql_api  # On first use, as importing graphql-core slows the cold start by ~100ms
+
+    async def call_database(database_function, **kwargs):
+        return await run_database_call(database_function, db, **kwargs)
+
+    status_code, content = await graphql_api.execute_query(graphql_request.query, graphql_request.variables,
+                                                           graphql_request.operationName, call_database=call_database)
+    return ORJSONResponse(content, status_code=status_code)
+
+
+@app.get("/graphql/schema", response_class=PlainTextResponse, tags=["GraphQL"])
+async def get_graphql_schema(claims: dict = Depends(verify_token)):
+    """
+    The schema of the /graphql endpoint, in the GraphQL schema definition language
+    """
+    from fast_api_challenge import graphql_api
+    return PlainTextResponse(graphql_api.SCHEMA_SDL)
 
 
 @app.post("/token", response_model=api_models.Token, tags=["Auth"])
@@ -133,20 +532,124 @@ async def retrieve_access_token(form_data: OAuth2PasswordRequestForm = Depends()
 
 
 @app.get("/summary", response_model=api_models.SummaryResponseModel, tags=["REST Api"])
-def get_summary(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_summary(db: Session = Depends(get_db), claims: dict = Depends(verify_token)):
     """
     Retrieve aggregated summary metadata about the stored data, including number of shows, number of unique shows,
     number of directors, etc., along with Api information such as the current Version.
     """
-    response = api_models.SummaryResponseModel(number_of_shows=database_interface.get_number_netflix_shows(db_session=db),
-                                               number_of_unique_shows=database_interface.get_number_of_unique_for_given_netflix_show_table_column(db_session=db, column_name=None),
-                                               number_of_unique_titles=database_interface.get_number_of_unique_for_given_netflix_show_table_column(db_session=db, column_name="title"),
-                                               number_of_unique_directors=database_interface.get_number_of_unique_for_given_netflix_show_table_column(db_session=db, column_name="director"),
-                                               number_of_unique_countries=database_interface.get_number_of_unique_for_given_netflix_show_table_column(db_session=db, column_name="country"),
+    counts = await run_database_call(database_interface.get_netflix_show_summary_counts, db)
+    response = api_models.SummaryResponseModel(**counts,
                                                time_current_api_node_started=APPLICATION_START_TIME.ctime() + " (UTC)",
                                                api_version=VERSION)
     return response
 
 
+@app.get("/database/pool", response_model=api_models.DatabasePoolStatusModel, tags=["Monitoring"])
+async def get_database_pool_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the live status of this Api node's database connection pool, including connections checked out, overflow,
+    and how long requests have waited to check out a connection.
+    """
+    return base.describe_request_engine_pool()
+
+
+@app.get("/database/replicas", response_model=api_models.DatabaseReplicasStatusModel, tags=["Monitoring"])
+async def get_database_replicas_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the health, replication lag and number of reads of this Api node's read replicas, if any are configured.
+    """
+    replicas_status = base.describe_request_replicas()
+    if replicas_status is None:
+        raise HTTPException(status_code=404, detail="No read replicas are configured.")
+    return replicas_status
+
+
+@app.get("/database/columnar", response_model=api_models.ColumnarSearchStatusModel, tags=["Monitoring"])
+async def get_columnar_search_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the state of this Api node's in-memory columnar snapshot of the shows, when COLUMNAR_SEARCH is set, and
+    how many searches it answered instead of the database.
+    """
+    if database_interface.columnar_search is None:
+        raise HTTPException(status_code=404, detail="The columnar search is not enabled.")
+    return database_interface.columnar_search.describe()
+
+
+@app.get("/database/coalescing", response_model=api_models.ReadCoalescingStatusModel, tags=["Monitoring"])
+async def get_read_coalescing_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve how many reads of this worker called the database, and how many shared the result of an identical read
+    in flight instead, when READ_COALESCING_TIMEOUT_SECONDS is not 0.
+    """
+    if read_coalescer is None:
+        raise HTTPException(status_code=404, detail="The coalescing of reads is disabled.")
+    return read_coalescer.describe()
+
+
+@app.get("/admission", response_model=api_models.AdmissionStatusModel, tags=["Monitoring"])
+async def get_admission_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve this worker's rate limits and cap of the requests using the database in flight, and how many requests it
+    admitted, or rejected with 429 (rate limited) or 503 (overloaded), by cost.
+    """
+    if not admission_controller.enabled():
+        raise HTTPException(status_code=404, detail="The admission control is disabled.")
+    return admission_controller.describe()
+
+
+@app.get("/database/slow-queries", response_model=api_models.SlowQueryLogModel, tags=["Monitoring"])
+async def get_slow_queries(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the latest SQL statements which took longer than SLOW_QUERY_THRESHOLD_MS on this Api node, with the
+    endpoint which executed them, the shape of their bound parameters, and their query plan when SLOW_QUERY_EXPLAIN is
+    set. Statements are also summarized by fingerprint, slowest in total first, to show which Search filter
+    combinations need indexes.
+    """
+    return base.slow_query_log.describe()
+
+
+@app.get("/cache", response_model=api_models.CacheStatusModel, tags=["Monitoring"])
+async def get_cache_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the hit, miss and eviction counts of this Api node's caches of shows, search results and summary counts.
+    """
+    return database_interface.describe_caches()
+
+
+@app.get("/auth/status", response_model=api_models.AuthStatusModel, tags=["Monitoring"])
+async def get_auth_status(claims: dict = Depends(verify_token)):
+    """
+    Retrieve the hit and miss counts of this Api node's cache of verified tokens, and a histogram of how long token
+    verification takes.
+    """
+    return describe_token_verification()
+
+
+@app.get("/startup", response_model=api_models.StartupTimingModel, tags=["Monitoring"])
+async def get_startup_timing(claims: dict = Depends(verify_token)):
+    """
+    Retrieve how long this Api node took to start, broken down into phases, and how long its first request took.
+    """
+    return {**startup.timer.describe(), "schema_startup": SCHEMA_STARTUP}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoring"])
+async def get_metrics(claims: dict = Depends(verify_metrics_token)):
+    """
+    Retrieve the Api's metrics in the Prometheus text format: the count, latency and status codes of requests by route,
+    the requests in flight, the duration of database calls and of their SQL statements, and the number of shows
+    returned by searches. With METRICS_MULTIPROC_DIR set, the metrics of every gunicorn worker of this Api node are
+    added up, otherwise they are those of the worker serving the request. Accepts METRICS_BEARER_TOKEN, if set, as well
+    as user tokens.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+startup.timer.lap("routes")
+startup.load_openapi_schema(app, get_openapi_schema_file())  # Otherwise generated on the first request for the docs
+startup.timer.lap("openapi")
+startup.timer.ready()
+logger.info("Startup: %s", json.dumps({**startup.timer.describe(), "schema_startup": SCHEMA_STARTUP}))
+
 if __name__ == "__main__":
     uvicorn.run(app=app, host="127.0.0.1", port=5000, log_level="debug")
@@ -0,0 +1,268 @@
+import argparse
+import codecs
+import csv
+import json
+import os
+import re
+import sys
+import time
+from typing import BinaryIO, Callable, Iterable
+
+from fast_api_challenge import database_interface
+from fast_api_challenge.database import base, search_index
+from fast_api_challenge.models import database_models as models
+from fast_api_challenge.models import api_enums, api_models
+from utils import get_bulk_chunk_size
+
+"""
+Streaming ingestion of CSV (eg. the Kaggle netflix_titles.csv) and NDJSON files of shows into the Netflix table.
+
+Files are read line by line and parsed, validated and written in batches, so memory use is bounded by the batch size
+rather than the size of the file. Each batch is committed in its own transaction (using COPY on Postgres), after which
+the number of records processed so far can be saved to a checkpoint file, so that an interrupted ingestion can be
+resumed where it stopped.
+
+Run from the project root with: python -m fast_api_challenge.ingestion netflix_titles.csv
+"""
+
+MAX_REPORTED_ERRORS = 100  # Invalid records beyond this are only counted
+READ_CHUNK_BYTES = 1024 * 1024
+
+_SHOW_ID_PATTERN = re.compile(r"^s?(\d+)$", re.IGNORECASE)  # The Kaggle dataset's show_ids look like "s123"
+
+
+class IngestionError(Exception):
+    """
+    Raised when a batch cannot be written. Carries the report of the ingestion up to the last committed batch.
+    """
+
+    def __init__(self, message: str, report: api_models.IngestionReportModel):
+        super().__init__(message)
+        self.report = report
+
+
+def format_from_filename(filename: str):
+    """
+    :return: (FileFormatEnum) The format of a file, from its extension
+    :raises ValueError: If the extension is not recognized
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        return api_enums.FileFormatEnum.CSV
+    if extension in (".ndjson", ".jsonl"):
+        return api_enums.FileFormatEnum.NDJSON
+    raise ValueError(f"Unable to tell the format of '{filename}', expected a .csv, .ndjson or .jsonl file.")
+
+
+def iter_text_lines(binary_stream: BinaryIO, encoding: str = "utf-8-sig"):
+    """
+    Decode a binary stream into lines (keeping their line endings), reading it in fixed size chunks. Only "\\n" ends a
+    line, so that other unicode line separators within CSV fields are preserved.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    while True:
+        chunk = binary_stream.read(READ_CHUNK_BYTES)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+def read_records(lines: Iterable[str], ingestion_format: api_enums.FileFormatEnum):
+    """
+    Split lines of text into records: a dict per CSV row (keyed by the header row), or a string per non-empty NDJSON
+    line, which is decoded by `parse_show` so that malformed lines only invalidate their own record.
+    """
+    if ingestion_format == api_enums.FileFormatEnum.CSV:
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if line.strip():
+            yield line
+
+
+def parse_show(record):
+    """
+    Validate a record into a Pydantic NetflixShow model. Field names are case-insensitive, unknown fields are ignored,
+    empty values are treated as missing, and show_ids may be prefixed with "s" as in the Kaggle dataset.
+    :param record: A dict, or a JSON object string
+    :return: (NetflixShowModel) The validated show
+    :raises ValueError: If the record is invalid
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("Record is not an object.")
+
+    fields = {}
+    for key, value in record.items():
+        field_name = str(key).strip().lower()
+        if field_name not in models.NetflixShowModel.__fields__:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value == "" or value is None:
+            continue
+        fields[field_name] = value
+
+    show_id = fields.get("show_id")
+    if isinstance(show_id, str):
+        match = _SHOW_ID_PATTERN.match(show_id)
+        if not match:
+            raise ValueError(f"Invalid show_id '{show_id}'.")
+        fields["show_id"] = int(match.group(1))
+    return models.NetflixShowModel(**fields)
+
+
+def _error_detail(error: ValueError):
+    return " ".join(str(error).split())  # Flatten multi-line Pydantic validation errors
+
+
+def load_checkpoint(checkpoint_path: str, source: str):
+    """
+    :return: (int) The number of records of the source already processed, according to the checkpoint file (0 if
+             there is no checkpoint)
+    :raises ValueError: If the checkpoint was saved for a different source
+    """
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, "r") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint.get("source") != source:
+        raise ValueError(f"Checkpoint '{checkpoint_path}' was saved for '{checkpoint.get('source')}', not '{source}'.")
+    return checkpoint["records_processed"]
+
+
+def save_checkpoint(checkpoint_path: str, source: str, records_processed: int):
+    """
+    Atomically record that the first records_processed records of the source have been written to the database
+    """
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump({"source": source, "records_processed": records_processed}, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def ingest(db_session,
+           lines: Iterable[str],
+           ingestion_format: api_enums.FileFormatEnum,
+           batch_size: int = None,
+           skip_records: int = 0,
+           source: str = None,
+           checkpoint_path: str = None,
+           progress_callback: Callable[[api_models.IngestionReportModel], None] = None):
+    """
+    Stream records into the Netflix table, one transaction per batch. Shows whose show_id already exists are skipped,
+    so re-ingesting a file is harmless.
+    :param db_session: SQLAlchemy (sync) DB session object
+    :param lines: Lines of text of the file to ingest, eg. from `iter_text_lines`
+    :param ingestion_format: Format of the file
+    :param batch_size: Number of valid shows to write per transaction
+    :param skip_records: Number of records at the start of the file to skip, as they were already processed
+    :param source: Identifies the file in the checkpoint, required along with checkpoint_path
+    :param checkpoint_path: If given, the checkpoint file is read to resume a previous ingestion of the source, updated
+                            after each batch, and removed once the whole file has been ingested
+    :param progress_callback: Called with the report so far after each batch
+    :return: (IngestionReportModel) The final report
+    :raises IngestionError: If a batch could not be written
+    """
+    batch_size = batch_size or get_bulk_chunk_size()
+    if checkpoint_path:
+        skip_records = max(skip_records, load_checkpoint(checkpoint_path, source))
+    report = api_models.IngestionReportModel(format=ingestion_format, batch_size=batch_size,
+                                             resumed_from_record=skip_records, last_committed_record=skip_records)
+    start = time.perf_counter()
+    batch = []
+
+    def commit_batch(records_processed: int):
+        if batch:
+            try:
+                created = database_interface.load_netflix_shows(db_session, batch)
+            except Exception as e:
+                raise IngestionError(f"Failed to write the batch ending at record {records_processed} "
+                                     f"({e.__class__.__name__}).", report) from e
+            report.shows_created += created
+            report.shows_skipped += len(batch) - created
+            report.batches += 1
+            batch.clear()
+        report.last_committed_record = records_processed
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, source, records_processed)
+        report.elapsed_seconds = time.perf_counter() - start
+        report.records_per_second = report.records_read / report.elapsed_seconds if report.elapsed_seconds else 0
+        if progress_callback:
+            progress_callback(report)
+
+    record_number = 0
+    for record_number, record in enumerate(read_records(lines, ingestion_format), start=1):
+        if record_number <= skip_records:
+            continue
+        report.records_read += 1
+        try:
+            batch.append(parse_show(record))
+        except ValueError as e:
+            report.records_invalid += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append(api_models.IngestionErrorModel(record_number=record_number,
+                                                                    detail=_error_detail(e)))
+        if len(batch) >= batch_size:
+            commit_batch(record_number)
+
+    commit_batch(max(record_number, skip_records))
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return report
+
+
+def _print_progress(report: api_models.IngestionReportModel):
+    print(f"records={report.last_committed_record} created={report.shows_created} skipped={report.shows_skipped} "
+          f"invalid={report.records_invalid} batches={report.batches} "
+          f"({report.records_per_second:.0f} records/s)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fast_api_challenge.ingestion",
+                                     description="Load a CSV or NDJSON file of Netflix shows into the database.")
+    parser.add_argument("path", help="File to ingest")
+    parser.add_argument("--format", choices=[member.value for member in api_enums.FileFormatEnum],
+                        help="Format of the file, by default inferred from its extension")
+    parser.add_argument("--batch-size", type=int, help="Shows written per transaction, by default BULK_CHUNK_SIZE")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted ingestion, by default "
+                                             "<path>.checkpoint.json")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Neither read nor save a checkpoint")
+    args = parser.parse_args(argv)
+
+    try:
+        ingestion_format = api_enums.FileFormatEnum(args.format) if args.format else \
+            format_from_filename(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+    checkpoint_path = None if args.no_checkpoint else (args.checkpoint or f"{args.path}.checkpoint.json")
+
+    base.Base.metadata.create_all(bind=base.engine)  # Create table schema in db if not exists
+    search_index.create_search_index(base.engine)
+    db = base.DbSession()
+    try:
+        with open(args.path, "rb") as binary_stream:
+            report = ingest(db, iter_text_lines(binary_stream), ingestion_format, batch_size=args.batch_size,
+                            source=os.path.abspath(args.path), checkpoint_path=checkpoint_path,
+                            progress_callback=_print_progress)
+    except IngestionError as e:
+        print(e.report.json(indent=2))
+        print(f"{e} Re-run the same command to resume from record {e.report.last_committed_record}.",
+              file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print(report.json(indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
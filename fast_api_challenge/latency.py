@@ -0,0 +1,55 @@
+import bisect
+import threading
+
+"""
+Latency histograms, with fixed bucket boundaries in milliseconds (as in Prometheus histograms), so that they can be
+recorded in constant time and memory and aggregated across api nodes.
+"""
+
+DEFAULT_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LatencyHistogram:
+    """
+    Thread-safe histogram of durations
+    """
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self._lock = threading.Lock()
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._counts = [0] * (len(self.buckets_ms) + 1)  # The last count is of durations above every bucket
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float):
+        """
+        :param seconds: The duration to record, eg. a difference of `time.perf_counter()` values
+        """
+        milliseconds = seconds * 1000
+        index = bisect.bisect_left(self.buckets_ms, milliseconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total_ms += milliseconds
+            self.max_ms = max(self.max_ms, milliseconds)
+
+    def describe(self):
+        """
+        :return: (dict) The histogram, matching the fields of `api_models.LatencyHistogramModel`. Bucket counts are
+                 cumulative, ie. each counts the durations less than or equal to its upper bound.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+        buckets, cumulative = [], 0
+        for upper_bound_ms, bucket_count in zip(self.buckets_ms + (None,), counts):
+            cumulative += bucket_count
+            buckets.append({"le_ms": upper_bound_ms, "count": cumulative})
+        return {
+            "count": count,
+            "total_ms": total_ms,
+            "average_ms": total_ms / count if count else None,
+            "max_ms": max_ms if count else None,
+            "buckets": buckets,
+        }
@@ -0,0 +1,389 @@
+import bisect
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from fast_api_challenge import latency
+from utils import get_metrics_flush_interval_seconds, get_metrics_multiproc_dir
+
+"""
+Prometheus metrics of the Api: requests per route template, requests in flight and their latency, the duration of the
+`database_interface` calls made by requests and of the SQL statements they execute, and the number of shows returned
+by searches. They are exposed in the Prometheus text format by the `/metrics` endpoint.
+
+Each gunicorn worker records its own metrics. When `utils.METRICS_MULTIPROC_DIR` is set, every worker writes a snapshot
+of them to a file in that directory (at most every `utils.METRICS_FLUSH_INTERVAL_SECONDS`), and `/metrics` adds up the
+snapshots of every worker, so that any worker can serve the metrics of the whole node. The metrics of workers which
+exit are kept in an archive file by the `child_exit` hook in gunicorn_conf.py, except their requests in flight.
+"""
+
+DURATION_BUCKETS_SECONDS = tuple(bucket_ms / 1000 for bucket_ms in latency.DEFAULT_BUCKETS_MS)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+ARCHIVE_FILE_NAME = "archive.json"  # Metrics of the workers which have exited
+
+# Name of the `database_interface` function being called by the current request, to label its SQL statements with
+database_function_name = ContextVar("database_function_name", default=None)
+# ASGI scope of the current HTTP request, which holds its endpoint once routed
+current_request_scope = ContextVar("current_request_scope", default=None)
+
+
+class Metric:
+    """
+    Values of a metric, one for each combination of the values of its labels
+    """
+    type = None
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self._lock = threading.Lock()
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}  # Tuple of label values: value
+
+    def snapshot(self):
+        """
+        :return: (list) [label values, value] pairs, which can be written as JSON
+        """
+        with self._lock:
+            return [[list(labels), self._copy(value)] for labels, value in self.values.items()]
+
+    def zero(self):
+        return 0
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def add(value, other):
+        """
+        :return: The sum of two values of the metric, eg. from two workers
+        """
+        return value + other
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge whose values are added up across workers, eg. a number of requests in flight
+    """
+    type = "gauge"
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets, whose values are [count of each bucket and above every bucket, sum of observations]
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets=DURATION_BUCKETS_SECONDS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self.values.get(label_values)
+            if histogram is None:
+                histogram = self.values[label_values] = self.zero()
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def zero(self):
+        return [0] * (len(self.buckets) + 2)
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    @staticmethod
+    def add(value, other):
+        return [count + other_count for count, other_count in zip(value, other)]
+
+
+class MetricsRegistry:
+    """
+    The metrics of this worker, and the snapshots of the other workers' metrics
+    """
+
+    def __init__(self, multiprocess_directory: str = None, flush_interval_seconds: float = 1):
+        self._lock = threading.Lock()
+        self.metrics = {}  # Name: Metric
+        self.multiprocess_directory = multiprocess_directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self._flush_thread_pid = None
+
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """
+        :return: (dict) The values of each metric of this worker, by name
+        """
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def _worker_file_path(self, pid: int):
+        return os.path.join(self.multiprocess_directory, f"worker_{pid}.json")
+
+    def flush(self):
+        """
+        Write this worker's snapshot to its file in the multiprocess directory, replacing the previous one atomically
+        """
+        path = self._worker_file_path(os.getpid())
+        with open(path + ".tmp", "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(path + ".tmp", path)
+
+    def start_flushing(self):
+        """
+        Start flushing this worker's snapshot in the background, if a multiprocess directory is set. Threads don't
+        survive a fork, so this must be called in each worker (eg. on every request, which is cheap once started).
+        """
+        if not self.multiprocess_directory or self._flush_thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flush_thread_pid == os.getpid():
+                return
+            self._flush_thread_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval_seconds)
+            try:
+                self.flush()
+            except OSError:
+                pass  # Eg. the directory was cleared on restart, retried on the next flush
+
+    def _read_snapshot(self, path: str):
+        try:
+            with open(path, "r") as snapshot_file:
+                return json.load(snapshot_file)
+        except (OSError, ValueError):
+            return {}  # The worker exited and its file was archived since it was listed
+
+    def _add_snapshot(self, totals: dict, snapshot: dict):
+        for name, samples in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue  # Written by a different version of the Api
+            metric_totals = totals.setdefault(name, {})
+            for labels, value in samples:
+                labels = tuple(labels)
+                metric_totals[labels] = metric.add(metric_totals[labels], value) if labels in metric_totals else value
+
+    def collect(self):
+        """
+        :return: (dict) The values of each metric, by name then by tuple of label values, added up across every
+                 worker when a multiprocess directory is set, otherwise of this worker only
+        """
+        totals = {}
+        self._add_snapshot(totals, self.snapshot())  # This worker's live values
+        if self.multiprocess_directory:
+            own_path = self._worker_file_path(os.getpid())
+            for path in sorted(glob.glob(os.path.join(self.multiprocess_directory, "*.json"))):
+                if path != own_path:
+                    self._add_snapshot(totals, self._read_snapshot(path))
+        return totals
+
+    def mark_process_dead(self, pid: int):
+        """
+        Move the metrics of a worker which exited into the archive file, without its gauges, which only make sense for
+        live workers. Must only be called by one process at a time, ie. gunicorn's master process.
+        """
+        path = self._worker_file_path(pid)
+        snapshot = self._read_snapshot(path)
+        if not snapshot:
+            return
+        archive_path = os.path.join(self.multiprocess_directory, ARCHIVE_FILE_NAME)
+        totals = {}
+        self._add_snapshot(totals, self._read_snapshot(archive_path))
+        self._add_snapshot(totals, {name: samples for name, samples in snapshot.items()
+                                    if name in self.metrics and self.metrics[name].type != "gauge"})
+        with open(archive_path + ".tmp", "w") as archive_file:
+            json.dump({name: [[list(labels), value] for labels, value in values.items()]
+                       for name, values in totals.items()}, archive_file)
+        os.replace(archive_path + ".tmp", archive_path)
+        os.remove(path)
+
+    def clear_multiprocess_directory(self):
+        """
+        Remove the snapshots left by a previous run, eg. when gunicorn starts
+        """
+        for path in glob.glob(os.path.join(self.multiprocess_directory, "*.json*")):
+            os.remove(path)
+
+    def render(self):
+        """
+        :return: (str) Every metric in the Prometheus text exposition format (version 0.0.4)
+        """
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            values = totals.get(name) or ({} if metric.label_names else {(): metric.zero()})  # Unlabeled: always shown
+            for labels, value in sorted(values.items()):
+                label_pairs = list(zip(metric.label_names, labels))
+                if metric.type != "histogram":
+                    lines.append(f"{name}{_format_labels(label_pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for upper_bound, count in zip(metric.buckets + (float("inf"),), value):
+                    cumulative += count
+                    bucket_labels = _format_labels(label_pairs + [("le", _format_value(upper_bound))])
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_pairs)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(label_pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_pairs: list):
+    if not label_pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in label_pairs) + "}"
+
+
+registry = MetricsRegistry(get_metrics_multiproc_dir(), get_metrics_flush_interval_seconds())
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests, by route template and status code.", ("method", "route", "status")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being served."))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests, by route template.", ("method", "route")))
+database_call_duration = registry.register(Histogram(
+    "database_call_duration_seconds", "Duration of the database_interface calls made by requests.", ("function",)))
+database_query_duration = registry.register(Histogram(
+    "database_query_duration_seconds", "Duration of SQL statements, by the database_interface call which executed "
+                                       "them (other when executed outside of one).", ("function",)))
+database_read_coalescing = registry.register(Counter(
+    "database_read_coalescing_total", "Reads which called the database (executed), shared the result of an identical "
+                                      "call in flight (coalesced), or stopped waiting for it (timed_out).",
+    ("function", "outcome")))
+admission_decisions = registry.register(Counter(
+    "admission_decisions_total", "Requests admitted at once (admitted) or after waiting for a slot (queued), and those "
+                                 "rejected by their rate limit (rate_limited) or for lack of a slot (overloaded), by "
+                                 "cost.", ("cost", "outcome")))
+search_result_shows = registry.register(Histogram(
+    "search_result_shows", "Number of shows returned by searches.", buckets=SIZE_BUCKETS))
+
+
+@contextlib.contextmanager
+def database_call(function_name: str):
+    """
+    Time a `database_interface` call, and label the SQL statements it executes with its name. The name is kept in a
+    context variable, which is copied to the threadpool by `run_in_threadpool`.
+    """
+    token = database_function_name.set(function_name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        database_call_duration.observe(time.perf_counter() - start, function_name)
+        database_function_name.reset(token)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "metrics_start_time", None)
+    if start is not None:
+        database_query_duration.observe(time.perf_counter() - start, database_function_name.get() or "other")
+
+
+def instrument_sql(engine_class=Engine):
+    """
+    Time every SQL statement executed by the engines (including the sync engines of async engines) with event hooks
+    """
+    if not event.contains(engine_class, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine_class, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine_class, "after_cursor_execute", _after_cursor_execute)
+
+
+_route_templates = {}  # Endpoint: path template of its route
+
+
+def route_template(scope):
+    """
+    :param scope: ASGI scope of an HTTP request, once routed
+    :return: (str) Path template of the request's route (eg. `/show/{show_id}` rather than each show's path, which
+             would make a metric for every show), or "unmatched"
+    """
+    endpoint = scope.get("endpoint")  # Set by the router on a match
+    if endpoint is not None and endpoint not in _route_templates:
+        _route_templates.update({route.endpoint: route.path for route in scope["app"].routes
+                                 if hasattr(route, "endpoint")})
+    return _route_templates.get(endpoint, "unmatched")
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording the count, latency and status code of HTTP requests by route template, and those in
+    flight. The request's scope is kept in `current_request_scope` while it is served.
+    """
+
+    def __init__(self, app, metrics_registry: MetricsRegistry = registry):
+        self.app = app
+        self.metrics_registry = metrics_registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.metrics_registry.start_flushing()
+        status_code = 500  # Unless a response is started before an exception
+
+        async def send_recording_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        token = current_request_scope.set(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_recording_status)
+        finally:
+            duration = time.perf_counter() - start
+            current_request_scope.reset(token)
+            http_requests_in_flight.dec()
+            route = route_template(scope)
+            http_requests.inc(scope["method"], route, str(status_code))
+            http_request_duration.observe(duration, scope["method"], route)
@@ -8,8 +8,30 @@ class SearchSortEnum(str, Enum):
     DESCENDING = "desc"
 
 
+class BulkItemStatusEnum(str, Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    CONFLICT = "conflict"
+    NOT_FOUND = "not_found"
+    FAILED = "failed"
+
+
+class SearchFacetEnum(str, Enum):
+    TYPE = "type"
+    RATING = "rating"
+    RELEASE_YEAR = "release_year"
+    COUNTRY = "country"
+    LISTED_IN = "listed_in"
+
+
+class FileFormatEnum(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
 search_order_enum_member_names = {}
-for key in NetflixShowModel.schema().get("properties"):  # iterate over all of the field names in the model
+for key in NetflixShowModel.__fields__:  # iterate over all of the field names in the model, without building its schema
     search_order_enum_member_names[key.upper()] = key  # Save to dict for dynamic enum creation
 
 
@@ -2,7 +2,13 @@
 Pydantic models that the Api-layer uses
 """
 
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from fast_api_challenge.models.api_enums import BulkItemStatusEnum, FileFormatEnum
+from fast_api_challenge.models.database_models import NetflixShowModel
 
 
 class ApiUser(BaseModel):
@@ -26,3 +32,287 @@ class SummaryResponseModel(BaseModel):
     number_of_unique_countries: int
     api_version: str
     time_current_api_node_started: str
+
+
+class SearchCursorModel(BaseModel):
+    """
+    Position of the last show returned by a keyset-paginated search
+    """
+    order_by: Optional[str]
+    sort: str
+    value: Any  # Of the order_by field's type, checked by `pagination.decode_cursor`
+    show_id: int = Field(..., gt=0, lt=2147483647)
+
+
+class DatabasePoolStatusModel(BaseModel):
+    """
+    Live status and cumulative statistics of the current api node's database connection pool. Size-related fields
+    are only available for queue-based pools.
+    """
+    pool_class: str
+    external_pooler: bool
+    size: Optional[int]
+    max_overflow: Optional[int]
+    timeout_seconds: Optional[float]
+    checked_in: Optional[int]
+    checked_out: int
+    overflow: Optional[int]
+    saturated: bool
+    connections_created: int
+    checkouts: int
+    checkins: int
+    invalidations: int
+    peak_checked_out: int
+    checkout_timeouts: int
+    average_checkout_wait_ms: Optional[float]
+    max_checkout_wait_ms: Optional[float]
+
+
+class ReplicaStatusModel(BaseModel):
+    """
+    Outcome of the last health check of a read replica, and the number of reads sent to it
+    """
+    url: str
+    healthy: bool
+    lag_seconds: Optional[float]
+    seconds_since_check: Optional[float]
+    error: Optional[str]
+    reads: int
+
+
+class DatabaseReplicasStatusModel(BaseModel):
+    """
+    Status of the current api node's read replicas, along with its staleness policy, and the number of reads which were
+    sent to the primary instead (as no replica was healthy, or this node had just written)
+    """
+    max_lag_seconds: float
+    read_your_writes_seconds: float
+    primary_reads: int
+    replicas: List[ReplicaStatusModel]
+
+
+class ColumnarSearchStatusModel(BaseModel):
+    """
+    State of the current api node's columnar snapshot of the shows, and the number of searches it answered (the others
+    being run by the database, eg. full-text searches, or searches made while the snapshot was being refreshed)
+    """
+    loaded: bool
+    dialect: Optional[str]
+    shows: Optional[int]
+    slots: Optional[int]  # Including the slots of deleted shows, until the next full load
+    age_seconds: Optional[float]  # Since the last full load
+    max_age_seconds: float
+    pending_writes: int  # Shows written since the last refresh, read again at the next search
+    reload_pending: bool
+    searches: int
+    database_searches: int
+    loads: int
+    incremental_refreshes: int
+    error: Optional[str]  # Why the table can't be held by a snapshot, if it can't
+
+
+class ReadCoalescingStatusModel(BaseModel):
+    """
+    Outcome counts of the reads of the current worker: calls made to the database, and reads which shared the result
+    of an identical call in flight, or stopped waiting for it after wait_timeout_seconds (and made their own call)
+    """
+    wait_timeout_seconds: float
+    in_flight: int
+    calls: int
+    coalesced: int
+    timed_out: int
+    coalescing_ratio: Optional[float]  # Share of the reads which were coalesced
+
+
+class AdmissionStatusModel(BaseModel):
+    """
+    Limits of the current worker's admission control, and the requests it admitted or rejected by outcome and cost
+    (cheap or expensive). Limits which are disabled are null.
+    """
+    rate_limit_per_second: Optional[float]
+    rate_limit_burst: Optional[float]
+    rate_limit_store: Optional[str]  # memory (per worker) or shared_memory (shared by the workers)
+    max_concurrency: Optional[int]
+    max_expensive_concurrency: Optional[int]
+    queue_timeout_seconds: Optional[float]
+    min_retry_after_seconds: Optional[float]
+    mean_slot_seconds: Optional[float]  # Moving average of the seconds requests hold a slot, null until one is released
+    in_flight: Dict[str, int]  # Capped requests in flight, by cost
+    queued: int  # Requests waiting for a slot
+    outcomes: Dict[str, Dict[str, int]]  # Counts by outcome (admitted, queued, rate_limited, overloaded), then cost
+
+
+class SlowQueryModel(BaseModel):
+    """
+    A statement which took longer than the slow query threshold. Its bound parameters are described by the type of
+    each of them (by name, or by position with positional parameters), never by their values.
+    """
+    fingerprint: str  # Of the normalized statement and the names of its parameters
+    statement: str
+    parameter_shape: Dict[str, Any]
+    duration_ms: float
+    endpoint: Optional[str]  # Route of the request which executed it, eg. "GET /shows"
+    database_function: Optional[str]
+    dialect: str
+    recorded_at: datetime
+    plan: Optional[List[str]]
+    explain_error: Optional[str]
+
+
+class SlowStatementModel(BaseModel):
+    """
+    The slow queries with the same fingerprint, among those in the log
+    """
+    fingerprint: str
+    statement: str
+    parameter_shape: Dict[str, Any]
+    endpoints: List[str]
+    count: int
+    total_ms: float
+    max_ms: float
+    plan: Optional[List[str]]  # The latest one
+
+
+class SlowQueryLogModel(BaseModel):
+    """
+    The latest slow queries of the current api node (most recent first), and their statements (slowest in total first)
+    """
+    threshold_ms: float
+    size: int
+    explain: bool
+    slow_queries: int  # Since the api node started, including those no longer in the log
+    statements: List[SlowStatementModel]
+    queries: List[SlowQueryModel]
+
+
+class FacetValueModel(BaseModel):
+    value: Any
+    count: int  # Number of shows matching the search with this value
+
+
+class SearchResultsModel(BaseModel):
+    """
+    Search results along with the counts of the values of the requested facets, over every show matching the search
+    (not only those on the page)
+    """
+    shows: List[NetflixShowModel]
+    facets: Dict[str, List[FacetValueModel]]
+
+
+class CacheStatisticsModel(BaseModel):
+    """
+    Cumulative statistics of one of the current api node's caches. Entries are only known for per-process caches.
+    """
+    entries: Optional[int]
+    hits: int
+    misses: int
+    hit_ratio: Optional[float]
+    evictions: int
+    expirations: int
+    invalidations: int
+
+
+class CacheStatusModel(BaseModel):
+    show: CacheStatisticsModel
+    search: CacheStatisticsModel
+    summary: CacheStatisticsModel
+
+
+class LatencyBucketModel(BaseModel):
+    le_ms: Optional[float]  # Upper bound of the bucket, None for the bucket of every duration
+    count: int
+
+
+class LatencyHistogramModel(BaseModel):
+    """
+    Cumulative histogram of durations measured by the current api node
+    """
+    count: int
+    total_ms: float
+    average_ms: Optional[float]
+    max_ms: Optional[float]
+    buckets: List[LatencyBucketModel]
+
+
+class AuthStatusModel(BaseModel):
+    token_cache: CacheStatisticsModel
+    verification_latency: LatencyHistogramModel
+
+
+class StartupPhaseModel(BaseModel):
+    name: str
+    ms: float
+
+
+class StartupTimingModel(BaseModel):
+    """
+    How long the current api node took to start (until it could serve requests), broken down into phases, how long
+    its first request took, and how its database schema was prepared (created, migrated or skipped)
+    """
+    schema_startup: str
+    phases: List[StartupPhaseModel]
+    startup_ms: Optional[float]
+    first_request_ms: Optional[float]
+
+
+class BulkItemResultModel(BaseModel):
+    """
+    Outcome of one item of a bulk operation, identified by its index in the request
+    """
+    index: int
+    show_id: Optional[int]
+    status: BulkItemStatusEnum
+    detail: Optional[str]
+
+
+class BulkOperationResponseModel(BaseModel):
+    items: List[BulkItemResultModel]
+    succeeded: int
+    failed: int
+    chunk_size: int
+    chunks: int
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+class IngestionErrorModel(BaseModel):
+    """
+    A record of an ingested file which could not be loaded, identified by its 1-based position in the file
+    """
+    record_number: int
+    detail: str
+
+
+class IngestionReportModel(BaseModel):
+    """
+    Progress, or final outcome, of the ingestion of a CSV or NDJSON file of shows
+    """
+    format: FileFormatEnum
+    batch_size: int
+    resumed_from_record: int = 0
+    last_committed_record: int = 0  # Records up to this one have been written, resume from here after a failure
+    records_read: int = 0
+    shows_created: int = 0
+    shows_skipped: int = 0
+    records_invalid: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0
+    records_per_second: float = 0
+    errors: List[IngestionErrorModel] = []
+
+
+class GraphQLRequestModel(BaseModel):
+    """
+    A GraphQL query, with the values of its variables, and the name of the operation to execute if it has several
+    """
+    query: str
+    variables: Optional[Dict[str, Any]] = None
+    operationName: Optional[str] = None
+
+
+class GraphQLResponseModel(BaseModel):
+    """
+    The data of an executed GraphQL query, and the errors of the query, or of the fields which could not be resolved
+    """
+    data: Optional[Dict[str, Any]]
+    errors: Optional[List[Dict[str, Any]]]
@@ -17,8 +17,7 @@ class NetflixShowUpdateModel(BaseModel):
     listed_in: Optional[str]
     description: Optional[str]
     release_year: int = Field(gt=0, lt=2147483647, default=None)
-    date_added: str = None  # TODO: Possibly sanitize table data and use formal dates, not priority
-    #                         TODO: Becuase the data in the DB is in different date formats, just using string.
+    date_added: str = None  # Free-form, as the dataset's dates are in different formats. Also stored parsed as a date
 
     class Config:
         orm_mode = True
@@ -31,10 +30,39 @@ class NetflixShowModel(NetflixShowUpdateModel):
     show_id: int = Field(gt=0, lt=2147483647, default=None)
 
 
+class NetflixShowVersionModel(NetflixShowModel):
+    """
+    Main Netflix Show model, along with the version and last modification time (UTC) of its row, which identify the
+    version of a show in conditional requests
+    """
+    version: int = None
+    updated_at: datetime = None
+
+
+class NetflixShowBulkUpdateModel(NetflixShowUpdateModel):
+    """
+    Used for bulk updates, where each show must identify the show to update with its primary key
+    """
+    show_id: int = Field(..., gt=0, lt=2147483647)
+
+
 class NetflixShowSearchModel(NetflixShowModel):
     """
     Model with all identical fields to the main Netflix Show model, except:
     1) Has no required fields, unless they must be used in every search, which is unlikely
     2) Only contains fields which should be used to search
+    3) Also has exact-match filters, matching one of the comma separated names of a show's director, cast, country or
+       listed_in (genres) exactly, rather than as a substring
+    4) Also has range filters, matching the shows released, or added, within (inclusive) bounds, and the movies lasting
+       at most duration_max minutes
     """
     title: str = None
+    director_name: str = None
+    cast_member: str = None
+    country_name: str = None
+    genre: str = None
+    release_year_gte: int = Field(gt=0, lt=2147483647, default=None)
+    release_year_lte: int = Field(gt=0, lt=2147483647, default=None)
+    date_added_from: date = None
+    date_added_to: date = None
+    duration_max: int = Field(gt=0, lt=2147483647, default=None)
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+from collections.abc import Mapping
+
+from pydantic import ValidationError
+
+from fast_api_challenge.models import api_enums, api_models
+from fast_api_challenge.models.database_models import NetflixShowModel
+
+"""
+Encoding and decoding of the opaque cursors used for keyset (cursor) pagination of the Search endpoint.
+
+A cursor records the (orderBy value, show_id) pair of the last show on a page, along with the orderBy and sort it was
+created for, so that the next page can be fetched with a seek predicate instead of an OFFSET.
+"""
+
+
+def effective_sort(sort: api_enums.SearchSortEnum = None):
+    """
+    The sort direction actually applied to a search, which defaults to ascending.
+    :param sort: Search sort enum, or None
+    :return: (str) "asc" or "desc"
+    """
+    if sort:
+        return sort.value
+    return api_enums.SearchSortEnum.ASCENDING.value
+
+
+def _show_value(show, name: str):
+    return show[name] if isinstance(show, Mapping) else getattr(show, name)
+
+
+def encode_cursor(last_show, orderBy: api_enums.SearchOrderByEnum = None, sort: api_enums.SearchSortEnum = None):
+    """
+    Create the cursor pointing after the given show, for a search with the given ordering.
+    :param last_show: The last show (ORM or Pydantic NetflixShow, or a plain row) returned on the current page
+    :param orderBy: Search orderBy enum used for the current page, or None
+    :param sort: Search sort enum used for the current page, or None
+    :return: (str) Opaque, url-safe cursor
+    """
+    cursor = api_models.SearchCursorModel(order_by=orderBy.value if orderBy else None,
+                                          sort=effective_sort(sort),
+                                          value=_show_value(last_show, orderBy.value) if orderBy else None,
+                                          show_id=_show_value(last_show, "show_id"))
+    encoded = base64.urlsafe_b64encode(cursor.json(separators=(",", ":")).encode("utf-8"))
+    return encoded.decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor created by `encode_cursor`.
+    :param cursor: Opaque cursor string
+    :return: (SearchCursorModel) The decoded cursor
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        search_cursor = api_models.SearchCursorModel(**payload)
+        search_cursor.value = _cursor_value(search_cursor.order_by, search_cursor.value)
+        return search_cursor
+    except (binascii.Error, UnicodeError, ValueError, TypeError, ValidationError) as e:
+        raise ValueError("Malformed cursor.") from e
+
+
+def _cursor_value(order_by: str, value):
+    """
+    Validates a cursor's value as a value of the field it's ordered by, as it's bound into the seek predicate.
+    :raises ValueError: If the value isn't one of the field's, eg. a string for an integer field, or a JSON object
+    """
+    if value is None:
+        return None  # The last show's value was NULL, or the search isn't ordered
+    field = NetflixShowModel.__fields__.get(order_by) if order_by else None
+    if field is None:
+        raise ValueError(f"A cursor can't have a value when ordered by {order_by}.")
+    value, errors = field.validate(value, {}, loc="value")
+    if errors:
+        raise ValueError(f"The cursor's value isn't a valid {order_by}.")
+    return value
+
+
+def cursor_matches_search(cursor: api_models.SearchCursorModel,
+                          orderBy: api_enums.SearchOrderByEnum = None,
+                          sort: api_enums.SearchSortEnum = None):
+    """
+    Checks that a cursor was created for a search with the same ordering as the current one.
+    :return: Bool
+    """
+    return cursor.order_by == (orderBy.value if orderBy else None) and cursor.sort == effective_sort(sort)
+
+
+def decode_search_cursor(cursor: str = None,
+                         skip: int = None,
+                         q: str = None,
+                         orderBy: api_enums.SearchOrderByEnum = None,
+                         sort: api_enums.SearchSortEnum = None):
+    """
+    Check that the ordering and pagination parameters of a search can be used together, and decode its cursor.
+    :param cursor: Cursor parameter of the search, or None
+    :return: (SearchCursorModel) The decoded cursor, or None
+    :raises ValueError: With a message for the client, if the parameters can't be used together or the cursor is invalid
+    """
+    if sort and not orderBy:
+        raise ValueError("Cannot use the sort parameter without the orderBy parameter.")
+    if not cursor:
+        return None
+    if skip:
+        raise ValueError("Cannot use the cursor parameter with the skip parameter.")
+    if q and not orderBy:
+        raise ValueError("Cannot use the cursor parameter with the q parameter unless orderBy is used.")
+    try:
+        search_cursor = decode_cursor(cursor)
+    except ValueError:
+        raise ValueError("Invalid cursor.")
+    if not cursor_matches_search(search_cursor, orderBy=orderBy, sort=sort):
+        raise ValueError("The cursor does not match the orderBy and sort parameters.")
+    return search_cursor
@@ -0,0 +1,29 @@
+from typing import List, Mapping
+
+from fast_api_challenge.models import database_models as models
+
+"""
+Response content of the read endpoints, built from the plain rows returned by `database_interface` (eg.
+`search_netflix_show_rows`) rather than from models.
+
+The rows are read from the database, so their values already match the types of the NetflixShowModel fields. The
+endpoints return this content directly in an `ORJSONResponse`, which skips validating each show against the
+response_model (which is still declared for the OpenAPI schema) and serializes with orjson instead of json.
+"""
+
+SHOW_FIELDS = tuple(models.NetflixShowModel.__fields__)  # The fields of a show returned by the Api, in order
+
+
+def show_content(row: Mapping):
+    """
+    :param row: Plain row of a show, with at least the SHOW_FIELDS (eg. from `get_netflix_show_row`)
+    :return: (dict) The show, as returned by the Api (without its row version)
+    """
+    return {field: row[field] for field in SHOW_FIELDS}
+
+
+def shows_content(rows: List[Mapping]):
+    """
+    :return: (list) `show_content` of each row
+    """
+    return [{field: row[field] for field in SHOW_FIELDS} for row in rows]
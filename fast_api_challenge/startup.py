@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+
+"""
+Timing of the Api's startup (its cold start, eg. when Cloud Run scales from zero), broken down into phases, and
+loading of an OpenAPI schema precomputed when the image is built.
+
+The phases are recorded while `index` is imported, and the first request (which pays for anything deferred, such as
+connecting to the database) is recorded by `FirstRequestTimingMiddleware`.
+"""
+
+
+class StartupTimer:
+    """
+    Durations of the phases of the startup, in the order they ran
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = self._last_lap_at = time.perf_counter()
+        self.phases = []  # (name, seconds)
+        self.first_request_seconds = None
+        self.ready_at = None
+
+    def lap(self, name: str):
+        """
+        Record the phase which ran since the previous one ended (or since the timer was created)
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((name, now - self._last_lap_at))
+            self._last_lap_at = now
+
+    def ready(self):
+        """
+        Mark the end of the startup, once the Api can serve requests
+        """
+        self.ready_at = time.perf_counter()
+
+    def record_first_request(self, seconds: float):
+        with self._lock:
+            if self.first_request_seconds is None:
+                self.first_request_seconds = seconds
+
+    def describe(self):
+        """
+        :return: (dict) The startup timings, matching the fields of `api_models.StartupTimingModel`
+        """
+        with self._lock:
+            phases = list(self.phases)
+            first_request_seconds = self.first_request_seconds
+        return {
+            "phases": [{"name": name, "ms": seconds * 1000} for name, seconds in phases],
+            "startup_ms": (self.ready_at - self.started_at) * 1000 if self.ready_at is not None else None,
+            "first_request_ms": first_request_seconds * 1000 if first_request_seconds is not None else None,
+        }
+
+
+timer = StartupTimer()  # Created when `index` starts importing
+
+
+class FirstRequestTimingMiddleware:
+    """
+    ASGI middleware recording how long the first HTTP request took. Later requests are passed straight through.
+    """
+
+    def __init__(self, app, startup_timer: StartupTimer = timer):
+        self.app = app
+        self.startup_timer = startup_timer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.startup_timer.first_request_seconds is not None:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.startup_timer.record_first_request(time.perf_counter() - start)
+
+
+def load_openapi_schema(app, path: str = None):
+    """
+    Use the OpenAPI schema written by `write_openapi_schema`, if the file exists, instead of generating it
+    :param app: FastAPI app
+    :param path: Path of the schema file, eg. from `utils.get_openapi_schema_file()`
+    :return: Bool, whether the schema was loaded
+    """
+    if not path or not os.path.exists(path):
+        return False
+    with open(path, "r") as schema_file:
+        app.openapi_schema = json.load(schema_file)
+    return True
+
+
+def write_openapi_schema(app, path: str):
+    """
+    Generate the app's OpenAPI schema, and write it to the given path
+    """
+    with open(path, "w") as schema_file:
+        json.dump(app.openapi(), schema_file)
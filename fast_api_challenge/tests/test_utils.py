@@ -1,5 +1,8 @@
+import asyncio
 import os
+import tempfile
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -9,7 +12,10 @@ import functools
 SQLALCHEMY_DATABASE_URL = 'sqlite://'  # Uses in-memory ephemeral database
 os.environ["sqlalchemy_database_url"] = SQLALCHEMY_DATABASE_URL  # Retrieved in the import below to set up the local DB
 
-from fast_api_challenge.database.orm import Base, NetflixShow
+from fast_api_challenge.database.orm import Base
+from fast_api_challenge.database import replicas, search_index
+from fast_api_challenge import database_interface
+from utils import get_async_database_url
 
 
 engine = create_engine(
@@ -19,6 +25,7 @@ engine = create_engine(
 DbSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.create_all(bind=engine)
+search_index.create_search_index(engine)
 
 
 def inject_in_memory_db_with_netflix_show_table(function):
@@ -30,8 +37,69 @@ def inject_in_memory_db_with_netflix_show_table(function):
     def wrapper(*args, **kwargs):
         Base.metadata.create_all(bind=engine)
         db = DbSession()
-        result = function(db=db, *args, **kwargs)
-        db.query(NetflixShow).delete()  # Clear database table after execution
-        db.commit()
-        return result
+        try:
+            return function(db=db, *args, **kwargs)
+        finally:
+            db.rollback()  # In case the function failed mid-transaction
+            for table in reversed(Base.metadata.sorted_tables):  # Clear database tables after execution
+                db.execute(table.delete())
+            db.commit()
+            db.close()
+            database_interface.invalidate_netflix_caches()
+    return wrapper
+
+
+def inject_async_db_with_netflix_show_table(coroutine_function):
+    """Decorator for async tests, which runs the decorated coroutine function to completion with an AsyncSession for a
+    temporary SQLite database file containing a new NetflixShow table, deleting the database after each call."""
+
+    @functools.wraps(coroutine_function)
+    def wrapper(*args, **kwargs):
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = f"sqlite:///{os.path.join(directory, 'netflix.db')}"
+            sync_engine = create_engine(database_url)
+            Base.metadata.create_all(bind=sync_engine)
+            search_index.create_search_index(sync_engine)
+            sync_engine.dispose()
+
+            async def run():
+                async_engine = create_async_engine(get_async_database_url(database_url))
+                try:
+                    async with AsyncSession(bind=async_engine, expire_on_commit=False) as db:
+                        return await coroutine_function(db=db, *args, **kwargs)
+                finally:
+                    await async_engine.dispose()
+
+            try:
+                return asyncio.run(run())
+            finally:
+                database_interface.invalidate_netflix_caches()  # Each call uses a new database
+    return wrapper
+
+
+def inject_replicated_dbs_with_netflix_show_table(function):
+    """Decorator for tests of read replica routing, which uses two temporary SQLite database files, a primary and a
+    replica, each with a new NetflixShow table. Nothing is replicated between them, so that the test can tell which
+    one a query was sent to. The decorated function is called with `db`, a RoutingSession bound to the primary,
+    `replica_db`, a Session bound to the replica, and `router`, the ReplicaRouter of `db`."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with tempfile.TemporaryDirectory() as directory:
+            primary_engine, replica_engine = [create_engine(f"sqlite:///{os.path.join(directory, name)}")
+                                              for name in ("primary.db", "replica.db")]
+            for database_engine in (primary_engine, replica_engine):
+                Base.metadata.create_all(bind=database_engine)
+                search_index.create_search_index(database_engine)
+            router = replicas.ReplicaRouter([replica_engine], read_your_writes_seconds=0)
+            db = replicas.RoutingSession(router=router, bind=primary_engine, autoflush=False)
+            replica_db = DbSession(bind=replica_engine)
+            try:
+                return function(db=db, replica_db=replica_db, router=router, *args, **kwargs)
+            finally:
+                db.close()
+                replica_db.close()
+                primary_engine.dispose()
+                replica_engine.dispose()
+                database_interface.invalidate_netflix_caches()  # Each call uses new databases
     return wrapper
@@ -2,17 +2,49 @@ import sys, os
 sys.path
 sys.path.append(os.path.join(os.path.dirname(sys.path[0]), '../..'))  # Reference the root of the project like api does
 
+import asyncio
+import base64
+import csv
+import io
+import json
 import math
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta
 from typing import List
 import unittest
-from hypothesis import given, strategies as st
+from hypothesis import HealthCheck, given, settings, strategies as st
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
 
-from fast_api_challenge.tests.test_utils import inject_in_memory_db_with_netflix_show_table
-from fast_api_challenge import database_interface
-from fast_api_challenge.models import database_models
-from fast_api_challenge.database import orm
+from fast_api_challenge.tests.test_utils import inject_in_memory_db_with_netflix_show_table, \
+    inject_async_db_with_netflix_show_table, inject_replicated_dbs_with_netflix_show_table
+from fast_api_challenge import admission, async_database_interface, auth, caching, coalescing, conditional, \
+    database_interface, export, graphql_api, ingestion, latency, metrics, pagination, serialization
+from fast_api_challenge.models import api_enums, api_models, database_models
+from fast_api_challenge.database import columnar, orm, pool_statistics, replicas, schema, show_entities, slow_queries, \
+    typed_columns
+
+NAMES = st.lists(st.sampled_from(["Ana", "Bo", "Cy"]), max_size=3).map(", ".join)  # Comma separated, with duplicates
+DATES_ADDED = st.dates(min_value=date(2019, 1, 1), max_value=date(2019, 1, 12))  # Few, so that shows share dates
+# Well-formed cursors whose value isn't one of their orderBy field's, or whose show_id doesn't fit the column
+FORGED_CURSORS = st.one_of(
+    st.fixed_dictionaries({"order_by": st.sampled_from(sorted(database_models.NetflixShowModel.__fields__)),
+                           "value": st.one_of(st.dictionaries(st.text(), st.integers()), st.lists(st.integers()))}),
+    st.fixed_dictionaries({"order_by": st.sampled_from(["release_year", "show_id"]),
+                           "value": st.one_of(st.text(alphabet="abcxyz", min_size=1), st.integers(min_value=2 ** 31),
+                                              st.integers(max_value=0))}),
+    st.fixed_dictionaries({"order_by": st.none(), "value": st.integers()}),
+    st.fixed_dictionaries({"order_by": st.sampled_from(["title", "release_year"]), "value": st.just(None),
+                           "show_id": st.one_of(st.integers(max_value=0), st.integers(min_value=2 ** 31))}),
+).map(lambda cursor: {"sort": "asc", "show_id": 1, **cursor}).map(
+    lambda cursor: base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii").rstrip("="))
 
 
 class TestDatabaseInterface(unittest.TestCase):
@@ -112,6 +144,399 @@ class TestDatabaseInterface(unittest.TestCase):
                                                             )
         self.assertEqual(len(model_instances) % 10, len(final_page))
 
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=20),
+           page_size=st.integers(min_value=1, max_value=5),
+           orderBy=st.one_of(st.none(), st.sampled_from(api_enums.SearchOrderByEnum)),
+           sort=st.one_of(st.none(), st.sampled_from(api_enums.SearchSortEnum)))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_keyset_paginate_netflix_shows(self, model_instances: List[database_models.NetflixShowModel],
+                                           page_size: int, orderBy, sort, db):
+        """
+        Tests keyset pagination by paging through all shows using cursors, for every orderBy column and sort direction,
+        and checking that the pages add up to exactly the unpaginated search results, in the same order.
+        """
+        if sort and not orderBy:
+            sort = None  # Not allowed by the Api
+        show_ids_used = set()
+        for db_model in model_instances:
+            if db_model.show_id is None or db_model.show_id not in show_ids_used:
+                show_ids_used.add(database_interface.create_netflix_show(db_session=db, show=db_model).show_id)
+
+        expected_show_ids = [show.show_id for show in database_interface.search_netflix_show(
+            db_session=db, filter_args=database_models.NetflixShowSearchModel(), orderBy=orderBy, sort=sort)]
+
+        paginated_show_ids = []
+        cursor = None
+        while True:
+            page = database_interface.search_netflix_show(db_session=db,
+                                                          filter_args=database_models.NetflixShowSearchModel(),
+                                                          limit=page_size, orderBy=orderBy, sort=sort, cursor=cursor)
+            paginated_show_ids += [show.show_id for show in page]
+            if len(page) < page_size:
+                break
+            cursor = pagination.decode_cursor(pagination.encode_cursor(page[-1], orderBy=orderBy, sort=sort))
+            self.assertTrue(pagination.cursor_matches_search(cursor, orderBy=orderBy, sort=sort))
+
+        self.assertEqual(expected_show_ids, paginated_show_ids)
+
+    @given(first_filters=st.builds(database_models.NetflixShowSearchModel),
+           second_filters=st.builds(database_models.NetflixShowSearchModel),
+           limit=st.one_of(st.none(), st.integers(min_value=1, max_value=100)))
+    def test_search_statements_are_cached_by_shape(self, first_filters: database_models.NetflixShowSearchModel,
+                                                   second_filters: database_models.NetflixShowSearchModel, limit: int):
+        """
+        Tests that searches with the same active filters share a statement, differing only by their bound parameters
+        """
+        first_statement, first_parameters = database_interface._search_statement_and_parameters(
+            "sqlite", filter_args=first_filters, limit=limit)
+        second_statement, second_parameters = database_interface._search_statement_and_parameters(
+            "sqlite", filter_args=second_filters, limit=limit)
+        active_filters = [{key for key, value in filters.dict().items() if value}
+                          for filters in (first_filters, second_filters)]
+        self.assertEqual(active_filters[0] == active_filters[1], first_statement is second_statement)
+        self.assertEqual(first_parameters.get("limit"), limit)
+        for key in active_filters[0]:
+            self.assertIn(str(getattr(first_filters, key)).strip(), first_parameters[f"filter_{key}"])
+
+    @given(cursor=st.one_of(st.text(), FORGED_CURSORS))
+    def test_decode_invalid_cursor_raises_value_error(self, cursor: str):
+        """
+        Tests that decoding any malformed cursor, or a well-formed one whose value can't be bound for its orderBy field,
+        raises a ValueError, which the Api turns into a 400 response
+        """
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor(cursor)
+
+    @given(value=st.one_of(st.integers(), st.text()),
+           show_ids=st.sets(st.integers(1, 2 ** 31 - 2), min_size=2, max_size=2),
+           orderBy=st.sampled_from(api_enums.SearchOrderByEnum))
+    def test_search_cache_keys_of_cursors_differ_by_show_id(self, value, show_ids, orderBy):
+        """
+        Tests that the pages after two cursors with the same orderBy value, but a different show_id, are cached under
+        different keys
+        """
+        keys = {database_interface._search_cache_key(
+            filter_args=database_models.NetflixShowSearchModel(), orderBy=orderBy, limit=10,
+            cursor=api_models.SearchCursorModel(order_by=orderBy.value, sort="asc", value=value, show_id=show_id))
+            for show_id in show_ids}
+        self.assertEqual(len(keys), 2)
+
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=10),
+           query_text=st.text(max_size=20))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_full_text_search_netflix_shows_handles_any_input(self, model_instances: List[database_models.NetflixShowModel],
+                                                              query_text: str, db):
+        """
+        Tests that any free text can be used as a full-text search query without causing database errors
+        """
+        show_ids_used = set()
+        for db_model in model_instances:
+            if db_model.show_id is None or db_model.show_id not in show_ids_used:
+                show_ids_used.add(database_interface.create_netflix_show(db_session=db, show=db_model).show_id)
+
+        results = database_interface.search_netflix_show(db_session=db,
+                                                         filter_args=database_models.NetflixShowSearchModel(),
+                                                         q=query_text)
+        self.assertLessEqual(len(results), len(show_ids_used))
+
+    @inject_in_memory_db_with_netflix_show_table
+    def test_full_text_search_ranks_by_relevance(self, db):
+        """
+        Tests that full-text search only returns matching shows, ranking title matches above description matches, and
+        that updated and deleted shows are reflected in the search index.
+        """
+        description_match = database_interface.create_netflix_show(db_session=db, show=database_models.NetflixShowModel(
+            title="Deep Water", description="A documentary about galactic exploration"))
+        title_match = database_interface.create_netflix_show(db_session=db, show=database_models.NetflixShowModel(
+            title="Galactic Voyages", description="Explorers travel far"))
+        database_interface.create_netflix_show(db_session=db, show=database_models.NetflixShowModel(
+            title="Cooking Time", description="Chefs compete", cast="Galen Smith"))
+
+        results = database_interface.search_netflix_show(db_session=db,
+                                                         filter_args=database_models.NetflixShowSearchModel(),
+                                                         q="galactic")
+        self.assertEqual([title_match.show_id, description_match.show_id], [show.show_id for show in results])
+
+        database_interface.update_netflix_show(db_session=db, show_id=title_match.show_id,
+                                               show=database_models.NetflixShowUpdateModel(title="Ocean Voyages"))
+        database_interface.delete_netflix_show(db_session=db, show_id=description_match.show_id)
+
+        results = database_interface.search_netflix_show(db_session=db,
+                                                         filter_args=database_models.NetflixShowSearchModel(),
+                                                         q="galactic")
+        self.assertEqual([], results)
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=15),
+           update_model_instance=st.builds(database_models.NetflixShowUpdateModel),
+           chunk_size=st.integers(min_value=1, max_value=6))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_bulk_create_update_delete_netflix_shows(self, model_instances: List[database_models.NetflixShowModel],
+                                                     update_model_instance: database_models.NetflixShowUpdateModel,
+                                                     chunk_size: int, db):
+        """
+        Tests the bulk database methods by creating a random list of shows (including duplicate show_ids), then updating
+        and deleting them along with show_ids which don't exist, checking the status reported for each item and the
+        resulting table contents.
+        """
+        statuses = api_enums.BulkItemStatusEnum
+        results = database_interface.bulk_create_netflix_shows(db_session=db, shows=model_instances,
+                                                               chunk_size=chunk_size)
+        self.assertEqual(list(range(len(model_instances))), [result.index for result in results])
+
+        created_show_ids = set()
+        for show, result in zip(model_instances, results):
+            if show.show_id is not None and show.show_id in created_show_ids:
+                self.assertEqual(statuses.CONFLICT, result.status)
+            else:
+                self.assertEqual(statuses.CREATED, result.status)
+                self.assertIsNotNone(result.show_id)
+                created_show_ids.add(result.show_id)
+                self.assertEqual(show.title, database_interface.get_netflix_show(db_session=db, show_id=result.show_id).title)
+        self.assertEqual(len(created_show_ids), database_interface.get_number_netflix_shows(db_session=db))
+
+        missing_show_id = max(created_show_ids, default=0) + 1
+        update_models = [database_models.NetflixShowBulkUpdateModel(show_id=show_id, **update_model_instance.dict())
+                         for show_id in sorted(created_show_ids) + [missing_show_id]]
+        results = database_interface.bulk_update_netflix_shows(db_session=db, shows=update_models,
+                                                               chunk_size=chunk_size)
+        self.assertEqual([statuses.UPDATED] * len(created_show_ids) + [statuses.NOT_FOUND],
+                         [result.status for result in results])
+        for show_id in created_show_ids:
+            db.expire_all()
+            updated_show = database_interface.get_netflix_show(db_session=db, show_id=show_id)
+            self.assertEqual((update_model_instance.title, 2), (updated_show.title, updated_show.version))
+
+        results = database_interface.bulk_delete_netflix_shows(db_session=db,
+                                                               show_ids=sorted(created_show_ids) + [missing_show_id],
+                                                               chunk_size=chunk_size)
+        self.assertEqual([statuses.DELETED] * len(created_show_ids) + [statuses.NOT_FOUND],
+                         [result.status for result in results])
+        self.assertEqual(0, database_interface.get_number_netflix_shows(db_session=db))
+
+    @settings(deadline=None)
+    @given(model_instance=st.builds(database_models.NetflixShowModel),
+           update_model_instance=st.builds(database_models.NetflixShowUpdateModel),
+           shared=st.booleans())
+    @inject_in_memory_db_with_netflix_show_table
+    def test_read_through_cache_is_invalidated_by_writes(self, model_instance: database_models.NetflixShowModel,
+                                                         update_model_instance: database_models.NetflixShowUpdateModel,
+                                                         shared: bool, db):
+        """
+        Tests that shows and search results are read through the caches (with either per-process caches or a shared
+        store), and that creating, updating and deleting a show invalidates them
+        """
+        local_caches = (database_interface.show_cache, database_interface.search_cache)
+        if shared:
+            database_interface.use_shared_cache_store(caching.InMemorySharedCacheStore())
+        else:  # Per-worker caches are disabled by default
+            database_interface.show_cache, database_interface.search_cache = (caching.TTLCache(ttl_seconds=60)
+                                                                              for _ in range(2))
+        try:
+            show_id = model_instance.show_id or 1
+            search_kwargs = dict(filter_args=database_models.NetflixShowSearchModel(), skip=0, limit=10)
+            self.assertIsNone(database_interface.get_netflix_show_model(db_session=db, show_id=show_id))
+            self.assertEqual([], database_interface.search_netflix_show_models(db_session=db, **search_kwargs))
+
+            created = database_interface.create_netflix_show(db_session=db, show=model_instance.copy(
+                update={"show_id": show_id}))
+            expected = database_models.NetflixShowVersionModel.from_orm(created)
+            self.assertEqual(1, expected.version)
+            self.assertEqual(expected, database_interface.get_netflix_show_model(db_session=db, show_id=show_id))
+            self.assertEqual([expected], database_interface.search_netflix_show_models(db_session=db, **search_kwargs))
+
+            hits = database_interface.show_cache.describe()["hits"]
+            db.query(orm.NetflixShow).delete()  # Bypasses the cache, so the cached show is still returned
+            db.commit()
+            self.assertEqual(expected, database_interface.get_netflix_show_model(db_session=db, show_id=show_id))
+            self.assertEqual(hits + 1, database_interface.show_cache.describe()["hits"])
+            db.add(orm.NetflixShow(**expected.dict()))
+            db.commit()
+
+            self.assertIsNotNone(database_interface.update_netflix_show(db_session=db, show=update_model_instance,
+                                                                        show_id=show_id))
+            updated = database_interface.get_netflix_show_model(db_session=db, show_id=show_id)
+            self.assertEqual(update_model_instance.dict(), updated.dict(exclude={"show_id", "version", "updated_at"}))
+            self.assertEqual(2, updated.version)
+            self.assertGreaterEqual(updated.updated_at, expected.updated_at)
+            self.assertIsNone(database_interface.update_netflix_show(db_session=db, show=update_model_instance,
+                                                                     show_id=show_id, expected_version=1))
+            self.assertFalse(database_interface.delete_netflix_show(db_session=db, show_id=show_id,
+                                                                    expected_version=1))
+            self.assertEqual([updated], database_interface.search_netflix_show_models(db_session=db, **search_kwargs))
+
+            self.assertTrue(database_interface.delete_netflix_show(db_session=db, show_id=show_id))
+            self.assertFalse(database_interface.delete_netflix_show(db_session=db, show_id=show_id))
+            self.assertIsNone(database_interface.update_netflix_show(db_session=db, show=update_model_instance,
+                                                                     show_id=show_id))
+            self.assertIsNone(database_interface.get_netflix_show_model(db_session=db, show_id=show_id))
+            self.assertEqual([], database_interface.search_netflix_show_models(db_session=db, **search_kwargs))
+        finally:
+            database_interface.show_cache, database_interface.search_cache = local_caches
+
+    @given(model_instance=st.builds(database_models.NetflixShowModel, show_id=st.integers(1, 2 ** 31 - 2)))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_missing_shows_are_not_cached(self, model_instance: database_models.NetflixShowModel, db):
+        """
+        Tests that reading a show which doesn't exist doesn't cache its absence, so that it's found once created by a
+        write which didn't invalidate this cache (eg. made through another worker)
+        """
+        local_cache = database_interface.show_cache
+        database_interface.show_cache = caching.TTLCache(ttl_seconds=60)
+        try:
+            self.assertIsNone(database_interface.get_netflix_show_row(db_session=db, show_id=model_instance.show_id))
+            db.add(orm.NetflixShow(**model_instance.dict()))  # Bypasses the cache, like another worker's write
+            db.commit()
+            self.assertEqual(model_instance.title, database_interface.get_netflix_show_row(
+                db_session=db, show_id=model_instance.show_id)["title"])
+        finally:
+            database_interface.show_cache = local_cache
+
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=10),
+           orderBy=st.sampled_from(api_enums.SearchOrderByEnum))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_show_rows_match_show_models(self, model_instances: List[database_models.NetflixShowModel],
+                                         orderBy: api_enums.SearchOrderByEnum, db):
+        """
+        Tests that the plain rows served by the read endpoints have the same content, validators and cursors as the
+        models of the shows loaded through the ORM
+        """
+        for db_model in model_instances:
+            database_interface.create_netflix_show(db_session=db, show=db_model)
+        expected = [database_models.NetflixShowVersionModel.from_orm(show) for show in database_interface.
+                    search_netflix_show(db_session=db, filter_args=database_models.NetflixShowSearchModel(),
+                                        orderBy=orderBy)]
+        rows = database_interface.search_netflix_show_rows(db_session=db,
+                                                           filter_args=database_models.NetflixShowSearchModel(),
+                                                           orderBy=orderBy)
+        self.assertEqual([database_models.NetflixShowModel(**show.dict()).dict() for show in expected],
+                         serialization.shows_content(rows))
+        self.assertEqual(conditional.page_etag(expected), conditional.page_etag(rows))
+        for show, row in zip(expected, rows):
+            self.assertEqual(row, database_interface.get_netflix_show_row(db_session=db, show_id=show.show_id))
+            self.assertEqual(conditional.show_validator_headers(show), conditional.show_validator_headers(row))
+            self.assertEqual(pagination.encode_cursor(show, orderBy=orderBy),
+                             pagination.encode_cursor(row, orderBy=orderBy))
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=15),
+           order_by=st.sampled_from(api_enums.SearchOrderByEnum),
+           sort=st.sampled_from(api_enums.SearchSortEnum),
+           batch_size=st.integers(min_value=1, max_value=6))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_stream_and_export_netflix_shows(self, model_instances: List[database_models.NetflixShowModel],
+                                             order_by: api_enums.SearchOrderByEnum, sort: api_enums.SearchSortEnum,
+                                             batch_size: int, db):
+        """
+        Tests that streaming a search returns the same shows, in the same order, as the search itself in batches of at
+        most batch_size rows, and that the NDJSON and CSV exports of the stream contain every show.
+        """
+        database_interface.bulk_create_netflix_shows(db_session=db, shows=model_instances, chunk_size=100)
+        search_kwargs = dict(filter_args=database_models.NetflixShowSearchModel(), orderBy=order_by, sort=sort)
+        expected = [database_models.NetflixShowModel.from_orm(show).dict()
+                    for show in database_interface.search_netflix_show(db_session=db, **search_kwargs)]
+
+        batches = list(database_interface.stream_netflix_shows(db_session=db, batch_size=batch_size, **search_kwargs))
+        self.assertTrue(all(0 < len(rows) <= batch_size for rows in batches))
+        self.assertEqual(expected, [dict(row) for rows in batches for row in rows])
+
+        ndjson_export = "".join(export.export_chunks(batches, api_enums.FileFormatEnum.NDJSON))
+        self.assertEqual(expected, [json.loads(line) for line in ndjson_export.splitlines()])
+
+        csv_export = "".join(export.export_chunks(batches, api_enums.FileFormatEnum.CSV))
+        csv_rows = list(csv.DictReader(io.StringIO(csv_export, newline="")))
+        self.assertEqual([str(show["show_id"]) for show in expected], [row["show_id"] for row in csv_rows])
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=15),
+           batch_size=st.integers(min_value=1, max_value=6))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_ingest_ndjson_netflix_shows(self, model_instances: List[database_models.NetflixShowModel],
+                                         batch_size: int, db):
+        """
+        Tests the streaming ingestion of a random NDJSON file, containing a malformed line, by checking the reported
+        counts and that every valid record was written as parsed.
+        """
+        lines = [json.dumps(show.dict()) + "\n" for show in model_instances] + ["{not json\n"]
+        report = ingestion.ingest(db, ingestion.iter_text_lines(io.BytesIO("".join(lines).encode("utf-8"))),
+                                  api_enums.FileFormatEnum.NDJSON, batch_size=batch_size)
+
+        self.assertEqual(len(lines), report.records_read)
+        self.assertEqual(len(lines), report.last_committed_record)
+        self.assertEqual(len(lines), report.errors[-1].record_number)  # The malformed line
+        self.assertEqual(report.records_read, report.shows_created + report.shows_skipped + report.records_invalid)
+        self.assertEqual(report.shows_created, database_interface.get_number_netflix_shows(db_session=db))
+
+        written_show_ids = set()
+        for line in lines[:-1]:
+            try:
+                show = ingestion.parse_show(line)
+            except ValueError:
+                continue
+            if show.show_id is not None and show.show_id not in written_show_ids:
+                written_show_ids.add(show.show_id)
+                self.assertEqual(show, database_models.NetflixShowModel.from_orm(
+                    database_interface.get_netflix_show(db_session=db, show_id=show.show_id)))
+
+    @inject_in_memory_db_with_netflix_show_table
+    def test_ingest_csv_netflix_shows_resumes_from_checkpoint(self, db):
+        """
+        Tests the ingestion of a CSV file in the format of the Kaggle dataset, resuming from a checkpoint saved part of
+        the way through the file, and that the checkpoint is removed once the file has been ingested.
+        """
+        csv_file = ('\ufeffshow_id,type,title,director,cast,country,date_added,release_year,rating,duration,listed_in,'
+                    'description\r\n'
+                    's1,Movie,Skipped Show,,,,,2020,,,,Already ingested\r\n'
+                    's2,Movie,Second Show,A Director,,United States,"September 25, 2021",2020,PG-13,90 min,Dramas,'
+                    '"Spans\r\ntwo lines"\r\n'
+                    's3,TV Show,,,,,,,,,,Missing its title\r\n'
+                    'x4,Movie,Bad show_id,,,,,,,,,\r\n'
+                    's5,TV Show,Fifth Show,,,,,not a year,,,,\r\n'
+                    ',Movie,Generated show_id,,,,,1999,,,,\r\n')
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, "netflix_titles.csv.checkpoint.json")
+            ingestion.save_checkpoint(checkpoint_path, "netflix_titles.csv", 1)
+            with self.assertRaises(ValueError):
+                ingestion.load_checkpoint(checkpoint_path, "other.csv")
+
+            progress = []
+            report = ingestion.ingest(db, ingestion.iter_text_lines(io.BytesIO(csv_file.encode("utf-8"))),
+                                      ingestion.format_from_filename("netflix_titles.csv"), batch_size=1,
+                                      source="netflix_titles.csv", checkpoint_path=checkpoint_path,
+                                      progress_callback=lambda current: progress.append(current.last_committed_record))
+            self.assertFalse(os.path.exists(checkpoint_path))
+
+        self.assertEqual(1, report.resumed_from_record)
+        self.assertEqual((5, 2, 0, 3), (report.records_read, report.shows_created, report.shows_skipped,
+                                        report.records_invalid))
+        self.assertEqual([3, 4, 5], [error.record_number for error in report.errors])
+        self.assertEqual([2, 6, 6], progress)
+        self.assertIsNone(database_interface.get_netflix_show(db_session=db, show_id=1))
+        show = database_interface.get_netflix_show(db_session=db, show_id=2)
+        self.assertEqual(("Second Show", "September 25, 2021", 2020, "Spans\r\ntwo lines"),
+                         (show.title, show.date_added, show.release_year, show.description))
+        self.assertEqual(1, len(database_interface.search_netflix_show(
+            db_session=db, filter_args=database_models.NetflixShowSearchModel(title="Generated show_id"))))
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), min_size=1, max_size=10),
+           missing=st.data())
+    @inject_in_memory_db_with_netflix_show_table
+    def test_load_netflix_shows_generates_missing_show_ids(self, model_instances, missing, db):
+        """
+        Tests that a batch loaded in one go, containing shows without a show_id, inserts them with generated show_ids
+        and skips the show_ids which already exist
+        """
+        shows_by_id = {show.show_id: show for show in model_instances if show.show_id is not None}
+        without_id = missing.draw(st.lists(st.builds(database_models.NetflixShowModel, show_id=st.none()),
+                                           min_size=1, max_size=3))
+        existing = list(shows_by_id.values())[:1]
+        database_interface.load_netflix_shows(db, existing)
+
+        inserted = database_interface.load_netflix_shows(db, list(shows_by_id.values()) + without_id)
+        self.assertEqual(len(shows_by_id) - len(existing) + len(without_id), inserted)
+        self.assertEqual(len(shows_by_id) + len(without_id), database_interface.get_number_netflix_shows(db_session=db))
+
     @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel)))
     @inject_in_memory_db_with_netflix_show_table
     def test_get_number_of_shows(self, model_instances: List[database_models.NetflixShowModel], db):
@@ -154,3 +579,1250 @@ class TestDatabaseInterface(unittest.TestCase):
         for key, value in db_column_values.items():
             number_for_colum_from_db = database_interface.get_number_of_unique_for_given_netflix_show_table_column(db_session=db, column_name=key)
             self.assertEqual(number_for_colum_from_db, len(value))
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=10))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_get_netflix_show_summary_counts(self, model_instances: List[database_models.NetflixShowModel], db):
+        """
+        Tests that the single-query summary aggregate matches the individual count methods (counting individual
+        directors and countries of the comma separated strings), and that the cached counts are invalidated when shows
+        are created, updated and deleted.
+        """
+        def count_unique_names(column_name: str):
+            values = db.query(getattr(orm.NetflixShow, column_name)).all()
+            return len({name.strip() for value, in values if value for name in value.split(",") if name.strip()})
+
+        def assert_summary_counts_match_individual_counts():
+            count_unique = database_interface.get_number_of_unique_for_given_netflix_show_table_column
+            self.assertEqual({
+                "number_of_shows": database_interface.get_number_netflix_shows(db_session=db),
+                "number_of_unique_shows": count_unique(db_session=db, column_name=None),
+                "number_of_unique_titles": count_unique(db_session=db, column_name="title"),
+                "number_of_unique_directors": count_unique_names("director"),
+                "number_of_unique_countries": count_unique_names("country"),
+            }, database_interface.get_netflix_show_summary_counts(db_session=db))
+
+        assert_summary_counts_match_individual_counts()  # Also caches the counts for the empty table
+
+        show_ids_used = set()
+        for db_model in model_instances:
+            if db_model.show_id is None or db_model.show_id not in show_ids_used:
+                show_ids_used.add(database_interface.create_netflix_show(db_session=db, show=db_model).show_id)
+        assert_summary_counts_match_individual_counts()
+
+        for show_id in show_ids_used:
+            database_interface.update_netflix_show(db_session=db, show_id=show_id,
+                                                   show=database_models.NetflixShowUpdateModel(title="Same Title"))
+        assert_summary_counts_match_individual_counts()
+
+        for show_id in list(show_ids_used)[::2]:
+            database_interface.delete_netflix_show(db_session=db, show_id=show_id)
+        assert_summary_counts_match_individual_counts()
+
+
+    @settings(deadline=None)
+    @given(names=st.lists(st.text(alphabet="abc ,", max_size=6), min_size=4, max_size=12))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_exact_match_filters_follow_writes(self, names: List[str], db):
+        """
+        Tests that the exact-match filters find the shows whose comma separated director, cast, country or listed_in
+        contains the name, as shows are created (singly and in bulk), updated and deleted
+        """
+        filter_columns = {"director_name": "director", "cast_member": "cast", "country_name": "country",
+                          "genre": "listed_in"}
+
+        def assert_filters_match_strings():
+            shows = db.query(orm.NetflixShow).all()
+            for filter_name, column_name in filter_columns.items():
+                for name in {name.strip() for value in names for name in value.split(",") if name.strip()}:
+                    expected = {show.show_id for show in shows if name in
+                                [part.strip() for part in (getattr(show, column_name) or "").split(",")]}
+                    found = database_interface.search_netflix_show(
+                        db_session=db, filter_args=database_models.NetflixShowSearchModel(**{filter_name: name}))
+                    self.assertEqual(expected, {show.show_id for show in found})
+
+        def show_model(index: int, title: str):
+            return database_models.NetflixShowModel(title=title, director=names[index % len(names)],
+                                                    cast=names[(index + 1) % len(names)],
+                                                    country=names[(index + 2) % len(names)],
+                                                    listed_in=names[(index + 3) % len(names)])
+
+        created = database_interface.create_netflix_show(db_session=db, show=show_model(0, "Single"))
+        database_interface.bulk_create_netflix_shows(db_session=db, chunk_size=3,
+                                                     shows=[show_model(index, "Bulk") for index in range(1, 6)])
+        assert_filters_match_strings()
+
+        database_interface.update_netflix_show(db_session=db, show_id=created.show_id,
+                                               show=database_models.NetflixShowUpdateModel(
+                                                   **show_model(3, "Updated").dict(exclude={"show_id"})))
+        bulk_shows = db.query(orm.NetflixShow).filter(orm.NetflixShow.title == "Bulk").all()
+        database_interface.bulk_update_netflix_shows(db_session=db, chunk_size=2, shows=[
+            database_models.NetflixShowBulkUpdateModel(show_id=show.show_id, **show_model(index + 2, "Bulk").dict(
+                exclude={"show_id"})) for index, show in enumerate(bulk_shows)])
+        assert_filters_match_strings()
+
+        database_interface.delete_netflix_show(db_session=db, show_id=created.show_id)
+        database_interface.bulk_delete_netflix_shows(db_session=db, show_ids=[bulk_shows[0].show_id], chunk_size=1)
+        assert_filters_match_strings()
+
+
+    @settings(deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel,
+                                              type=st.sampled_from([None, "Movie", "TV Show"]),
+                                              country=st.sampled_from([None, "India", "India, France", "Spain,"]),
+                                              release_year=st.one_of(st.none(), st.integers(1990, 1993))),
+                                    max_size=15),
+           title=st.sampled_from([None, "a", "b"]),
+           facet_limit=st.integers(min_value=1, max_value=3))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_get_netflix_show_facets(self, model_instances: List[database_models.NetflixShowModel], title: str,
+                                     facet_limit: int, db):
+        """
+        Tests that the facet counts match the values of the shows matching the search, counting individual countries,
+        keeping the facet_limit most common values of each facet
+        """
+        show_ids_used = set()
+        for db_model in model_instances:
+            if db_model.show_id is None or db_model.show_id not in show_ids_used:
+                show_ids_used.add(database_interface.create_netflix_show(db_session=db, show=db_model).show_id)
+
+        filter_args = database_models.NetflixShowSearchModel(title=title)
+        matching_shows = database_interface.search_netflix_show(db_session=db, filter_args=filter_args)
+        facets = database_interface.get_netflix_show_facets(db_session=db, filter_args=filter_args,
+                                                            facets=["type", "release_year", "country"],
+                                                            facet_limit=facet_limit)
+
+        for facet in ("type", "release_year", "country"):
+            expected_counts = {}
+            for show in matching_shows:
+                values = [getattr(show, facet)] if facet != "country" else \
+                    {name.strip() for name in (show.country or "").split(",") if name.strip()}
+                for value in values:
+                    if value is not None:
+                        expected_counts[value] = expected_counts.get(value, 0) + 1
+            expected = sorted(({"value": value, "count": count} for value, count in expected_counts.items()),
+                              key=lambda bucket: (-bucket["count"], str(bucket["value"])))
+            self.assertEqual(expected[:facet_limit], facets[facet])
+
+    @settings(deadline=None)
+    @given(shows=st.lists(st.tuples(st.one_of(st.none(), DATES_ADDED),
+                                    st.sampled_from([lambda added: f"{added:%B} {added.day}, {added.year}",
+                                                     lambda added: f" {added:%b} {added.day}, {added.year} ",
+                                                     date.isoformat, lambda added: f"{added.day}-{added:%b-%y}"]),
+                                    st.one_of(st.none(), st.integers(min_value=80, max_value=100)),
+                                    st.one_of(st.none(), st.integers(min_value=2000, max_value=2003))),
+                          max_size=12),
+           bounds=st.fixed_dictionaries({
+               "release_year_gte": st.one_of(st.none(), st.integers(min_value=2000, max_value=2003)),
+               "release_year_lte": st.one_of(st.none(), st.integers(min_value=2000, max_value=2003)),
+               "date_added_from": st.one_of(st.none(), DATES_ADDED),
+               "date_added_to": st.one_of(st.none(), DATES_ADDED),
+               "duration_max": st.one_of(st.none(), st.integers(min_value=80, max_value=100))}),
+           sort=st.sampled_from(api_enums.SearchSortEnum),
+           page_size=st.integers(min_value=1, max_value=4))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_range_filters_and_date_ordering(self, shows: list, bounds: dict, sort, page_size: int, db):
+        """
+        Tests that the range filters compare the dates and durations parsed from the date_added and duration strings (in
+        any of their formats), and that orderBy=date_added orders shows by date, including when paginating by cursor
+        """
+        typed_shows = {}  # (date added, minutes, release year) by show_id
+        for added, format_added, minutes, release_year in shows:
+            show = database_models.NetflixShowModel(title="Show", date_added=format_added(added) if added else "Soon",
+                                                    duration=f"{minutes} min" if minutes else "2 Seasons",
+                                                    release_year=release_year)
+            typed_shows[database_interface.create_netflix_show(db_session=db, show=show).show_id] = \
+                (added, minutes, release_year)
+        self.assertEqual({show_id: (added, minutes) for show_id, (added, minutes, _) in typed_shows.items()},
+                         {show.show_id: (show.date_added_on, show.duration_minutes)
+                          for show in db.query(orm.NetflixShow)})
+
+        def within(value, low, high):
+            return value is not None and (low is None or value >= low) and (high is None or value <= high)
+
+        matching = [show_id for show_id, (added, minutes, release_year) in typed_shows.items()
+                    if (bounds["date_added_from"] is None and bounds["date_added_to"] is None
+                        or within(added, bounds["date_added_from"], bounds["date_added_to"]))
+                    and (bounds["duration_max"] is None or within(minutes, None, bounds["duration_max"]))
+                    and (bounds["release_year_gte"] is None and bounds["release_year_lte"] is None
+                         or within(release_year, bounds["release_year_gte"], bounds["release_year_lte"]))]
+        # Ascending: dates ascending, then the shows without a date, ties broken by show_id. Descending is the reverse.
+        expected = sorted(matching, key=lambda show_id: (typed_shows[show_id][0] is None,
+                                                         typed_shows[show_id][0] or date.min, show_id))
+        if database_interface._is_descending(sort):
+            expected.reverse()
+
+        filter_args = database_models.NetflixShowSearchModel(**bounds)
+        order_by = api_enums.SearchOrderByEnum.DATE_ADDED
+        found = database_interface.search_netflix_show(db_session=db, filter_args=filter_args, orderBy=order_by,
+                                                       sort=sort)
+        self.assertEqual(expected, [show.show_id for show in found])
+
+        paginated_show_ids, cursor = [], None
+        while True:
+            page = database_interface.search_netflix_show(db_session=db, filter_args=filter_args, orderBy=order_by,
+                                                          sort=sort, limit=page_size, cursor=cursor)
+            paginated_show_ids += [show.show_id for show in page]
+            if len(page) < page_size:
+                break
+            cursor = pagination.decode_cursor(pagination.encode_cursor(page[-1], orderBy=order_by, sort=sort))
+        self.assertEqual(expected, paginated_show_ids)
+
+
+class TestAsyncDatabaseInterface(unittest.TestCase):
+    """
+    Tests the asyncio variants of the database interface methods using a temporary SQLite database and aiosqlite
+    """
+
+    @settings(max_examples=20, deadline=None)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel), max_size=5),
+           update_model_instance=st.builds(database_models.NetflixShowUpdateModel))
+    @inject_async_db_with_netflix_show_table
+    async def test_async_create_retrieve_update_search_delete_netflix_shows(
+            self, model_instances: List[database_models.NetflixShowModel],
+            update_model_instance: database_models.NetflixShowUpdateModel, db):
+        """
+        Tests every async database interface method by creating, reading, updating, searching, counting and deleting
+        shows, checking the results against the created shows.
+        """
+        show_ids_used = set()
+        for db_model in model_instances:
+            if db_model.show_id is None or db_model.show_id not in show_ids_used:
+                result = await async_database_interface.create_netflix_show(db_session=db, show=db_model)
+                self.assertTrue(isinstance(result, orm.NetflixShow))
+                show_ids_used.add(result.show_id)
+
+        for show_id in show_ids_used:
+            show = await async_database_interface.get_netflix_show(db_session=db, show_id=show_id)
+            self.assertEqual(show_id, show.show_id)
+
+        self.assertEqual(len(show_ids_used), await async_database_interface.get_number_netflix_shows(db_session=db))
+        self.assertEqual(len(show_ids_used),
+                         await async_database_interface.get_number_of_unique_for_given_netflix_show_table_column(
+                             db_session=db, column_name="show_id"))
+
+        results = await async_database_interface.search_netflix_show(
+            db_session=db, filter_args=database_models.NetflixShowSearchModel(), orderBy=api_enums.SearchOrderByEnum.SHOW_ID)
+        self.assertEqual(sorted(show_ids_used), [show.show_id for show in results])
+        streamed_rows = [row async for rows in async_database_interface.stream_netflix_shows(
+            db_session=db, filter_args=database_models.NetflixShowSearchModel(), batch_size=2) for row in rows]
+        self.assertEqual(sorted(show_ids_used), [row["show_id"] for row in streamed_rows])
+
+        for show_id in show_ids_used:
+            updated = await async_database_interface.update_netflix_show(db_session=db, show=update_model_instance,
+                                                                         show_id=show_id)
+            self.assertEqual(update_model_instance, updated)
+            await async_database_interface.delete_netflix_show(db_session=db, show_id=show_id)
+            self.assertIsNone(await async_database_interface.get_netflix_show(db_session=db, show_id=show_id))
+
+
+class TestPoolStatistics(unittest.TestCase):
+    """
+    Tests the connection pool statistics collected for the instrumented pool classes
+    """
+
+    @given(pool_size=st.integers(min_value=1, max_value=3), max_overflow=st.integers(min_value=0, max_value=2))
+    def test_pool_statistics_count_checkouts_overflow_and_timeouts(self, pool_size: int, max_overflow: int):
+        """
+        Tests that checking out every connection of a pool (including overflow connections) is reported as a saturated
+        pool, that a further checkout times out and is counted, and that checkins are reflected in the statistics.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'pool.db')}",
+                                   poolclass=pool_statistics.InstrumentedQueuePool, pool_size=pool_size,
+                                   max_overflow=max_overflow, pool_timeout=0.01)
+            statistics = pool_statistics.attach_pool_statistics(engine)
+
+            connections = [engine.connect() for _ in range(pool_size + max_overflow)]
+            description = pool_statistics.describe_pool(engine, statistics)
+            self.assertTrue(description["saturated"])
+            self.assertEqual(pool_size + max_overflow, description["checked_out"])
+            self.assertEqual(max_overflow, description["overflow"])
+
+            self.assertRaises(PoolTimeoutError, engine.connect)
+
+            for connection in connections:
+                connection.close()
+            description = pool_statistics.describe_pool(engine, statistics)
+            self.assertFalse(description["saturated"])
+            self.assertEqual(0, description["checked_out"])
+            self.assertEqual(1, description["checkout_timeouts"])
+            self.assertEqual(pool_size + max_overflow, description["checkouts"])
+            self.assertEqual(pool_size + max_overflow, description["connections_created"])
+            self.assertIsNotNone(description["max_checkout_wait_ms"])
+
+            engine.dispose()
+            self.assertIs(statistics, engine.pool.statistics)  # Statistics are kept when the pool is recreated
+
+
+class TestReadReplicas(unittest.TestCase):
+    """
+    Tests the routing of reads to read replicas, using a primary and a replica SQLite database file
+    """
+
+    @settings(deadline=None)
+    @given(replica_show=st.builds(database_models.NetflixShowModel),
+           primary_show=st.builds(database_models.NetflixShowModel))
+    @inject_replicated_dbs_with_netflix_show_table
+    def test_reads_are_routed_to_replicas_until_written(self, replica_show: database_models.NetflixShowModel,
+                                                        primary_show: database_models.NetflixShowModel, db,
+                                                        replica_db, router: replicas.ReplicaRouter):
+        """
+        Tests that searches and counts are read from the replica, while writes, the reads which follow them and
+        precondition reads go to the primary, and that reads fall back to the primary when no replica is healthy.
+        """
+        search_kwargs = dict(filter_args=database_models.NetflixShowSearchModel())
+        replica_show_ids = [database_interface.create_netflix_show(
+            db_session=replica_db, show=replica_show.copy(update={"show_id": None})).show_id for _ in range(2)]
+        self.assertEqual(replica_show_ids, [show.show_id for show in database_interface.search_netflix_show(
+            db_session=db, **search_kwargs)])
+        self.assertEqual(2, database_interface.get_number_netflix_shows(db_session=db))
+        self.assertIsNone(database_interface.get_netflix_show_row(db_session=db, show_id=replica_show_ids[0],
+                                                                  use_cache=False))
+        self.assertEqual(2, router.describe()["replicas"][0]["reads"])
+
+        router.read_your_writes_seconds = 60
+        created = database_interface.create_netflix_show(db_session=db,
+                                                         show=primary_show.copy(update={"show_id": None}))
+        self.assertIsNotNone(created)  # Read back from the primary
+        self.assertEqual([created.show_id], [show.show_id for show in database_interface.search_netflix_show(
+            db_session=db, **search_kwargs)])
+        db.close()
+        self.assertEqual(1, database_interface.get_number_netflix_shows(db_session=db))  # Shortly after a write
+        self.assertEqual(2, router.describe()["replicas"][0]["reads"])
+
+        router.read_your_writes_seconds = 0
+        self.assertEqual(2, database_interface.get_number_netflix_shows(db_session=db))
+        self.assertEqual(3, router.describe()["replicas"][0]["reads"])
+
+        replica_db.execute(orm.NetflixShow.__table__.delete())
+        replica_db.commit()
+        unreachable = create_engine(f"sqlite:///{os.path.join(tempfile.gettempdir(), 'missing', 'replica.db')}")
+        db.router = replicas.ReplicaRouter([unreachable, replica_db.get_bind()])
+        for _ in range(4):  # Round-robin, skipping the unreachable replica
+            self.assertEqual(0, database_interface.get_number_netflix_shows(db_session=db))
+        description = db.router.describe()
+        self.assertEqual([False, True], [replica["healthy"] for replica in description["replicas"]])
+        self.assertEqual([0, 4], [replica["reads"] for replica in description["replicas"]])
+
+        db.router = replicas.ReplicaRouter([unreachable])
+        self.assertEqual(1, database_interface.get_number_netflix_shows(db_session=db))  # From the primary
+        self.assertEqual(1, db.router.describe()["primary_reads"])
+
+
+COLUMNAR_TEXT = st.one_of(st.none(), st.text(alphabet="aAbé_%, ", max_size=4))  # Case, wildcards and separators
+COLUMNAR_DATE_ADDED = st.one_of(COLUMNAR_TEXT, st.builds(date.strftime, DATES_ADDED,
+                                                          st.sampled_from(typed_columns.DATE_ADDED_FORMATS)))
+COLUMNAR_DURATION = st.one_of(COLUMNAR_TEXT, st.integers(min_value=1, max_value=5).map("{} min".format),
+                              st.integers(min_value=1, max_value=3).map("{} Seasons".format))
+COLUMNAR_SHOW_STRATEGY = st.builds(database_models.NetflixShowModel, show_id=st.none(), type=COLUMNAR_TEXT,
+                                   title=st.text(alphabet="aAbé_%, ", max_size=4), director=COLUMNAR_TEXT,
+                                   cast=COLUMNAR_TEXT, country=COLUMNAR_TEXT, date_added=COLUMNAR_DATE_ADDED,
+                                   release_year=st.one_of(st.none(), st.integers(min_value=1, max_value=12)),
+                                   rating=COLUMNAR_TEXT, duration=COLUMNAR_DURATION, listed_in=COLUMNAR_TEXT,
+                                   description=COLUMNAR_TEXT)
+COLUMNAR_FILTER = st.one_of(st.none(), st.text(alphabet="aAbé_%, ", min_size=1, max_size=2))
+COLUMNAR_SEARCH_STRATEGY = st.fixed_dictionaries({
+    "filter_args": st.builds(database_models.NetflixShowSearchModel, type=COLUMNAR_FILTER, title=COLUMNAR_FILTER,
+                             director=COLUMNAR_FILTER, cast=COLUMNAR_FILTER, country=COLUMNAR_FILTER,
+                             date_added=st.none(), rating=st.none(), duration=COLUMNAR_FILTER, listed_in=st.none(),
+                             description=COLUMNAR_FILTER,
+                             release_year=st.one_of(st.none(), st.integers(min_value=1, max_value=12)),
+                             show_id=st.one_of(st.none(), st.integers(min_value=1, max_value=20)),
+                             director_name=COLUMNAR_FILTER, cast_member=st.none(), country_name=COLUMNAR_FILTER,
+                             genre=st.none(),
+                             release_year_gte=st.one_of(st.none(), st.integers(min_value=1, max_value=12)),
+                             release_year_lte=st.one_of(st.none(), st.integers(min_value=1, max_value=12)),
+                             date_added_from=st.one_of(st.none(), DATES_ADDED),
+                             date_added_to=st.one_of(st.none(), DATES_ADDED),
+                             duration_max=st.one_of(st.none(), st.integers(min_value=1, max_value=5))),
+    "skip": st.one_of(st.none(), st.integers(min_value=0, max_value=5)),
+    "limit": st.one_of(st.none(), st.integers(min_value=1, max_value=5)),
+    "orderBy": st.one_of(st.none(), st.sampled_from(api_enums.SearchOrderByEnum)),
+    "sort": st.one_of(st.none(), st.sampled_from(api_enums.SearchSortEnum)),
+})
+
+
+class TestColumnarSearch(unittest.TestCase):
+    """
+    Tests that searches answered by the columnar snapshot return exactly what the database returns
+    """
+
+    @staticmethod
+    def database_rows(db, **search_parameters):
+        statement, parameters = database_interface._search_statement_and_parameters(
+            "sqlite", columns=database_interface.SHOW_ROW_COLUMNS, **search_parameters)
+        return database_interface._rows(db.execute(statement, parameters))
+
+    @staticmethod
+    def columnar_engine():
+        return columnar.ColumnarSearchEngine(
+            row_columns=[column.name for column in database_interface.SHOW_ROW_COLUMNS],
+            integer_columns=["show_id", "release_year", "version"], max_age_seconds=0)
+
+    def assert_same_pages(self, engine: columnar.ColumnarSearchEngine, db, search: dict):
+        """
+        Asserts that the search, and the page after it (by cursor), are answered like the database does
+        """
+        searches = [dict(search, cursor=None)]
+        first_page = self.database_rows(db, **searches[0])
+        if first_page and search["limit"] and not search["skip"]:
+            searches.append(dict(search, cursor=pagination.decode_cursor(pagination.encode_cursor(
+                first_page[-1], orderBy=search["orderBy"], sort=search["sort"]))))
+        for search_parameters in searches:
+            found = engine.search(db, database_interface.netflix_show_rows,
+                                  filter_args=search_parameters["filter_args"], skip=search_parameters["skip"],
+                                  limit=search_parameters["limit"], cursor=search_parameters["cursor"],
+                                  order_by=search["orderBy"].value if search["orderBy"] else None,
+                                  descending=database_interface._is_descending(search["sort"]))
+            self.assertEqual(self.database_rows(db, **search_parameters), found)
+
+    @settings(deadline=None, max_examples=50)
+    @given(shows=st.lists(COLUMNAR_SHOW_STRATEGY, max_size=15),
+           searches=st.lists(COLUMNAR_SEARCH_STRATEGY, min_size=1, max_size=5))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_columnar_searches_match_the_database(self, shows: List[database_models.NetflixShowModel],
+                                                  searches: List[dict], db):
+        """
+        Tests filters (substring, with LIKE wildcards and ASCII case folding, exact names and ranges), every ordering,
+        skip, limit and cursors against the SQL search of the same shows
+        """
+        database_interface.bulk_create_netflix_shows(db_session=db, shows=shows, chunk_size=100)
+        engine = self.columnar_engine()
+        for search in searches:
+            self.assert_same_pages(engine, db, search)
+        self.assertEqual((1, 0), (engine.loads, engine.database_searches))
+
+    # Lists of shows with every field, and searches with every filter, often exceed the default size of examples
+    @settings(deadline=None, max_examples=25, suppress_health_check=[HealthCheck.data_too_large])
+    @given(shows=st.lists(COLUMNAR_SHOW_STRATEGY, min_size=4, max_size=10),
+           updates=st.lists(COLUMNAR_SHOW_STRATEGY, min_size=2, max_size=4),
+           search=COLUMNAR_SEARCH_STRATEGY)
+    @inject_in_memory_db_with_netflix_show_table
+    def test_columnar_snapshot_follows_writes(self, shows: List[database_models.NetflixShowModel],
+                                              updates: List[database_models.NetflixShowModel], search: dict, db):
+        """
+        Tests that writes made through the database interface are applied to the snapshot incrementally, rather than
+        by loading it again, as shows are created, updated and deleted (singly and in bulk)
+        """
+        previous_engine = database_interface.columnar_search
+        database_interface.columnar_search = engine = self.columnar_engine()
+        search_parameters = dict(search, cursor=None)
+        try:
+            def assert_searches_match():
+                self.assertEqual(self.database_rows(db, **search_parameters),
+                                 database_interface.search_netflix_show_rows(db_session=db, **search_parameters))
+                self.assert_same_pages(engine, db, search)
+
+            database_interface.bulk_create_netflix_shows(db_session=db, shows=shows[1:], chunk_size=3)
+            assert_searches_match()
+            created = database_interface.create_netflix_show(db_session=db, show=shows[0])
+            show_ids = [row["show_id"] for row in self.database_rows(
+                db, filter_args=database_models.NetflixShowSearchModel())]
+            database_interface.update_netflix_show(db_session=db, show_id=created.show_id,
+                                                   show=database_models.NetflixShowUpdateModel(**updates[0].dict()))
+            assert_searches_match()
+            database_interface.bulk_update_netflix_shows(db_session=db, chunk_size=2, shows=[
+                database_models.NetflixShowBulkUpdateModel(**dict(update.dict(), show_id=show_id))
+                for update, show_id in zip(updates[1:], show_ids)])
+            database_interface.delete_netflix_show(db_session=db, show_id=show_ids[-1])
+            assert_searches_match()
+            database_interface.bulk_delete_netflix_shows(db_session=db, show_ids=show_ids[:2], chunk_size=1)
+            database_interface.create_netflix_show(db_session=db, show=updates[0].copy(
+                update={"show_id": show_ids[0]}))  # Reuses the slot of a deleted show
+            assert_searches_match()
+            self.assertEqual(1, engine.loads)
+            self.assertEqual(3, engine.incremental_refreshes)
+        finally:
+            database_interface.columnar_search = previous_engine
+
+
+class TestSchemaStartup(unittest.TestCase):
+    """
+    Tests the preparation of the database schema when the Api starts
+    """
+
+    def test_schema_is_only_created_unless_migrated(self):
+        """
+        Tests that the "migrated" mode creates the schema of a new database, but skips it once the database is at the
+        latest migration, as found by Alembic itself, and that the "skip" mode doesn't connect to the database.
+        """
+        from alembic.config import Config
+        from alembic.script import ScriptDirectory
+
+        config = Config()
+        config.set_main_option("script_location", os.path.dirname(schema.ALEMBIC_VERSIONS_DIRECTORY))
+        head_revisions = set(ScriptDirectory.from_config(config).get_heads())
+        self.assertEqual(head_revisions, schema.alembic_head_revisions())
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, 'netflix.db')
+            engine = create_engine(f"sqlite:///{database_path}")
+            self.assertEqual("skipped", schema.prepare_schema(engine, "skip"))
+            self.assertFalse(os.path.exists(database_path))  # Not connected to
+            self.assertFalse(schema.schema_is_migrated(engine))
+            self.assertEqual("created", schema.prepare_schema(engine, "migrated"))
+
+            with engine.begin() as connection:
+                connection.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)"))
+                connection.execute(text("INSERT INTO alembic_version VALUES (:revision)"),
+                                   {"revision": head_revisions.pop()})
+            self.assertEqual("migrated", schema.prepare_schema(engine, "migrated"))
+            self.assertEqual("created", schema.prepare_schema(engine, "create"))
+            self.assertRaises(ValueError, lambda: schema.prepare_schema(engine, "never"))
+            engine.dispose()
+
+    @settings(deadline=None, max_examples=20)
+    @given(model_instances=st.lists(st.builds(database_models.NetflixShowModel, show_id=st.integers(1, 2 ** 31 - 2),
+                                              **{column: NAMES for column in show_entities.RELATIONS_BY_COLUMN}),
+                                    max_size=8, unique_by=lambda show: show.show_id))
+    def test_created_join_tables_are_backfilled(self, model_instances: List[database_models.NetflixShowModel]):
+        """
+        Tests that creating the schema of a database whose Netflix table predates the join tables fills them from the
+        existing shows, as their migration does
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'netflix.db')}")
+            orm.NetflixShow.__table__.create(bind=engine)
+            with engine.begin() as connection:
+                for show in model_instances:
+                    connection.execute(orm.NetflixShow.__table__.insert(), show.dict())
+            schema.create_schema(engine)
+            schema.create_schema(engine)  # Doesn't fill the join tables twice
+
+            with sessionmaker(bind=engine)() as db:
+                for relation in show_entities.RELATIONS:
+                    expected = {(show.show_id, name) for show in model_instances
+                                for name in show_entities.split_names(getattr(show, relation.show_column_name))}
+                    linked = set(db.execute(select(relation.link.show_id, relation.entity.name)
+                                            .join(relation.entity, relation.entity_id == relation.link_entity_id)))
+                    self.assertEqual(expected, linked)
+            engine.dispose()
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    """
+    Tests the log of slow statements, using a new in-memory database whose every statement is slow
+    """
+
+    @settings(deadline=None, max_examples=20)
+    @given(director=st.text(alphabet="abcdefghijklmnopqrstuvwxyz", min_size=12, max_size=20),
+           show_ids=st.lists(st.integers(min_value=1, max_value=10 ** 6), min_size=1, max_size=5))
+    def test_slow_searches_are_logged_without_their_values(self, director: str, show_ids: List[int]):
+        """
+        Tests that slow searches are logged with their normalized statement, parameter shape and query plan, that
+        searches which only differ by their values share a fingerprint, and that writes are not explained
+        """
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        orm.Base.metadata.create_all(bind=engine)
+        slow_query_log = slow_queries.SlowQueryLog(threshold_ms=0, size=10, explain=True)
+        slow_queries.attach_slow_query_log(engine, slow_query_log)
+        db = sessionmaker(bind=engine)()
+        try:
+            for filter_args in (database_models.NetflixShowSearchModel(director=director),
+                                database_models.NetflixShowSearchModel(director=director[::-1])):
+                database_interface.search_netflix_show(db, filter_args=filter_args)
+            db.execute(orm.NetflixShow.__table__.delete().where(orm.NetflixShow.show_id.in_(show_ids)))
+        finally:
+            db.close()
+
+        description = slow_query_log.describe()
+        searches = [query for query in description["queries"] if "director" in query["statement"]]
+        self.assertEqual(len(searches), 2)
+        self.assertEqual(searches[0]["fingerprint"], searches[1]["fingerprint"])
+        self.assertTrue(searches[1]["plan"])  # Only the first of a fingerprint is explained
+        self.assertIsNone(searches[0]["plan"])
+        deletes = [query for query in description["queries"] if query["statement"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn("(?...)" if len(show_ids) > 1 else "(?)", deletes[0]["statement"])
+        self.assertIsNone(deletes[0]["plan"])
+        for query in description["queries"]:
+            self.assertNotIn(director, json.dumps(query, default=str))
+            self.assertNotIn(director[::-1], json.dumps(query, default=str))
+        self.assertEqual(description["slow_queries"], len(description["queries"]))
+
+
+class TestTTLCache(unittest.TestCase):
+    """
+    Tests the per-process TTL cache, and the cache backed by a shared store
+    """
+
+    @given(key=st.text(), value=st.integers())
+    def test_values_read_before_an_invalidation_are_not_cached(self, key: str, value: int):
+        """
+        Tests that values are cached, that invalidation removes them, and that a value computed from data read before
+        an invalidation is discarded instead of cached
+        """
+        cache = caching.TTLCache(ttl_seconds=60)
+        self.assertTrue(cache.set(key, value, generation=cache.generation))
+        self.assertEqual(value, cache.get(key))
+
+        generation = cache.generation
+        cache.invalidate()
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(cache.set(key, value, generation=generation))
+        self.assertIsNone(cache.get(key))
+
+    @given(key=st.text(), value=st.integers())
+    def test_expired_values_are_not_returned(self, key: str, value: int):
+        """
+        Tests that entries are not returned after their TTL, and that a cache with no TTL stores nothing
+        """
+        cache = caching.TTLCache(ttl_seconds=0.001)
+        cache.set(key, value)
+        time.sleep(0.002)
+        self.assertIsNone(cache.get(key))
+
+        disabled_cache = caching.TTLCache(ttl_seconds=0)
+        self.assertFalse(disabled_cache.set(key, value))
+        self.assertIsNone(disabled_cache.get(key))
+
+    @given(keys=st.lists(st.integers(), unique=True, min_size=1, max_size=20),
+           max_entries=st.integers(min_value=2, max_value=10))
+    def test_least_recently_used_values_are_evicted(self, keys: List[int], max_entries: int):
+        """
+        Tests that a cache never holds more than max_entries entries, that the least recently used ones are evicted,
+        and that hits, misses and evictions are counted
+        """
+        cache = caching.TTLCache(ttl_seconds=60, max_entries=max_entries)
+        for key in keys:
+            cache.set(key, key)
+            cache.get(keys[0])  # Keeps the first key the most recently used
+        self.assertEqual(min(len(keys), max_entries), len(cache))
+        self.assertEqual(keys[0], cache.get(keys[0]))
+        expected_cached = [keys[0]] + keys[1:][-(max_entries - 1):]
+        self.assertEqual(sorted(expected_cached), sorted(key for key in keys if cache.get(key) is not None))
+
+        statistics = cache.describe()
+        self.assertEqual(len(keys) - len(expected_cached), statistics["evictions"])
+        self.assertEqual(len(keys) - len(expected_cached), statistics["misses"])
+        self.assertEqual(len(keys) + 1 + len(expected_cached), statistics["hits"])
+
+    @given(key=st.text(), value=st.integers())
+    def test_shared_cache_is_seen_by_every_node(self, key: str, value: int):
+        """
+        Tests that values cached through one node's SharedCache are seen by another's using the same store, and that
+        invalidations, deletions and values read before an invalidation behave as in the per-process cache
+        """
+        store = caching.InMemorySharedCacheStore()
+        node_cache, other_node_cache = (caching.SharedCache(store, namespace="show", ttl_seconds=60) for _ in range(2))
+        node_cache.set(key, value, generation=node_cache.generation)
+        self.assertEqual(value, other_node_cache.get(key))
+
+        other_node_cache.delete(key)
+        self.assertIsNone(node_cache.get(key))
+
+        generation = node_cache.generation
+        node_cache.set(key, value)
+        other_node_cache.invalidate()
+        node_cache.set(key, value, generation=generation)
+        self.assertIsNone(node_cache.get(key))
+        self.assertEqual((0, 2), (node_cache.describe()["hits"], node_cache.describe()["misses"]))
+        self.assertEqual(1, other_node_cache.describe()["hits"])  # Statistics are kept per node
+
+
+class TestConditionalRequests(unittest.TestCase):
+    """
+    Tests the ETag and Last-Modified validators and the evaluation of conditional request headers
+    """
+
+    @given(show=st.builds(database_models.NetflixShowVersionModel, version=st.integers(min_value=1, max_value=1000),
+                          updated_at=st.datetimes(min_value=datetime(2000, 1, 1), max_value=datetime(2100, 1, 1))))
+    def test_validators_change_with_every_write(self, show: database_models.NetflixShowVersionModel):
+        """
+        Tests that a show's ETag changes with its version and modification time, and that If-None-Match, If-Match and
+        If-Modified-Since are evaluated against it
+        """
+        etag = conditional.show_etag(show)
+        self.assertNotEqual(etag, conditional.show_etag(show.copy(update={"version": show.version + 1})))
+        self.assertNotEqual(etag, conditional.show_etag(show.copy(update={"updated_at": show.updated_at +
+                                                                                        timedelta(microseconds=1)})))
+        self.assertNotEqual(conditional.page_etag([show]), conditional.page_etag([]))
+
+        self.assertTrue(conditional.not_modified(if_none_match=f'"other", W/{etag}', etag=etag))
+        self.assertTrue(conditional.not_modified(if_none_match="*", etag=etag))
+        self.assertFalse(conditional.not_modified(if_none_match='"other"', etag=etag,
+                                                  if_modified_since=conditional.http_date(show.updated_at),
+                                                  last_modified=show.updated_at))
+        self.assertTrue(conditional.match(etag, etag))
+        self.assertTrue(conditional.match("*", etag))
+        self.assertFalse(conditional.match(f"W/{etag}", etag))
+        self.assertFalse(conditional.match("*", None))
+
+        last_modified = conditional.http_date(show.updated_at)
+        self.assertTrue(conditional.not_modified(if_modified_since=last_modified, last_modified=show.updated_at))
+        self.assertFalse(conditional.not_modified(if_modified_since=last_modified,
+                                                  last_modified=show.updated_at + timedelta(seconds=1)))
+        self.assertFalse(conditional.not_modified(if_modified_since="not a date", last_modified=show.updated_at))
+
+
+class TestAuth(unittest.TestCase):
+    """
+    Tests the verification of JWT access tokens, with key rotation and the cache of verified tokens
+    """
+
+    @given(name=st.text(min_size=1, max_size=20), old_secret=st.text(min_size=1, max_size=20),
+           new_secret=st.text(min_size=1, max_size=20))
+    def test_verify_access_token_with_key_rotation(self, name: str, old_secret: str, new_secret: str):
+        """
+        Tests that tokens signed with any configured key verify (the second time from the cache), and that tokens that
+        are expired, tampered with, or signed with a removed key are rejected
+        """
+        signing_keys, secret_key, active_kid = dict(auth.SIGNING_KEYS), auth.SECRET_KEY, auth.ACTIVE_KID
+        try:
+            auth.configure_signing_keys({"old": old_secret})
+            old_token = auth.create_access_token({"sub": {"name": name}}, timedelta(minutes=5)).token
+            auth.configure_signing_keys({"new": new_secret, "old": old_secret})
+            new_token = auth.create_access_token({"sub": {"name": name}}, timedelta(minutes=5)).token
+
+            for token in (old_token, new_token, new_token):
+                self.assertEqual(auth.verify_access_token(token)["sub"], {"name": name})
+            self.assertEqual(auth.token_cache.statistics.hits, 1)
+
+            expired_token = auth.create_access_token({"sub": {"name": name}}, timedelta(seconds=-1)).token
+            for token in (expired_token, new_token[:-2], "not a token"):
+                with self.assertRaises(auth.InvalidTokenError):
+                    auth.verify_access_token(token)
+
+            auth.configure_signing_keys({"new": new_secret})
+            self.assertEqual(auth.verify_access_token(new_token)["sub"], {"name": name})
+            with self.assertRaises(auth.InvalidTokenError):
+                auth.verify_access_token(old_token)
+        finally:
+            auth.configure_signing_keys(signing_keys, active_kid, secret_key)
+            auth.token_cache.statistics = caching.CacheStatistics()
+
+    @given(metrics_token=st.one_of(st.none(), st.text(max_size=40)), token=st.text(max_size=40))
+    def test_metrics_bearer_token(self, metrics_token: str, token: str):
+        """
+        Tests that only the configured static metrics token is accepted as one, and no token when none is configured
+        """
+        configured_token = auth.METRICS_BEARER_TOKEN
+        try:
+            auth.METRICS_BEARER_TOKEN = metrics_token
+            self.assertEqual(auth.is_metrics_bearer_token(token), bool(metrics_token) and token == metrics_token)
+            self.assertEqual(auth.is_metrics_bearer_token(metrics_token), bool(metrics_token))
+        finally:
+            auth.METRICS_BEARER_TOKEN = configured_token
+
+    def test_latency_histogram(self):
+        """
+        Tests that durations are counted in the bucket of every upper bound they don't exceed
+        """
+        histogram = latency.LatencyHistogram(buckets_ms=(1, 10))
+        for seconds in (0.0005, 0.001, 0.005, 0.5):
+            histogram.record(seconds)
+        description = histogram.describe()
+        self.assertEqual([bucket["count"] for bucket in description["buckets"]], [2, 3, 4])
+        self.assertEqual(description["count"], 4)
+        self.assertAlmostEqual(description["max_ms"], 500)
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests the Prometheus metrics, and their aggregation across gunicorn workers
+    """
+
+    @settings(deadline=None)
+    @given(worker_durations=st.lists(st.lists(st.floats(min_value=0, max_value=2), max_size=10), min_size=1,
+                                     max_size=4))
+    def test_metrics_are_added_up_across_workers(self, worker_durations: List[List[float]]):
+        """
+        Tests that the snapshots of every worker are added up, and that the requests in flight of the workers which
+        exit are dropped while their counts are kept
+        """
+        def worker_registry(directory: str):
+            registry = metrics.MetricsRegistry(directory)
+            registry.register(metrics.Counter("requests_total", "Requests.", ("route",)))
+            registry.register(metrics.Gauge("requests_in_flight", "Requests in flight."))
+            registry.register(metrics.Histogram("request_duration_seconds", "Durations.", buckets=(0.1, 1)))
+            return registry
+
+        with tempfile.TemporaryDirectory() as directory:
+            for pid, durations in enumerate(worker_durations, start=1):
+                registry = worker_registry(directory)
+                for seconds in durations:
+                    registry.metrics["requests_total"].inc("/show/{show_id}")
+                    registry.metrics["request_duration_seconds"].observe(seconds)
+                registry.metrics["requests_in_flight"].inc()
+                with open(registry._worker_file_path(pid), "w") as snapshot_file:
+                    json.dump(registry.snapshot(), snapshot_file)  # As flushed by worker `pid`
+
+            serving_registry = worker_registry(directory)  # Of the worker serving /metrics, which has no requests
+            every_duration = [seconds for durations in worker_durations for seconds in durations]
+            totals = serving_registry.collect()
+            self.assertEqual(totals.get("requests_total", {}).get(("/show/{show_id}",), 0), len(every_duration))
+            self.assertEqual(totals["requests_in_flight"][()], len(worker_durations))
+            rendered = serving_registry.render()
+            self.assertIn(f'request_duration_seconds_count {len(every_duration)}', rendered)
+            self.assertIn(f'request_duration_seconds_bucket{{le="0.1"}} '
+                          f'{sum(1 for seconds in every_duration if seconds <= 0.1)}', rendered)
+
+            serving_registry.mark_process_dead(1)
+            totals = serving_registry.collect()
+            self.assertEqual(totals.get("requests_total", {}).get(("/show/{show_id}",), 0), len(every_duration))
+            self.assertEqual(totals["requests_in_flight"].get((), 0), len(worker_durations) - 1)
+
+    @inject_in_memory_db_with_netflix_show_table
+    def test_sql_is_timed_by_database_call(self, db):
+        """
+        Tests that the SQL statements executed during a database call are labeled with its name
+        """
+        metrics.instrument_sql()
+        label = ("get_number_netflix_shows",)
+        calls_before = metrics.database_call_duration.values.get(label, [0])[:-1]
+        queries_before = metrics.database_query_duration.values.get(label, [0])[:-1]
+        with metrics.database_call("get_number_netflix_shows"):
+            database_interface.get_number_netflix_shows(db)
+        self.assertEqual(sum(metrics.database_call_duration.values[label][:-1]), sum(calls_before) + 1)
+        self.assertGreater(sum(metrics.database_query_duration.values[label][:-1]), sum(queries_before))
+        self.assertIsNone(metrics.database_function_name.get())
+
+
+SHOW_FIELD_NAMES = [column.name for column in database_interface.SHOW_ROW_COLUMNS]
+
+
+class TestGraphQL(unittest.TestCase):
+    """
+    Tests the GraphQL interface, executing queries against the in-memory database and capturing the SQL they run
+    """
+
+    @staticmethod
+    def execute(db, query: str, variables: dict = None, **limits):
+        """
+        :return: (tuple) The status code and content of the query's response, and (list) the SELECT statements it ran
+        """
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            if statement.startswith("SELECT"):
+                statements.append(statement)
+
+        async def call_database(database_function, **kwargs):
+            return database_function(db, **kwargs)
+
+        event.listen(db.get_bind(), "before_cursor_execute", capture)
+        try:
+            status_code, content = asyncio.run(graphql_api.execute_query(query, variables, None,
+                                                                         call_database=call_database, **limits))
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", capture)
+        return status_code, content, statements
+
+    @settings(deadline=None, max_examples=50)
+    @given(shows=st.lists(st.builds(database_models.NetflixShowModel, show_id=st.none(),
+                                    type=st.sampled_from(["Movie", "TV Show"])), max_size=15),
+           fields=st.lists(st.sampled_from(SHOW_FIELD_NAMES), min_size=1, unique=True),
+           type_filter=st.one_of(st.none(), st.sampled_from(["Movie", "TV Show"])),
+           orderBy=st.one_of(st.none(), st.sampled_from(api_enums.SearchOrderByEnum)),
+           sort=st.sampled_from(api_enums.SearchSortEnum),
+           limit=st.integers(min_value=1, max_value=5))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_search_matches_the_search_endpoint_and_selects_only_requested_fields(
+            self, shows: List[database_models.NetflixShowModel], fields: List[str], type_filter: str, orderBy, sort,
+            limit: int, db):
+        """
+        Tests that two pages of a GraphQL search (the second one at its next_cursor) return the requested fields of the
+        shows a search of the database returns, and that the columns of the fields which weren't requested (besides
+        show_id and the orderBy field, needed for the cursor) are not selected
+        """
+        for show in shows:
+            database_interface.create_netflix_show(db_session=db, show=show)
+        filter_args = database_models.NetflixShowSearchModel(type=type_filter)
+        expected = database_interface.search_netflix_show_rows(db, filter_args=filter_args,
+                                                               orderBy=orderBy if orderBy else None,
+                                                               sort=sort if orderBy else None)
+        ordering = f"orderBy: {orderBy.value}, sort: {sort.value}," if orderBy else ""
+        query = ("query($filter: ShowSearchFilter, $cursor: String) { search(filter: $filter, %s limit: %d, "
+                 "cursor: $cursor) { shows { %s } next_cursor } }" % (ordering, limit, " ".join(fields)))
+        selected = {"show_id", *fields, *([orderBy.value] if orderBy else [])}
+
+        cursor = None
+        for page in range(2):
+            status_code, content, statements = self.execute(db, query, {"filter": {"type": type_filter},
+                                                                        "cursor": cursor})
+            self.assertEqual(status_code, 200, content)
+            page_shows = expected[page * limit:(page + 1) * limit]
+            self.assertEqual(content["data"]["search"]["shows"],
+                             [json.loads(json.dumps({field: show[field] for field in fields},
+                                                    default=datetime.isoformat)) for show in page_shows])
+            cursor = content["data"]["search"]["next_cursor"]
+            self.assertEqual(cursor is not None, len(page_shows) == limit)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(set(re.findall(r'netflix\."?(\w+)', statements[0].split("FROM")[0])), selected)
+            if cursor is None:
+                break
+
+    @settings(deadline=None, max_examples=50)
+    @given(shows=st.lists(st.builds(database_models.NetflixShowModel, show_id=st.none()), min_size=1, max_size=10),
+           show_ids=st.lists(st.integers(min_value=1, max_value=12), min_size=1, max_size=8))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_shows_requested_by_id_are_loaded_with_one_statement(self, shows: List[database_models.NetflixShowModel],
+                                                                 show_ids: List[int], db):
+        """
+        Tests that the shows requested by aliased show fields, a shows field and a fragment are all read with a single
+        statement, with null for the show_ids which don't exist
+        """
+        created = {database_interface.create_netflix_show(db_session=db, show=show).show_id for show in shows}
+        aliases = " ".join(f"show_{index}: show(show_id: {show_id}) {{ ...Fields }}"
+                           for index, show_id in enumerate(show_ids))
+        query = ("query($ids: [Int!]!) { %s listed: shows(show_ids: $ids) { title show_id } } "
+                 "fragment Fields on Show { show_id title }" % aliases)
+        status_code, content, statements = self.execute(db, query, {"ids": show_ids[::-1]})
+
+        self.assertEqual(status_code, 200, content)
+        self.assertEqual(len(statements), 1, statements)
+        self.assertIn("netflix.title", statements[0])
+        self.assertNotIn("netflix.description", statements[0])
+        for index, show_id in enumerate(show_ids):
+            show = content["data"][f"show_{index}"]
+            self.assertEqual(show["show_id"] if show else None, show_id if show_id in created else None)
+        self.assertEqual([show["show_id"] if show else None for show in content["data"]["listed"]],
+                         [show_id if show_id in created else None for show_id in show_ids[::-1]])
+
+    @inject_in_memory_db_with_netflix_show_table
+    def test_queries_above_the_depth_or_cost_limits_are_rejected(self, db):
+        """
+        Tests that queries nested too deeply, or which may read too many shows (counting every search, show and show_id,
+        including those of fragments and variables), are rejected without reading the database
+        """
+        search = "query($limit: Int) { search(limit: $limit) { shows { title } } }"
+        search_cost = graphql_api.SEARCH_COST + 10
+        status_code, content, statements = self.execute(db, search, {"limit": 10}, max_depth=3, max_cost=search_cost)
+        self.assertEqual(status_code, 200, content)
+        status_code, content, statements = self.execute(db, search, {"limit": 10}, max_depth=2, max_cost=search_cost)
+        self.assertEqual(status_code, 400)
+        self.assertIn("depth of 3", content["errors"][0]["message"])
+        self.assertEqual(statements, [])
+        status_code, content, statements = self.execute(db, search, {"limit": 11}, max_depth=3, max_cost=search_cost)
+        self.assertEqual(status_code, 400)
+        self.assertIn(f"cost of {search_cost + 1}", content["errors"][0]["message"])
+        self.assertEqual(statements, [])
+
+        by_id = ("{ ...Shows first: show(show_id: 1) { title} } "
+                 "fragment Shows on Query { shows(show_ids: [1, 2]) { title } }")
+        self.assertEqual(self.execute(db, by_id, max_depth=2, max_cost=3)[0], 200)
+        status_code, content, statements = self.execute(db, by_id, max_depth=2, max_cost=2)
+        self.assertEqual(status_code, 400)
+        self.assertIn("cost of 3", content["errors"][0]["message"])
+
+        introspection = "{ __schema { types { name fields { name type { name ofType { name } } } } } }"
+        self.assertEqual(self.execute(db, introspection, max_depth=1, max_cost=0)[0], 200)
+
+    @given(limit=st.one_of(st.text(), st.floats().filter(lambda f: not f.is_integer()), st.booleans(),
+                           st.lists(st.integers(), min_size=1), st.integers(min_value=2 ** 31)))
+    @inject_in_memory_db_with_netflix_show_table
+    def test_wrongly_typed_variables_are_rejected(self, limit, db):
+        """
+        Tests that a variable which can't be coerced to its type is rejected as a GraphQL error before computing the
+        query's cost, rather than failing the request, and that an integer given as a string isn't one
+        """
+        status_code, content, statements = self.execute(
+            db, "query($limit: Int!) { search(limit: $limit) { shows { show_id } } }", {"limit": limit})
+        self.assertEqual(status_code, 400)
+        self.assertIn("$limit", content["errors"][0]["message"])
+        self.assertEqual(statements, [])
+
+    @inject_in_memory_db_with_netflix_show_table
+    def test_null_search_limit_is_an_error(self, db):
+        """
+        Tests that an explicit null limit, given literally or by a variable, is reported as a GraphQL error rather than
+        failing the query, and that the limit can still be omitted
+        """
+        status_code, content, statements = self.execute(db, "{ search(limit: null) { next_cursor } }")
+        self.assertEqual(status_code, 400)
+        self.assertIn("Int!", content["errors"][0]["message"])
+        status_code, content, statements = self.execute(
+            db, "query($limit: Int) { search(limit: $limit) { next_cursor } }", {"limit": None})
+        self.assertEqual(status_code, 200)
+        self.assertIsNone(content["data"])
+        self.assertIn("must not be null", content["errors"][0]["message"])
+        self.assertEqual(statements, [])
+        status_code, content, statements = self.execute(db, "{ search { next_cursor } }")
+        self.assertEqual((status_code, content), (200, {"data": {"search": {"next_cursor": None}}}))
+
+
+
+class TestReadCoalescing(unittest.TestCase):
+    """
+    Tests the coalescing of concurrent identical reads, with calls which wait until they are released
+    """
+
+    @settings(deadline=None, max_examples=50)
+    @given(keys=st.lists(st.integers(min_value=0, max_value=3), min_size=1, max_size=30))
+    def test_concurrent_identical_reads_share_one_call(self, keys: List[int]):
+        """
+        Tests that reads with the same key made while a call is in flight share its result (or error), and that later
+        reads make a new call
+        """
+        single_flight = coalescing.SingleFlight(wait_timeout_seconds=10)
+        calls = []
+
+        async def run_reads():
+            release = asyncio.Event()
+
+            def read(key: int):
+                async def call():
+                    calls.append(key)
+                    await release.wait()
+                    if key == 3:
+                        raise ValueError(key)
+                    return {"key": key}
+                return single_flight.run(key, call, name="read")
+
+            reads = asyncio.gather(*[read(key) for key in keys], return_exceptions=True)
+            await asyncio.sleep(0)
+            release.set()
+            return await reads, await read(0)
+
+        results, later_result = asyncio.run(run_reads())
+        self.assertEqual(sorted(calls), sorted(list(set(keys)) + [0]))
+        self.assertEqual(later_result, {"key": 0})
+        for key, result in zip(keys, results):
+            if key == 3:
+                self.assertIsInstance(result, ValueError)
+            else:
+                self.assertIs(result, results[keys.index(key)])  # The same result, not a copy
+        self.assertEqual(single_flight.describe()["calls"], len(set(keys)) + 1)
+        self.assertEqual(single_flight.describe()["coalesced"], len(keys) - len(set(keys)))
+        self.assertEqual(single_flight.describe()["in_flight"], 0)
+
+    def test_reads_stop_waiting_for_slow_or_cancelled_calls(self):
+        """
+        Tests that reads make their own call once they waited for the call in flight for the timeout, or when it was
+        cancelled
+        """
+        single_flight = coalescing.SingleFlight(wait_timeout_seconds=0.01)
+
+        async def run_reads():
+            release = asyncio.Event()
+
+            async def slow_call():
+                await release.wait()
+                return "slow"
+
+            async def fast_call():
+                return "fast"
+
+            leader = asyncio.ensure_future(single_flight.run("key", slow_call))
+            await asyncio.sleep(0)
+            timed_out = await single_flight.run("key", fast_call)
+            follower = asyncio.ensure_future(single_flight.run("key", fast_call))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return timed_out, await follower, await asyncio.gather(leader, return_exceptions=True)
+
+        timed_out, after_cancel, (leader_result,) = asyncio.run(run_reads())
+        self.assertEqual((timed_out, after_cancel), ("fast", "fast"))
+        self.assertIsInstance(leader_result, asyncio.CancelledError)
+        self.assertEqual(single_flight.describe()["timed_out"], 1)
+
+    @given(title=st.sampled_from([None, ""]), orderBy=st.sampled_from(api_enums.SearchOrderByEnum),
+           show_id=st.integers(min_value=1))
+    def test_coalescing_keys_follow_writes(self, title: str, orderBy, show_id: int):
+        """
+        Tests that reads with equivalent parameters have the same key until the caches are invalidated by a write, and
+        that writes, ORM reads and reads of the current row are never coalesced
+        """
+        def search_key(**filters):
+            return database_interface.coalescing_key("search_netflix_show_rows",
+                                                     filter_args=database_models.NetflixShowSearchModel(**filters),
+                                                     orderBy=orderBy, limit=10)
+
+        key = search_key(title=title)
+        self.assertEqual(key, search_key())
+        self.assertNotEqual(key, search_key(title="x"))
+        database_interface.invalidate_netflix_caches(show_ids=[show_id])
+        self.assertNotEqual(key, search_key())
+        self.assertIsNotNone(database_interface.coalescing_key("get_netflix_show_model", show_id=show_id))
+        self.assertIsNone(database_interface.coalescing_key("get_netflix_show_model", show_id=show_id,
+                                                            use_cache=False))
+        self.assertIsNone(database_interface.coalescing_key("get_netflix_show", show_id=show_id))
+        self.assertIsNone(database_interface.coalescing_key("delete_netflix_show", show_id=show_id))
+
+
+class TestAdmissionControl(unittest.TestCase):
+    """
+    Tests the rate limits, the concurrency cap and the middleware shedding requests, with a fake clock
+    """
+
+    @settings(deadline=None)
+    @given(requests=st.lists(st.tuples(st.floats(min_value=0, max_value=2), st.sampled_from(sorted(admission.ROUTE_COSTS))),
+                             min_size=1, max_size=50),
+           per_second=st.floats(min_value=0.5, max_value=20), burst=st.integers(min_value=1, max_value=10),
+           shared=st.booleans())
+    def test_token_buckets_limit_requests(self, requests, per_second: float, burst: int, shared: bool):
+        """
+        Tests that the tokens taken by a key never exceed its burst plus the tokens added since its first request, and
+        that rejected requests are admitted once they waited for the returned number of seconds
+        """
+        store = admission.SharedMemoryRateLimitStore(slots=8) if shared else admission.InMemoryRateLimitStore()
+        now = 1000.0
+        rate_limiter = admission.RateLimiter(per_second, burst, store, clock=lambda: now)
+        taken = 0
+        for delay, (method, path) in requests:
+            now += delay
+            cost = admission.request_cost(method, path)
+            amount = min(admission.EXPENSIVE_REQUEST_TOKENS if cost == admission.EXPENSIVE else 1, burst)
+            wait_seconds = rate_limiter.take("token:a", cost)
+            if wait_seconds > 0:
+                now += wait_seconds + 1e-6
+                self.assertEqual(rate_limiter.take("token:a", cost), 0)
+            taken += amount
+            self.assertLessEqual(taken, burst + (now - 1000.0) * per_second + 1e-6)
+
+    def test_shared_memory_buckets_are_shared_by_forked_processes(self):
+        """
+        Tests that the tokens taken by a forked process (eg. a gunicorn worker) are taken from the same bucket
+        """
+        store = admission.SharedMemoryRateLimitStore(slots=8)
+        pid = os.fork()
+        if pid == 0:
+            store.take("token:a", rate=0.001, burst=3, amount=3, now=time.monotonic())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertGreater(store.take("token:a", rate=0.001, burst=3, amount=1, now=time.monotonic()), 0)
+
+    @given(like_filters=st.sets(st.sampled_from(sorted(admission.LIKE_FILTERS))),
+           other_filters=st.sets(st.sampled_from(["director_name", "genre", "release_year_gte", "limit", "cursor"])))
+    def test_search_cost(self, like_filters, other_filters):
+        """
+        Tests that searches are expensive with several LIKE filters, a full-text query or facets, and that exact-match
+        and range filters don't count as LIKE filters
+        """
+        query_string = "&".join(f"{name}=1" for name in sorted(like_filters | other_filters)).encode()
+        expected = admission.EXPENSIVE if len(like_filters) >= admission.EXPENSIVE_LIKE_FILTERS else admission.CHEAP
+        self.assertEqual(admission.request_cost("GET", "/shows", query_string), expected)
+        self.assertEqual(admission.request_cost("GET", "/shows", query_string + b"&q=a"), admission.EXPENSIVE)
+        self.assertEqual(admission.request_cost("GET", "/shows", query_string + b"&facets=type"), admission.EXPENSIVE)
+        self.assertEqual(admission.request_cost("GET", "/show/{show_id}", query_string), admission.CHEAP)
+        self.assertIsNone(admission.request_cost("GET", "/metrics", query_string))
+
+    def test_concurrency_limiter_prefers_cheap_requests_and_sheds(self):
+        """
+        Tests that expensive requests only take their share of the slots, that waiting cheap requests are admitted
+        first, and that requests are rejected once the queue is full or they waited for the timeout
+        """
+        limiter = admission.ConcurrencyLimiter(max_concurrency=2, queue_timeout_seconds=0.05, max_queued=2)
+
+        async def run_requests():
+            first_expensive = await limiter.acquire(admission.EXPENSIVE)
+            waiting_expensive = asyncio.ensure_future(limiter.acquire(admission.EXPENSIVE))  # Over its share
+            first_cheap = await limiter.acquire(admission.CHEAP)
+            waiting_cheap = asyncio.ensure_future(limiter.acquire(admission.CHEAP))  # Over the cap
+            await asyncio.sleep(0)
+            rejected_cheap = await limiter.acquire(admission.CHEAP)  # The queue is full
+            limiter.release(admission.EXPENSIVE)
+            return first_expensive, first_cheap, rejected_cheap, await waiting_cheap, await waiting_expensive
+
+        outcomes = asyncio.run(run_requests())
+        self.assertEqual(outcomes, (admission.ADMITTED, admission.ADMITTED, None, admission.QUEUED, None))
+        self.assertEqual(limiter.in_flight, {admission.CHEAP: 2, admission.EXPENSIVE: 0})
+        self.assertEqual(limiter.queued(), 0)
+
+    @staticmethod
+    def admission_app(controller: admission.AdmissionController, calls: list):
+        """
+        :return: An app with a /show/{show_id} route taking a while to answer, behind the admission control
+        """
+        app = Starlette()
+
+        @app.route("/show/{show_id}")
+        async def get_show(request):
+            calls.append(request.path_params["show_id"])
+            await asyncio.sleep(0.05)
+            return JSONResponse({})
+
+        app.add_middleware(admission.AdmissionControlMiddleware, controller=controller)
+        return app
+
+    @staticmethod
+    async def request(app, show_id: int, token: str, client=None):
+        """
+        :return: (tuple) The status code and Retry-After header of the response to a request for a show
+        """
+        scope = {"type": "http", "method": "GET", "path": f"/show/{show_id}", "raw_path": b"", "root_path": "",
+                 "query_string": b"", "headers": [(b"authorization", f"Bearer {token}".encode())], "client": client,
+                 "scheme": "http", "server": None, "http_version": "1.1"}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+        await app(scope, receive, send)
+        return messages[0]["status"], dict(messages[0]["headers"]).get(b"retry-after")
+
+    def test_middleware_sheds_requests_with_retry_after(self):
+        """
+        Tests that requests over the rate limit of their token's subject (shared by all of its tokens) are answered 429,
+        and requests which found no slot 503, with a Retry-After header, without reaching the endpoint
+        """
+        signing_keys, secret_key, active_kid = dict(auth.SIGNING_KEYS), auth.SECRET_KEY, auth.ACTIVE_KID
+        try:
+            auth.configure_signing_keys({"test": "secret"})
+            first_a, second_a = (auth.create_access_token({"sub": "a"}, timedelta(minutes=minutes)).token
+                                 for minutes in (5, 6))
+            token_b = auth.create_access_token({"sub": "b"}).token
+            calls = []
+            controller = admission.AdmissionController(
+                admission.RateLimiter(1, 2, admission.InMemoryRateLimitStore(), clock=lambda: 1000.0),
+                admission.ConcurrencyLimiter(max_concurrency=1, queue_timeout_seconds=0.01, max_queued=1,
+                                             min_retry_after_seconds=5))
+            app = self.admission_app(controller, calls)
+
+            async def run_requests():
+                return await asyncio.gather(self.request(app, 1, first_a), self.request(app, 2, token_b),
+                                            self.request(app, 3, second_a), self.request(app, 4, first_a))
+
+            responses = asyncio.run(run_requests())
+        finally:
+            auth.configure_signing_keys(signing_keys, active_kid, secret_key)
+        self.assertEqual(responses, [(200, None), (503, b"5"), (503, b"5"), (429, b"1")])
+        self.assertEqual(calls, ["1"])
+        self.assertEqual(controller.describe()["outcomes"][admission.RATE_LIMITED][admission.CHEAP], 1)
+        self.assertEqual(controller.describe()["outcomes"][admission.OVERLOADED][admission.CHEAP], 2)
+
+    @given(hold_seconds=st.lists(st.floats(0.1, 60), min_size=1, max_size=20), max_concurrency=st.integers(1, 8),
+           in_flight=st.integers(0, 8), min_retry_after_seconds=st.floats(0, 30))
+    def test_retry_after_follows_slot_turnover(self, hold_seconds: List[float], max_concurrency: int, in_flight: int,
+                                               min_retry_after_seconds: float):
+        """
+        Tests that rejected requests are told to retry once the slots should have served the requests in flight, going
+        by how long they were held, and never sooner than the configured floor nor the queue timeout
+        """
+        limiter = admission.ConcurrencyLimiter(max_concurrency, queue_timeout_seconds=1,
+                                               min_retry_after_seconds=min_retry_after_seconds)
+        self.assertEqual(limiter.retry_after_seconds(), max(1, min_retry_after_seconds))
+        for seconds in hold_seconds:
+            limiter.in_flight[admission.CHEAP] += 1
+            limiter.release(admission.CHEAP, seconds)
+        self.assertGreaterEqual(limiter.mean_hold_seconds, min(hold_seconds) - 1e-9)
+        self.assertLessEqual(limiter.mean_hold_seconds, max(hold_seconds) + 1e-9)
+        limiter.in_flight[admission.CHEAP] = in_flight
+        self.assertAlmostEqual(limiter.retry_after_seconds(),
+                               max(1, min_retry_after_seconds, limiter.mean_hold_seconds * in_flight / max_concurrency))
+
+    @settings(deadline=None, max_examples=20)
+    @given(tokens=st.lists(st.uuids().map(str), min_size=3, max_size=6, unique=True))
+    def test_rotating_invalid_tokens_are_rate_limited(self, tokens: List[str]):
+        """
+        Tests that requests with invalid tokens share the bucket of their client's address, however many different
+        tokens they send, and don't take a slot, as they're answered 401 before using the database
+        """
+        calls = []
+        controller = admission.AdmissionController(
+            admission.RateLimiter(1, 2, admission.InMemoryRateLimitStore(), clock=lambda: 1000.0),
+            admission.ConcurrencyLimiter(max_concurrency=1, queue_timeout_seconds=0.01, max_queued=0))
+        app = self.admission_app(controller, calls)
+
+        async def run_requests():
+            return await asyncio.gather(*[self.request(app, show_id, token, client=("10.0.0.1", 1000 + show_id))
+                                          for show_id, token in enumerate(tokens)],
+                                        self.request(app, 99, tokens[0], client=("10.0.0.2", 1000)))
+
+        statuses = [status_code for status_code, _ in asyncio.run(run_requests())]
+        self.assertEqual(statuses, [200, 200] + [429] * (len(tokens) - 2) + [200])
+        self.assertEqual(sorted(calls), ["0", "1", "99"])
@@ -2,7 +2,9 @@ import json
 import multiprocessing
 import os
 
-preload_app = True  # Necessary for Google Cloud Run
+from utils import get_admission_settings, get_database_pool_settings, get_metrics_multiproc_dir
+
+preload_app = True  # Necessary for Google Cloud Run, and to share the rate limits' memory with the workers
 
 workers_per_core_str = os.getenv("WORKERS_PER_CORE", "1")
 max_workers_str = os.getenv("MAX_WORKERS")
@@ -49,6 +51,33 @@ graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
 
+# Every worker has its own database connection pool, unless an external pooler (eg. PgBouncer) is used
+database_pool_settings = get_database_pool_settings()
+if database_pool_settings["external_pooler"]:
+    max_database_connections = None
+else:
+    max_database_connections = workers * (database_pool_settings["pool_size"] + database_pool_settings["max_overflow"])
+
+# Requests using the database beyond this are shed with 503 after a short wait, rather than queued until `timeout`
+admission_settings = get_admission_settings()
+max_admitted_requests = workers * admission_settings["max_concurrency"] or None
+
+# Workers write snapshots of their metrics to this directory, so that /metrics adds up the metrics of every worker
+metrics_multiproc_dir = get_metrics_multiproc_dir()
+
+
+def on_starting(server):
+    if metrics_multiproc_dir:
+        from fast_api_challenge import metrics
+        os.makedirs(metrics_multiproc_dir, exist_ok=True)
+        metrics.registry.clear_multiprocess_directory()  # Left by a previous run
+
+
+def child_exit(server, worker):
+    if metrics_multiproc_dir:
+        from fast_api_challenge import metrics
+        metrics.registry.mark_process_dead(worker.pid)  # Keep its counts, but no longer its requests in flight
+
 
 # For debugging and testing
 log_data = {
@@ -65,5 +94,10 @@ log_data = {
     "use_max_workers": use_max_workers,
     "host": host,
     "port": port,
+    "database_pool_settings": database_pool_settings,
+    "max_database_connections": max_database_connections,
+    "admission_settings": admission_settings,
+    "max_admitted_requests": max_admitted_requests,
+    "metrics_multiproc_dir": metrics_multiproc_dir,
 }
 print(json.dumps(log_data))
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+import sys
+
+os.environ.setdefault("DB_SCHEMA_STARTUP", "skip")  # Generating the schema doesn't need a database
+os.environ.setdefault("sqlalchemy_database_url", "sqlite://")
+
+from fast_api_challenge import startup
+from fast_api_challenge.index import app
+
+"""
+Write the Api's OpenAPI schema to a file, so that it can be loaded when the Api starts (by setting OPENAPI_SCHEMA_FILE)
+instead of being generated. Run when the image is built, eg. python write_openapi_schema.py /app/openapi.json
+"""
+
+if __name__ == "__main__":
+    startup.write_openapi_schema(app, sys.argv[1] if len(sys.argv) > 1 else "openapi.json")